@@ -0,0 +1,45 @@
+"""Autosave of a note with many links, the node fetch with and without the linked nodes.
+
+    python -m benchmarks.bench_autosave
+
+update_md used to fetch the note with all its linked nodes and deepcopy it, now it fetches the note only.
+"""
+import asyncio
+import copy
+
+from retk import const, core
+from .utils import local_env, timeit, report
+
+LINKS = 200
+SAVES = 30
+
+
+async def main():
+    async with local_env() as au:
+        mds = [f"target {i}\n\n" + f"body of the linked note {i}. " * 20 for i in range(LINKS)]
+        targets, _ = await core.node.post_batch(au=au, mds=mds)
+        links = "\n".join(f"[@{n['title']}](/n/{n['id']})" for n in targets)
+        hub, _ = await core.node.post(au=au, md=f"hub\n{links}", type_=const.NodeTypeEnum.MARKDOWN.value)
+        print(f"a note with {len(hub['toNodeIds'])} links, {SAVES} autosaves")
+
+        async def old_fetch():
+            n, _ = await core.node.get(au=au, nid=hub["id"])
+            copy.deepcopy(n)
+
+        async def new_fetch():
+            await core.node.get(au=au, nid=hub["id"], with_links=False)
+
+        i = 0
+
+        async def autosave():
+            nonlocal i
+            i += 1
+            await core.node.update_md(au=au, nid=hub["id"], md=f"hub\n{links}\nedit {i}")
+
+        report("  fetch with links and deepcopy", await timeit(old_fetch, repeat=SAVES))
+        report("  fetch without links", await timeit(new_fetch, repeat=SAVES))
+        report("  update_md", await timeit(autosave, repeat=SAVES))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
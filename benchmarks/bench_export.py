@@ -0,0 +1,47 @@
+"""Export a whole account as a zip, the peak memory while it is streamed.
+
+    python -m benchmarks.bench_export
+
+The notes link to large local files, the zip is counted and dropped as it is yielded.
+"""
+import asyncio
+import os
+import time
+import tracemalloc
+from pathlib import Path
+
+from retk import config, const, core
+from .utils import local_env
+
+NOTES = 1_000
+FILES = 20
+FILE_SIZE = 20 * 1024 * 1024
+
+
+async def main():
+    async with local_env() as au:
+        files_dir = Path(config.get_settings().RETHINK_LOCAL_STORAGE_PATH) / const.settings.DOT_DATA / "files"
+        files_dir.mkdir(parents=True, exist_ok=True)
+        for i in range(FILES):
+            (files_dir / f"{i}.bin").write_bytes(os.urandom(FILE_SIZE))
+        mds = [
+            f"note {i}\n\n" + "text " * 200 + f"\n[file](/files/{i % FILES}.bin)"
+            for i in range(NOTES)
+        ]
+        for i in range(0, NOTES, const.settings.NODE_POST_BATCH_MAX_COUNT):
+            await core.node.post_batch(au=au, mds=mds[i: i + const.settings.NODE_POST_BATCH_MAX_COUNT])
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        size = 0
+        async for chunk in core.files.stream_account_zip(au=au):
+            size += len(chunk)
+        t1 = time.perf_counter()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{NOTES} notes, {FILES} files of {FILE_SIZE // 1024 // 1024} MB")
+        print(f"  zip {size / 1024 / 1024:.1f} MB in {t1 - t0:.2f} s, peak memory {peak / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
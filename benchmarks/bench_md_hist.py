@@ -0,0 +1,58 @@
+"""History storage of a large note edited many times, full md copies versus keyframes and deltas.
+
+    python -m benchmarks.bench_md_hist
+
+Each edit changes a few lines of the note, the size is of the kept versions on disk.
+"""
+import asyncio
+import random
+from pathlib import Path
+
+from retk import config, const, core
+from retk.core.node import backup
+from .utils import local_env, timeit, report
+
+NOTE_LINES = [200, 1_800]
+EDITS = 30
+
+
+def hist_size(nid: str, suffix: str) -> int:
+    d = Path(config.get_settings().RETHINK_LOCAL_STORAGE_PATH) / const.settings.DOT_DATA / "md" / "hist" / nid
+    return sum(p.stat().st_size for p in d.glob(f"*{suffix}"))
+
+
+async def main():
+    rnd = random.Random(1)
+    async with local_env() as au:
+        config.get_settings().MD_BACKUP_INTERVAL = 0
+        for n_lines in NOTE_LINES:
+            lines = [f"line {i} " + "x" * rnd.randint(10, 60) for i in range(n_lines)]
+            n, _ = await core.node.post(au=au, md="title\n" + "\n".join(lines), type_=const.NodeTypeEnum.MARKDOWN.value)
+
+            full_copies = []
+
+            async def edit():
+                for _ in range(3):
+                    lines[rnd.randrange(n_lines)] = f"edited {rnd.random()}"
+                md = "title\n" + "\n".join(lines)
+                full_copies.append(len(md.encode("utf-8")))
+                await core.node.update_md(au=au, nid=n["id"], md=md)
+
+            print(f"{n_lines} lines note ({len(n['md'].encode('utf-8'))} bytes), {EDITS} edits of 3 lines")
+            report("  update_md with history", await timeit(edit, repeat=EDITS))
+            doc, _ = await core.node.get(au=au, nid=n["id"])
+            kept = len(doc["history"])
+            print(f"  {'full md copies':<38} {sum(full_copies[-kept:]):>12} bytes")
+            print(f"  {'keyframes and deltas':<38} {hist_size(n['id'], '.mdz'):>12} bytes"
+                  f"   ({len(doc['historyKeyframes'])} keyframes in {kept} versions)")
+
+            async def read_all():
+                for version in doc["history"]:
+                    await backup.get_md(uid=au.u.id, nid=n["id"], version=version)
+
+            times = await timeit(read_all, repeat=5)
+            report("  get_md per version", [t / kept for t in times])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
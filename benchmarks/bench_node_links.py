@@ -0,0 +1,60 @@
+"""Save latency of a note versus the number of @links in it.
+
+    python -m benchmarks.bench_node_links
+
+The backlinks are maintained by one update_many per save, the per-link loop it replaced
+is measured as well for comparison.
+"""
+import asyncio
+
+from retk import const, core
+from retk.models.client import client
+from retk.models.tps import AuthedUser
+from .utils import local_env, timeit, report
+
+LINK_COUNTS = [1, 10, 50, 100, 200]
+
+
+async def per_link_backlinks(nid: str, to_nids: list):
+    # one find and one full list $set per link, as before
+    for to_nid in to_nids:
+        doc = await client.coll.nodes.find_one({"id": to_nid})
+        if nid not in doc["fromNodeIds"]:
+            doc["fromNodeIds"].append(nid)
+            await client.coll.nodes.update_one({"id": to_nid}, {"$set": {"fromNodeIds": doc["fromNodeIds"]}})
+    for to_nid in to_nids:
+        doc = await client.coll.nodes.find_one({"id": to_nid})
+        doc["fromNodeIds"].remove(nid)
+        await client.coll.nodes.update_one({"id": to_nid}, {"$set": {"fromNodeIds": doc["fromNodeIds"]}})
+
+
+async def bench(au: AuthedUser):
+    targets = []
+    for i in range(max(LINK_COUNTS)):
+        n, _ = await core.node.post(au=au, md=f"target{i}\nbody", type_=const.NodeTypeEnum.MARKDOWN.value)
+        targets.append(n)
+    hub, _ = await core.node.post(au=au, md="hub", type_=const.NodeTypeEnum.MARKDOWN.value)
+
+    for count in LINK_COUNTS:
+        linked = targets[:count]
+        links = "\n".join(f"[@{n['title']}](/n/{n['id']})" for n in linked)
+
+        async def save():
+            # link all, then unlink all, both directions of the backlink update
+            await core.node.update_md(au=au, nid=hub["id"], md=f"hub\n{links}")
+            await core.node.update_md(au=au, nid=hub["id"], md="hub")
+
+        report(f"update_md link+unlink {count:>4} links", await timeit(save))
+        report(
+            f"per-link backlinks     {count:>4} links",
+            await timeit(lambda: per_link_backlinks(hub["id"], [n["id"] for n in linked])),
+        )
+
+
+async def main():
+    async with local_env() as au:
+        await bench(au)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,38 @@
+"""Import notes one post per note versus post_batch.
+
+    python -m benchmarks.bench_post_batch
+
+The search engine is the local Whoosh index here, it commits once per add and once per add_batch.
+"""
+import asyncio
+
+from retk import const, core
+from retk.models.client import client
+from retk.models.search_engine.engine_local import LocalSearcher
+from .utils import local_env, timeit, report
+
+NOTE_COUNTS = [100, 2_000]
+
+
+async def main():
+    async with local_env() as au:
+        client.search = LocalSearcher()
+        await client.search.init()
+        for count in NOTE_COUNTS:
+            mds = [f"note {i}\n\n" + f"body of the imported note {i}. " * 20 for i in range(count)]
+
+            async def one_by_one():
+                for md in mds:
+                    await core.node.post(au=au, md=md, type_=const.NodeTypeEnum.MARKDOWN.value)
+
+            async def batch():
+                batch_size = const.settings.NODE_POST_BATCH_MAX_COUNT
+                for i in range(0, len(mds), batch_size):
+                    await core.node.post_batch(au=au, mds=mds[i: i + batch_size])
+
+            report(f"post      {count:>5} notes", await timeit(one_by_one, repeat=1))
+            report(f"post_batch {count:>5} notes", await timeit(batch, repeat=1))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+"""Markdown to title/body/snippet, the rendering md2txt versus the line scanning fast_md2txt.
+
+    python -m benchmarks.bench_preprocess_md
+
+The samples are the markdown files in this repo and the default notes of a new user,
+and all of them joined and repeated to the max note length.
+"""
+import asyncio
+from pathlib import Path
+
+from retk import const, utils
+from .utils import timeit, report
+
+ROOT = Path(__file__).parent.parent
+
+
+def md2txt_preprocess_md(md: str, snippet_len: int = 200):
+    # preprocess_md before the fast path
+    title, body = utils.split_title_body(fulltext=md)
+    title = utils.md2txt(title.strip())
+    body = utils.md2txt(body.strip())
+    snippet = utils.strip_html_tags(body)[:snippet_len]
+    return title, body, snippet
+
+
+def samples():
+    mds = {
+        p.relative_to(ROOT).as_posix(): p.read_text(encoding="utf-8")
+        for p in [
+            ROOT / "README.md",
+            ROOT / "README_ZH.md",
+            *sorted((ROOT / "src" / "retk" / "core" / "ai" / "llm" / "knowledge").glob("*.md")),
+        ]
+    }
+    for language, nodes in const.NEW_USER_DEFAULT_NODES.items():
+        for i, md in enumerate(nodes):
+            mds[f"default node {language}/{i}"] = md
+    joined = "\n\n".join(mds.values())
+    mds["max length note"] = (joined * (const.settings.MD_MAX_LENGTH // len(joined) + 1))[:const.settings.MD_MAX_LENGTH]
+    return mds
+
+
+async def main():
+    for name, md in samples().items():
+        print(f"{name} ({len(md)} chars)")
+
+        async def old():
+            md2txt_preprocess_md(md)
+
+        async def new():
+            utils.preprocess_md(md)
+
+        report("  md2txt", await timeit(old, repeat=10))
+        report("  fast_md2txt", await timeit(new, repeat=10))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
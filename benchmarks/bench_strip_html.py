@@ -0,0 +1,44 @@
+"""Strip the html of the search docs of a restore, a new parser per call versus the fast path.
+
+    python -m benchmarks.bench_strip_html
+"""
+import asyncio
+
+from retk import const, utils
+from retk.utils.md import HTMLStripper
+from .utils import timeit, report
+
+DOC_COUNT = 100_000
+
+
+def parser_per_call(html: str) -> str:
+    # strip_html_tags before the fast path
+    s = HTMLStripper()
+    s.feed(html[:1000])
+    return s.get_data()
+
+
+async def main():
+    mds = [md for nodes in const.NEW_USER_DEFAULT_NODES.values() for md in nodes]
+    htmls = [f"{mds[i % len(mds)]}\n<b>{i}</b> &amp; <a href='/n/{i}'>link</a>" for i in range(DOC_COUNT)]
+    plain = [mds[i % len(mds)] for i in range(DOC_COUNT)]
+
+    for name, texts in [("markdown", plain), ("with html", htmls)]:
+        print(f"{DOC_COUNT} docs, {name}")
+
+        async def old():
+            [parser_per_call(t) for t in texts]
+
+        async def new():
+            [utils.strip_html_tags(t) for t in texts]
+
+        async def batch():
+            await utils.strip_html_tags_batch(texts)
+
+        report("  parser per call", await timeit(old, repeat=3))
+        report("  strip_html_tags", await timeit(new, repeat=3))
+        report("  strip_html_tags_batch", await timeit(batch, repeat=3))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
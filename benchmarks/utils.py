@@ -0,0 +1,54 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Awaitable, List
+
+from retk import config, const
+from retk.models.search_engine.engine_memory import MemorySearcher
+from retk.models.tps import AuthedUser, convert_user_dict_to_authed_user
+
+
+@asynccontextmanager
+async def local_env() -> AsyncIterator[AuthedUser]:
+    """A throwaway local storage, searched by MemorySearcher so the search engine is not measured."""
+    tmp = tempfile.mkdtemp(prefix="retk-bench-")
+    os.environ["RETHINK_LOCAL_STORAGE_PATH"] = tmp
+    os.environ.setdefault("DB_NAME", "rethink_bench")
+    os.environ["ONE_USER"] = "true"
+    config.get_settings.cache_clear()
+
+    from retk.models.client import client
+    from retk import core
+    await client.init()
+    client.search = MemorySearcher()
+    await client.search.init()
+    u, _ = await core.user.get_by_email(email=const.DEFAULT_USER["email"])
+    try:
+        yield AuthedUser(
+            u=convert_user_dict_to_authed_user(u),
+            request_id="bench",
+            language=u["settings"]["language"],
+        )
+    finally:
+        await client.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.environ.pop("RETHINK_LOCAL_STORAGE_PATH")
+        os.environ.pop("ONE_USER")
+        config.get_settings.cache_clear()
+
+
+async def timeit(fn: Callable[[], Awaitable], repeat: int = 5) -> List[float]:
+    """Seconds of each run."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def report(name: str, times: List[float]):
+    print(f"{name:<40} median {statistics.median(times) * 1000:9.2f} ms   min {min(times) * 1000:9.2f} ms")
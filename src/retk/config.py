@@ -34,6 +34,10 @@ class Settings(BaseSettings):
     ES_PASSWORD: str = Field(env='ES_PASSWORD', default="")
     ES_HOSTS: str = Field(env='ES_HOSTS', default="")
     ES_INDEX_ALIAS: str = Field(env='ES_INDEX_ALIAS', default="")
+    ES_NUMBER_OF_SHARDS: int = Field(env='ES_NUMBER_OF_SHARDS', default=1)
+    ES_BULK_MAX_ACTIONS: int = Field(env='ES_BULK_MAX_ACTIONS', default=200)
+    ES_BULK_FLUSH_INTERVAL: float = Field(env='ES_BULK_FLUSH_INTERVAL', default=1.)  # seconds
+    ES_BULK_FLUSH_MAX_BACKOFF: float = Field(env='ES_BULK_FLUSH_MAX_BACKOFF', default=60.)  # seconds
 
     # database settings: COS
     COS_SECRET_ID: str = Field(env='COS_SECRET_ID', default="")
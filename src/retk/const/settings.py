@@ -9,11 +9,18 @@ LOCAL_FILE_URL_PRE_DIR = "files"
 ANALYTICS_DIR = Path(os.path.join(os.getcwd(), "analytics"))
 MAX_USER_BEHAVIOR_LOG_SIZE = 1024 * 1024 * 10  # 10MB
 MD_MAX_LENGTH = 100_000
+# a longer md is preprocessed in a worker thread
+PREPROCESS_MD_IN_POOL_MIN_LENGTH = 20_000
+STRIP_HTML_BATCH_CHUNK_SIZE = 5000
+MAX_HTML_STRIPPERS = 16
+TEXT_POOL_SIZE = 2
 REQUEST_ID_MAX_LENGTH = 50
 UID_MAX_LENGTH = 30
 NID_MAX_LENGTH = 30
 FID_MAX_LENGTH = 30
 SEARCH_QUERY_MAX_LENGTH = 200
+SEARCH_CURSOR_MAX_LENGTH = 2000
+PAGE_CURSOR_MAX_LENGTH = 200
 RECOMMEND_CONTENT_MAX_LENGTH = 100
 EMAIL_MAX_LENGTH = 100
 PASSWORD_MAX_LENGTH = 20
@@ -21,12 +28,43 @@ NICKNAME_MAX_LENGTH = 20
 IMG_RESIZE_THRESHOLD = 1024 * 1024 * 3  # 3MB
 MAX_UPLOAD_FILE_SIZE = 1024 * 1024 * 50  # 50MB
 PLUGIN_ID_MAX_LENGTH = 40
+NODE_POST_BATCH_MAX_COUNT = 200
 MAX_MD_BACKUP_VERSIONS = 10
+MD_HIST_KEYFRAME_INTERVAL = 5  # a full md every n versions, deltas between
+COS_MAX_CONNECTIONS = 50
+COS_MAX_KEEPALIVE_CONNECTIONS = 20
+COS_TIMEOUT = 10  # seconds
+LLM_HTTP_MAX_CONNECTIONS = 100
+LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+LLM_HTTP_TIMEOUT = 60  # seconds
+LLM_DEFAULT_CONCURRENCY = 10
+LLM_CHARS_PER_TOKEN = 1.5  # to estimate the prompt tokens before the usage is reported
+LLM_PIPELINE_BATCH_SIZE = 5  # cases sent together by a worker of summary_extend_pipeline
+WEB_HTTP_MAX_CONNECTIONS = 50
+WEB_HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+WEB_HTTP_TIMEOUT = 5  # seconds
+HTTP_KEEPALIVE_EXPIRY = 30  # seconds, an idle connection is closed after it
 SEARCH_LIMIT_MAX = 100
 MAX_STATISTIC_REMARK_LENGTH = 1000
 MAX_SYSTEM_NOTICE_TITLE_LENGTH = 100
 MAX_SYSTEM_NOTICE_CONTENT_LENGTH = 5000
 MAX_SCHEDULE_JOB_INFO_LEN = 1000
+LINK_TITLE_BATCH_SIZE = 100
+MAX_LINK_TITLE_PROGRESS_LEN = 1000
+MAX_LINK_GRAPHS = 200
+LINK_GRAPH_TTL = 60 * 10  # seconds
+NODE_OUTBOX_BATCH_SIZE = 20
+NODE_OUTBOX_POLL_INTERVAL = 1  # seconds
+NODE_OUTBOX_LEASE = 60  # seconds, a job of a crashed worker is run again after it
+NODE_OUTBOX_MAX_ATTEMPTS = 8
+NODE_OUTBOX_RETRY_DELAY = 2  # seconds, doubled on each attempt
+EXPORT_NODES_BATCH_SIZE = 100
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_FILE_CONCURRENCY = 4  # files downloaded at the same time
+EXPORT_PREFETCH_CHUNKS = 4  # chunks of a file held before they are zipped
+TRASH_CLEAN_BATCH_SIZE = 200
+LLM_CACHE_TTL = 60 * 60 * 24 * 30  # seconds
+LLM_CACHE_MAX_SIZE = 10_000  # cached responses, 0 to disable the cache
 
 COOKIE_ACCESS_TOKEN = "rethinkAccessToken"
 COOKIE_REFRESH_TOKEN = "rethinkRefreshToken"
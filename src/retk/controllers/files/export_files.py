@@ -0,0 +1,26 @@
+import datetime
+
+from fastapi.responses import StreamingResponse
+
+from retk import const, core
+from retk.controllers.utils import AuthedUser
+
+
+async def stream_account_export(
+        au: AuthedUser,
+        with_history: bool,
+) -> StreamingResponse:
+    await core.statistic.add_user_behavior(
+        uid=au.u.id,
+        type_=const.UserBehaviorTypeEnum.NODE_DATA_EXPORT,
+        remark=f"account_history={with_history}",
+    )
+    filename = f"rethink-{datetime.datetime.now().strftime('%Y%m%d')}.zip"
+    return StreamingResponse(
+        content=core.files.stream_account_zip(au=au, with_history=with_history),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Request-Id": au.request_id,
+        },
+    )
@@ -2,8 +2,9 @@ import httpx
 
 from retk import const, config
 from retk.controllers import schemas
-from retk.controllers.utils import maybe_raise_json_exception, json_exception
-from retk.core import account, user, notice, analysis
+from retk.controllers.utils import maybe_raise_json_exception, json_exception, maybe_raise_invalid_page_cursor
+from retk.core import account, user, notice, analysis, node
+from retk.core.ai.llm import knowledge
 from retk.models.tps import AuthedUser
 from retk.utils import datetime2str
 
@@ -109,6 +110,42 @@ async def get_manager_data(
     )
 
 
+async def get_node_outbox(
+        au: AuthedUser,
+) -> schemas.manager.GetNodeOutboxResponse:
+    stats = await node.outbox.stats()
+    return schemas.manager.GetNodeOutboxResponse(
+        requestId=au.request_id,
+        data=schemas.manager.GetNodeOutboxResponse.Data(
+            pending=stats["pending"],
+            failed=stats["failed"],
+            lagSeconds=stats["lagSeconds"],
+            processed=stats["processed"],
+            retried=stats["retried"],
+        )
+    )
+
+
+async def get_search_reindex(
+        au: AuthedUser,
+) -> schemas.manager.GetSearchReindexResponse:
+    progress = node.search.reindex_progress()
+    return schemas.manager.GetSearchReindexResponse(
+        requestId=au.request_id,
+        data=None if progress is None else schemas.manager.GetSearchReindexResponse.Data(**progress),
+    )
+
+
+async def get_llm_cache(
+        au: AuthedUser,
+) -> schemas.manager.GetLLMCacheResponse:
+    stats = await knowledge.cache.stats()
+    return schemas.manager.GetLLMCacheResponse(
+        requestId=au.request_id,
+        data=schemas.manager.GetLLMCacheResponse.Data(**stats),
+    )
+
+
 async def get_user_info(
         au: AuthedUser,
         req: schemas.manager.GetUserRequest,
@@ -243,10 +280,15 @@ async def get_system_notices(
         au: AuthedUser,
         page: int,
         limit: int,
+        cursor: str = "",
+        with_total: bool = True,
 ) -> schemas.manager.GetSystemNoticesResponse:
-    notices, total = await notice.get_system_notices(
+    maybe_raise_invalid_page_cursor(au=au, cursor=cursor, sort=notice.SYSTEM_NOTICES_SORT)
+    notices, total, next_cursor = await notice.get_system_notices(
         page=page,
         limit=limit,
+        cursor=cursor,
+        with_total=with_total,
     )
     for n in notices:
         n["id"] = str(n["_id"])
@@ -255,4 +297,5 @@ async def get_system_notices(
         requestId=au.request_id,
         notices=notices,
         total=total,
+        nextCursor=next_cursor,
     )
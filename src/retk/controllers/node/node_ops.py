@@ -1,10 +1,15 @@
-from typing import List, Literal
+from typing import List, Literal, Optional, Union
 
+from fastapi import Response
 from fastapi.responses import StreamingResponse
 
 from retk import const, core
 from retk.controllers import schemas
-from retk.controllers.utils import maybe_raise_json_exception, json_exception
+from retk.controllers.utils import (
+    maybe_raise_json_exception, json_exception, maybe_raise_invalid_page_cursor,
+    is_etag_matched, not_modified_response, set_etag,
+)
+from retk.models import db_ops
 from retk.models.tps import AuthedUser, Node
 from retk.utils import contain_only_http_link, get_title_description_from_link, datetime2str
 
@@ -69,6 +74,27 @@ async def post_node(
     )
 
 
+async def post_batch_nodes(
+        au: AuthedUser,
+        req: schemas.node.BatchCreateRequest,
+) -> schemas.node.NodesResponse:
+    nodes, code = await core.node.post_batch(
+        au=au,
+        mds=req.mds,
+        type_=req.type,
+    )
+    maybe_raise_json_exception(au=au, code=code)
+    await core.statistic.add_user_behavior(
+        uid=au.u.id,
+        type_=const.UserBehaviorTypeEnum.NODE_CREATE,
+        remark="",
+    )
+    return schemas.node.NodesResponse(
+        requestId=au.request_id,
+        nodes=[get_node_data(n) for n in nodes],
+    )
+
+
 async def post_quick_node(
         au: AuthedUser,
         req: schemas.node.CreateRequest,
@@ -99,9 +125,18 @@ async def post_quick_node(
 async def get_node(
         au: AuthedUser,
         nid: str,
-) -> schemas.node.NodeResponse:
+        if_none_match: Optional[str] = None,
+        response: Optional[Response] = None,
+) -> Union[schemas.node.NodeResponse, Response]:
+    etag, code = await core.node.get_etag(au=au, nid=nid)
+    maybe_raise_json_exception(au=au, code=code)
+    if is_etag_matched(if_none_match=if_none_match, etag=etag):
+        return not_modified_response(etag=etag)
+
     n, code = await core.node.get(au=au, nid=nid)
     maybe_raise_json_exception(au=au, code=code)
+    if response is not None:
+        set_etag(response=response, etag=etag)
 
     await core.statistic.add_user_behavior(
         uid=au.u.id,
@@ -136,19 +171,28 @@ async def get_core_nodes(
         au: AuthedUser,
         p: int,
         limit: int,
+        cursor: str = "",
+        with_total: bool = True,
 ) -> schemas.node.NodesSearchResponse:
-    nodes, total = await core.node.core_nodes(
+    maybe_raise_invalid_page_cursor(au=au, cursor=cursor, sort=db_ops.CORE_NODES_SORT)
+    nodes, total, next_cursor = await core.node.core_nodes(
         au=au,
         page=p,
         limit=limit,
+        cursor=cursor,
+        with_total=with_total,
     )
     return schemas.node.NodesSearchResponse(
         requestId=au.request_id,
-        data=_get_node_search_response_data(nodes=nodes, total=total),
+        data=_get_node_search_response_data(nodes=nodes, total=total, next_cursor=next_cursor),
     )
 
 
-def _get_node_search_response_data(nodes: List[Node], total: int) -> schemas.node.NodesSearchResponse.Data:
+def _get_node_search_response_data(
+        nodes: List[Node],
+        total: int,
+        next_cursor: str = "",
+) -> schemas.node.NodesSearchResponse.Data:
     return schemas.node.NodesSearchResponse.Data(
         nodes=[
             schemas.node.NodesSearchResponse.Data.Node(
@@ -164,6 +208,7 @@ def _get_node_search_response_data(nodes: List[Node], total: int) -> schemas.nod
                 favorite=n.get("favorite", False)
             ) for n in nodes],
         total=total,
+        nextCursor=next_cursor,
     )
 
 
@@ -183,6 +228,24 @@ async def get_hist_editions(
     )
 
 
+async def get_link_title_progress(
+        au: AuthedUser,
+        nid: str,
+) -> schemas.node.LinkTitleProgressResponse:
+    progress, code = await core.node.get_link_title_progress(au=au, nid=nid)
+    maybe_raise_json_exception(au=au, code=code)
+    return schemas.node.LinkTitleProgressResponse(
+        requestId=au.request_id,
+        progress=None if progress is None else schemas.node.LinkTitleProgressResponse.Progress(
+            title=progress.title,
+            total=progress.total,
+            done=progress.done,
+            running=progress.running,
+            code=progress.code.value,
+        ),
+    )
+
+
 async def get_hist_edition_md(
         au: AuthedUser,
         nid: str,
@@ -227,11 +290,16 @@ async def get_favorite_nodes(
         au: AuthedUser,
         p: int,
         limit: int,
+        cursor: str = "",
+        with_total: bool = True,
 ) -> schemas.node.NodesSearchResponse:
-    nodes, total = await core.node.get_favorite(
+    maybe_raise_invalid_page_cursor(au=au, cursor=cursor, sort=db_ops.FAVORITE_NODES_SORT)
+    nodes, total, next_cursor = await core.node.get_favorite(
         au=au,
         page=p,
         limit=limit,
+        cursor=cursor,
+        with_total=with_total,
     )
     await core.statistic.add_user_behavior(
         uid=au.u.id,
@@ -240,7 +308,7 @@ async def get_favorite_nodes(
     )
     return schemas.node.NodesSearchResponse(
         requestId=au.request_id,
-        data=_get_node_search_response_data(nodes=nodes, total=total),
+        data=_get_node_search_response_data(nodes=nodes, total=total, next_cursor=next_cursor),
     )
 
 
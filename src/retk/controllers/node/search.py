@@ -2,6 +2,8 @@ from typing import Literal, Optional
 
 from retk import core, const
 from retk.controllers import schemas
+from retk.controllers.utils import json_exception
+from retk.models.search_engine import decode_cursor
 from retk.models.tps import AuthedUser
 
 
@@ -12,16 +14,34 @@ async def user_nodes(
         order: Literal["asc", "desc"],
         page: int,
         limit: int,
+        cursor: str = "",
 ) -> schemas.node.NodesSearchResponse:
-    nodes, total = await core.node.search.user_nodes(
-        au=au,
-        query=q,
-        sort_key=sort,
-        reverse=order == "desc",
-        page=page,
-        limit=limit,
-        exclude_nids=[],
-    )
+    if cursor != "" and decode_cursor(cursor) is None:
+        raise json_exception(
+            request_id=au.request_id,
+            uid=au.u.id,
+            code=const.CodeEnum.INVALID_PARAMS,
+            language=au.language,
+        )
+    try:
+        nodes, total, next_cursor = await core.node.search.user_nodes(
+            au=au,
+            query=q,
+            sort_key=sort,
+            reverse=order == "desc",
+            page=page,
+            limit=limit,
+            exclude_nids=[],
+            cursor=cursor,
+        )
+    except ValueError:
+        # the cursor does not fit the sort, e.g. it is from another sort key
+        raise json_exception(
+            request_id=au.request_id,
+            uid=au.u.id,
+            code=const.CodeEnum.INVALID_PARAMS,
+            language=au.language,
+        )
 
     if q != "":
         await core.statistic.add_user_behavior(
@@ -34,6 +54,7 @@ async def user_nodes(
         data=schemas.node.NodesSearchResponse.Data(
             nodes=nodes,
             total=total,
+            nextCursor=next_cursor,
         )
     )
 
@@ -1,7 +1,8 @@
 from retk import core, const
 from retk.controllers import schemas
 from retk.controllers.node.node_ops import _get_node_search_response_data
-from retk.controllers.utils import maybe_raise_json_exception
+from retk.controllers.utils import maybe_raise_json_exception, maybe_raise_invalid_page_cursor
+from retk.models import db_ops
 from retk.models.tps import AuthedUser
 
 
@@ -38,11 +39,16 @@ async def get_from_trash(
         au: AuthedUser,
         p: int = 0,
         limit: int = 10,
+        cursor: str = "",
+        with_total: bool = True,
 ) -> schemas.node.NodesSearchResponse:
-    nodes, total = await core.node.get_nodes_in_trash(au=au, page=p, limit=limit)
+    maybe_raise_invalid_page_cursor(au=au, cursor=cursor, sort=db_ops.TRASH_NODES_SORT)
+    nodes, total, next_cursor = await core.node.get_nodes_in_trash(
+        au=au, page=p, limit=limit, cursor=cursor, with_total=with_total,
+    )
     return schemas.node.NodesSearchResponse(
         requestId=au.request_id,
-        data=_get_node_search_response_data(nodes=nodes, total=total),
+        data=_get_node_search_response_data(nodes=nodes, total=total, next_cursor=next_cursor),
     )
 
 
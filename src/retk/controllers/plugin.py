@@ -63,7 +63,7 @@ async def __render(
 
     try:
         if nid != "":
-            n, code = await node.get(au=au, nid=nid)
+            n, code = await node.get(au=au, nid=nid, fields=["md"], with_links=False)
             maybe_raise_json_exception(au=au, code=code)
 
             html = plugin.render_editor_side(
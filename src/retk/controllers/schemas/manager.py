@@ -121,4 +121,43 @@ class GetSystemNoticesResponse(BaseModel):
     notices: List[Notice] = Field(
         description="list of notices"
     )
-    total: int = Field(description="total number of notices")
+    total: int = Field(description="total number of notices, -1 if it is not counted")
+    nextCursor: str = Field(default="", description="cursor of the next page, empty if no more")
+
+
+class GetNodeOutboxResponse(BaseModel):
+    class Data(BaseModel):
+        pending: int = Field(description="number of jobs waiting to run")
+        failed: int = Field(description="number of jobs failed too many times")
+        lagSeconds: float = Field(description="seconds since the oldest pending job was enqueued")
+        processed: int = Field(description="number of jobs done since startup")
+        retried: int = Field(description="number of retries since startup")
+
+    requestId: str = Field(max_length=settings.REQUEST_ID_MAX_LENGTH, description="request ID")
+    data: Data
+
+
+class GetSearchReindexResponse(BaseModel):
+    class Data(BaseModel):
+        index: str = Field(description="the new index the documents are copied to")
+        total: int = Field(description="number of documents to copy")
+        copied: int = Field(description="number of documents copied, including the ones written by the dual writes")
+        conflicts: int = Field(description="number of documents written by the dual writes before being copied")
+        done: bool = Field(description="the alias is switched to the new index")
+
+    requestId: str = Field(max_length=settings.REQUEST_ID_MAX_LENGTH, description="request ID")
+    data: Optional[Data] = Field(description="None if no reindex since startup", default=None)
+
+
+class GetLLMCacheResponse(BaseModel):
+    class Data(BaseModel):
+        size: int = Field(description="number of cached responses")
+        hits: int = Field(description="number of lookups answered by the cache since startup")
+        misses: int = Field(description="number of lookups sent to the llm services since startup")
+        hitRate: float = Field(description="hits / (hits + misses)")
+        stored: int = Field(description="number of responses cached since startup")
+        evicted: int = Field(description="number of expired or least recently hit responses removed since startup")
+        tokensSaved: int = Field(description="estimated tokens not sent to the llm services since startup")
+
+    requestId: str = Field(max_length=settings.REQUEST_ID_MAX_LENGTH, description="request ID")
+    data: Data
@@ -1,6 +1,7 @@
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel, NonNegativeInt, Field
+from typing_extensions import Annotated
 
 from retk.const import settings
 
@@ -42,6 +43,18 @@ class NodeResponse(BaseModel):
     node: NodeData
 
 
+class BatchCreateRequest(BaseModel):
+    mds: List[Annotated[str, Field(max_length=settings.MD_MAX_LENGTH)]] = Field(
+        min_length=1, max_length=settings.NODE_POST_BATCH_MAX_COUNT,
+    )
+    type: NonNegativeInt
+
+
+class NodesResponse(BaseModel):
+    requestId: str
+    nodes: List[NodeData]
+
+
 class PatchMdRequest(BaseModel):
     md: str = Field(max_length=settings.MD_MAX_LENGTH)
 
@@ -61,7 +74,9 @@ class NodesSearchResponse(BaseModel):
             favorite: bool
 
         nodes: List[Node]
-        total: NonNegativeInt
+        # -1 if it is not counted
+        total: int = Field(ge=-1)
+        nextCursor: str = ""
 
     requestId: str
     data: Data
@@ -76,6 +91,18 @@ class HistEditionsResponse(BaseModel):
     versions: List[str] = Field(default_factory=list)
 
 
+class LinkTitleProgressResponse(BaseModel):
+    class Progress(BaseModel):
+        title: str = Field(description="the new title written into the links")
+        total: int = Field(description="number of nodes linking to this node")
+        done: int = Field(description="number of linking nodes rewritten")
+        running: bool
+        code: int = Field(description="the error code of the rewriting, 0 if ok")
+
+    requestId: str
+    progress: Optional[Progress] = Field(default=None, description="None if the node was not renamed recently")
+
+
 class HistEditionMdResponse(BaseModel):
     requestId: str
     md: str
@@ -75,6 +75,7 @@ class NotificationResponse(BaseModel):
 
         total: int
         notices: List[Notice]
+        nextCursor: str = ""
 
     requestId: str
     hasUnread: bool
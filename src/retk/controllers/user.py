@@ -1,6 +1,8 @@
 from retk import const, core, config, regex
 from retk.controllers import schemas
-from retk.controllers.utils import maybe_raise_json_exception, get_user_info_response_from_u_dict
+from retk.controllers.utils import (
+    maybe_raise_json_exception, get_user_info_response_from_u_dict, maybe_raise_invalid_page_cursor,
+)
 from retk.core import account, notice
 from retk.core.user import reset_password
 from retk.models.tps import AuthedUser
@@ -87,8 +89,13 @@ async def get_user_notices(
         unread_only: bool,
         page: int,
         limit: int,
+        cursor: str = "",
+        with_total: bool = True,
 ) -> schemas.user.NotificationResponse:
-    nt, code = await notice.get_user_notices(au=au, unread_only=unread_only, page=page, limit=limit)
+    maybe_raise_invalid_page_cursor(au=au, cursor=cursor, sort=notice.USER_NOTICES_SORT)
+    nt, code = await notice.get_user_notices(
+        au=au, unread_only=unread_only, page=page, limit=limit, cursor=cursor, with_total=with_total,
+    )
     maybe_raise_json_exception(au=au, code=code)
 
     return schemas.user.NotificationResponse(
@@ -105,6 +112,7 @@ async def get_user_notices(
                     read=n["read"],
                     readTime=n["readTime"],
                 ) for n in nt["system"]["notices"]],
+            nextCursor=nt["system"]["nextCursor"],
         ),
     )
 
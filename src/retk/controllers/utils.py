@@ -1,14 +1,17 @@
+import hashlib
 import inspect
 import os
-from typing import Sequence
+from typing import Sequence, Optional
 from urllib.parse import urlparse
 
-from fastapi import HTTPException
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
 
 from retk import const, config
 from retk.controllers.schemas.user import UserInfoResponse
 from retk.core.user import get_user_nodes_count
 from retk.logger import logger
+from retk.models import db_ops
 from retk.models.tps import AuthedUser, UserMeta
 from retk.utils import datetime2str
 
@@ -25,6 +28,42 @@ def is_allowed_mime_type(data_url, allowed_mime_types: Sequence[str]):
         return False
 
 
+def is_etag_matched(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match uses the weak comparison, the W/ prefix is ignored
+    if if_none_match is None or if_none_match == "":
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = __strip_weak(etag)
+    return any(__strip_weak(t.strip()) == etag for t in if_none_match.split(","))
+
+
+def __strip_weak(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    # the browser keeps the response, but asks the server if it is changed every time
+    response.headers["Cache-Control"] = "private, no-cache"
+
+
+def not_modified_response(etag: str) -> Response:
+    resp = Response(status_code=304)
+    set_etag(response=resp, etag=etag)
+    return resp
+
+
+def weak_etag_response(resp: BaseModel, if_none_match: Optional[str], response: Response):
+    """A weak ETag of the response data without the request ID, return 304 if it is matched"""
+    data = resp.model_dump_json(exclude={"requestId"}).encode("utf-8")
+    etag = f'W/"{hashlib.sha1(data).hexdigest()}"'
+    if is_etag_matched(if_none_match=if_none_match, etag=etag):
+        return not_modified_response(etag=etag)
+    set_etag(response=response, etag=etag)
+    return resp
+
+
 def json_exception(
         request_id: str,
         uid: str,
@@ -90,6 +129,21 @@ def maybe_raise_json_exception(
         )
 
 
+def maybe_raise_invalid_page_cursor(
+        au: AuthedUser,
+        cursor: str,
+        sort: db_ops.Sort,
+):
+    # a cursor of another sort is ignored by find_page, the client would get the same page again
+    if cursor != "" and db_ops.decode_page_cursor(cursor, sort=sort) is None:
+        raise json_exception(
+            request_id=au.request_id,
+            uid=au.u.id,
+            code=const.CodeEnum.INVALID_PARAMS,
+            language=au.language,
+        )
+
+
 async def get_user_info_response_from_u_dict(
         u: UserMeta,
         request_id: str,
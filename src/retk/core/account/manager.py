@@ -92,6 +92,7 @@ async def __delete_post_process(uid: str):
     await client.search.force_delete_all(uid=uid)
     await client.coll.llm_extend_node_queue.delete_many({"uid": uid})
     await client.coll.llm_extended_node.delete_many({"uid": uid})
+    await client.coll.node_outbox.delete_many({"uid": uid})
 
 
 async def delete_by_uid(uid: str):
@@ -132,6 +132,7 @@ class AliyunService(BaseLLMService):
             return "Aliyun model error, please try later", const.CodeEnum.LLM_SERVICE_ERROR
 
         logger.info(f"rid='{req_id}' | Aliyun {model} | usage: {rj['usage']}")
+        ratelimiter.report_usage(rj["usage"].get("total_tokens"))
         return rj["output"]["choices"][0]["message"]["content"], const.CodeEnum.OK
 
     async def stream_complete(
@@ -169,6 +170,7 @@ class AliyunService(BaseLLMService):
                 choice = json_data["output"]["choices"][0]
                 if choice["finish_reason"] != "null":
                     logger.info(f"rid='{req_id}' | Aliyun {model} | usage: {json_data['usage']}")
+                    ratelimiter.report_usage(json_data["usage"].get("total_tokens"))
                     break
                 txt += choice["message"]["content"]
             yield txt.encode("utf-8"), code
@@ -180,12 +182,8 @@ class AliyunService(BaseLLMService):
             model: str = None,
             req_id: str = None,
     ) -> List[Tuple[Union[str, Dict[str, str]], const.CodeEnum]]:
-        if model is None:
-            m = self.default_model
-        else:
-            m = self.key2model[model].value
         concurrent_limiter = ratelimiter.ConcurrentLimiter(n=self.concurrency)
-        rate_limiter = ratelimiter.RateLimiter(requests=m.RPM, period=60)
+        rate_limiter = self._get_model_limiter(model)
 
         tasks = [
             func(
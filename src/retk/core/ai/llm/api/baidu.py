@@ -4,11 +4,10 @@ from datetime import datetime
 from enum import Enum
 from typing import Tuple, AsyncIterable, List, Dict, Union, Callable
 
-import httpx
-
 from retk import config, const
 from retk.core.utils import ratelimiter
 from retk.logger import logger
+from retk.utils import http_pool
 from .base import BaseLLMService, MessagesType, NoAPIKeyError, ModelConfig
 
 
@@ -104,17 +103,16 @@ class BaiduService(BaseLLMService):
         if self.token_expires_at > datetime.now().timestamp():
             return
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                url="https://aip.baidubce.com/oauth/2.0/token",
-                headers={"Content-Type": "application/json", 'Accept': 'application/json'},
-                content=b"",
-                params={
-                    "grant_type": "client_credentials",
-                    "client_id": _s.BAIDU_QIANFAN_API_KEY,
-                    "client_secret": _s.BAIDU_QIANFAN_SECRET_KEY,
-                }
-            )
+        resp = await http_pool.get("llm").post(
+            url="https://aip.baidubce.com/oauth/2.0/token",
+            headers={"Content-Type": "application/json", 'Accept': 'application/json'},
+            content=b"",
+            params={
+                "grant_type": "client_credentials",
+                "client_id": _s.BAIDU_QIANFAN_API_KEY,
+                "client_secret": _s.BAIDU_QIANFAN_SECRET_KEY,
+            }
+        )
         if resp.status_code != 200:
             logger.error(f"rid='{req_id}' | Baidu | error: {resp.text}")
             return ""
@@ -168,6 +166,7 @@ class BaiduService(BaseLLMService):
             logger.error(f"rid='{req_id}' | Baidu {model} | error: code={resp['error_code']} {resp['error_msg']}")
             return resp["error_msg"], const.CodeEnum.INVALID_AUTH
         logger.info(f"rid='{req_id}' | Baidu {model} | usage: {resp['usage']}")
+        ratelimiter.report_usage(resp["usage"].get("total_tokens"))
         return resp["result"], const.CodeEnum.OK
 
     async def stream_complete(
@@ -210,6 +209,7 @@ class BaiduService(BaseLLMService):
 
                 if json_data["is_end"]:
                     logger.info(f"rid='{req_id}' | Baidu {model} | usage: {json_data['usage']}")
+                    ratelimiter.report_usage(json_data["usage"].get("total_tokens"))
                     break
                 txt += json_data["result"]
             yield txt.encode("utf-8"), code
@@ -221,11 +221,7 @@ class BaiduService(BaseLLMService):
             model: str = None,
             req_id: str = None,
     ) -> List[Tuple[Union[str, Dict[str, str]], const.CodeEnum]]:
-        if model is None:
-            m = self.default_model
-        else:
-            m = self.key2model[model].value
-        limiter = ratelimiter.RateLimiter(requests=m.RPM, period=60)
+        limiter = self._get_model_limiter(model)
 
         tasks = [
             func(
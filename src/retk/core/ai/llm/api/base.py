@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
+from contextlib import AsyncExitStack
 from dataclasses import dataclass, field
 from typing import (
-    List, Dict, Literal, AsyncIterable, Tuple, Optional, Union, Any
+    List, Dict, Literal, AsyncIterable, Tuple, Optional, Union, Any, Awaitable, Callable
 )
 
 import httpx
@@ -9,6 +10,7 @@ import httpx
 from retk import const
 from retk.core.utils import ratelimiter
 from retk.logger import logger
+from retk.utils import http_pool
 from ..utils import parse_json_pattern
 
 MessagesType = List[Dict[Literal["role", "content"], str]]
@@ -27,9 +29,16 @@ class NoAPIKeyError(Exception):
     pass
 
 
+def estimate_tokens(messages: MessagesType) -> int:
+    """The prompt tokens before the service reports the usage, about 1.5 characters a token."""
+    return int(sum(len(m["content"]) for m in messages) / const.settings.LLM_CHARS_PER_TOKEN) + 1
+
+
 class BaseLLMService(ABC):
     name: str
     default_timeout = 60.
+    # requests of a model sent at the same time by the knowledge pipeline
+    concurrency: int = const.settings.LLM_DEFAULT_CONCURRENCY
 
     def __init__(
             self,
@@ -45,7 +54,7 @@ class BaseLLMService(ABC):
 
         self.top_p = top_p
         self.temperature = temperature
-        self.timeout = self.default_timeout if timeout is not None else timeout
+        self.timeout = self.default_timeout if timeout is None else timeout
         self.default_model: Optional[ModelConfig] = default_model
         self.endpoint = endpoint
         self.key2model = {m.value.key: m for m in model_enum}
@@ -58,7 +67,7 @@ class BaseLLMService(ABC):
     def _clip_messages(self, model: str, messages: MessagesType) -> MessagesType:
         # clip the last message if it's too long
         max_tokens = self.key2model[model].value.max_tokens
-        max_char = max(0, int(1.5 * max_tokens - 2000))
+        max_char = max(0, int(const.settings.LLM_CHARS_PER_TOKEN * max_tokens - 2000))
         if len(messages[-1]["content"]) > max_char:
             logger.warning(f"Message too long, clipping to {max_char} characters")
             messages[-1]["content"] = messages[-1]["content"][:max_char]
@@ -73,15 +82,14 @@ class BaseLLMService(ABC):
             req_id: str = None,
     ) -> Tuple[Dict, const.CodeEnum]:
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(
-                    url=url,
-                    headers=headers,
-                    content=payload,
-                    params=params,
-                    follow_redirects=False,
-                    timeout=self.timeout,
-                )
+            resp = await http_pool.get("llm").post(
+                url=url,
+                headers=headers,
+                content=payload,
+                params=params,
+                follow_redirects=False,
+                timeout=self.timeout,
+            )
         except (
                 httpx.ConnectTimeout,
                 httpx.ConnectError,
@@ -122,9 +130,8 @@ class BaseLLMService(ABC):
             params: Dict[str, str] = None,
             req_id: str = None,
     ) -> AsyncIterable[Tuple[bytes, const.CodeEnum]]:
-        client = httpx.AsyncClient()
         try:
-            async with client.stream(
+            async with http_pool.get("llm").stream(
                     method=method,
                     url=url,
                     headers=headers,
@@ -137,7 +144,6 @@ class BaseLLMService(ABC):
                     await resp.aread()
                     logger.error(f"rid='{req_id}' Model error: {resp.text}")
                     yield resp.content, const.CodeEnum.LLM_SERVICE_ERROR
-                    await client.aclose()
                     return
 
                 async for chunk in resp.aiter_bytes():
@@ -149,51 +155,68 @@ class BaseLLMService(ABC):
         ) as e:
             logger.error(f"rid='{req_id}' Model error: {e}")
             yield b"", const.CodeEnum.LLM_TIMEOUT
-        await client.aclose()
+
+    def _get_model_limiter(self, model: Optional[str]) -> ratelimiter.ModelLimiter:
+        m = self.default_model if model is None else self.key2model[model].value
+        return ratelimiter.get_model_limiter(service=self.name, model=m.key, rpm=m.RPM, tpm=m.TPM, rpd=m.RPD)
+
+    async def _limited_call(
+            self,
+            limiters: List[Union[ratelimiter.ModelLimiter, ratelimiter.ConcurrentLimiter]],
+            call: Callable[[], Awaitable[Tuple[Any, const.CodeEnum]]],
+            messages: MessagesType,
+            limited_return: Any,
+            model: str = None,
+            req_id: str = None,
+    ) -> Tuple[Any, const.CodeEnum]:
+        tokens = estimate_tokens(messages)
+        async with AsyncExitStack() as stack:
+            model_limiters = []
+            for limiter in limiters:
+                if isinstance(limiter, ratelimiter.ModelLimiter):
+                    if not await limiter.acquire(tokens):
+                        logger.error(f"rid='{req_id}' | {self.__class__.__name__} {model} | daily quota exceeded")
+                        return limited_return, const.CodeEnum.LLM_API_LIMIT_EXCEEDED
+                    model_limiters.append(limiter)
+                else:
+                    await stack.enter_async_context(limiter)
+            with ratelimiter.track_usage() as usage:
+                res = await call()
+        for limiter in model_limiters:
+            limiter.settle(reserved=tokens, used=usage.get("total"))
+        return res
 
     async def _batch_complete(
             self,
-            limiters: List[Union[ratelimiter.RateLimiter, ratelimiter.ConcurrentLimiter]],
+            limiters: List[Union[ratelimiter.ModelLimiter, ratelimiter.ConcurrentLimiter]],
             messages: MessagesType,
             model: str = None,
             req_id: str = None,
     ) -> Tuple[str, const.CodeEnum]:
-        if len(limiters) == 4:
-            async with limiters[0], limiters[1], limiters[2], limiters[3]:
-                return await self.complete(messages=messages, model=model, req_id=req_id)
-        elif len(limiters) == 3:
-            async with limiters[0], limiters[1], limiters[2]:
-                return await self.complete(messages=messages, model=model, req_id=req_id)
-        elif len(limiters) == 2:
-            async with limiters[0], limiters[1]:
-                return await self.complete(messages=messages, model=model, req_id=req_id)
-        elif len(limiters) == 1:
-            async with limiters[0]:
-                return await self.complete(messages=messages, model=model, req_id=req_id)
-        else:
-            raise ValueError("Invalid number of limiters, should less than 4")
+        return await self._limited_call(
+            limiters=limiters,
+            call=lambda: self.complete(messages=messages, model=model, req_id=req_id),
+            messages=messages,
+            limited_return="",
+            model=model,
+            req_id=req_id,
+        )
 
     async def _batch_stream_complete_json_detect(
             self,
-            limiters: List[Union[ratelimiter.RateLimiter, ratelimiter.ConcurrentLimiter]],
+            limiters: List[Union[ratelimiter.ModelLimiter, ratelimiter.ConcurrentLimiter]],
             messages: MessagesType,
             model: str = None,
             req_id: str = None,
     ) -> Tuple[Optional[Dict[str, str]], const.CodeEnum]:
-        if len(limiters) == 4:
-            async with limiters[0], limiters[1], limiters[2], limiters[3]:
-                return await self.stream_complete_json_detect(messages=messages, model=model, req_id=req_id)
-        elif len(limiters) == 3:
-            async with limiters[0], limiters[1], limiters[2]:
-                return await self.stream_complete_json_detect(messages=messages, model=model, req_id=req_id)
-        elif len(limiters) == 2:
-            async with limiters[0], limiters[1]:
-                return await self.stream_complete_json_detect(messages=messages, model=model, req_id=req_id)
-        elif len(limiters) == 1:
-            async with limiters[0]:
-                return await self.stream_complete_json_detect(messages=messages, model=model, req_id=req_id)
-        else:
-            raise ValueError("Invalid number of limiters, should less than 4")
+        return await self._limited_call(
+            limiters=limiters,
+            call=lambda: self.stream_complete_json_detect(messages=messages, model=model, req_id=req_id),
+            messages=messages,
+            limited_return={},
+            model=model,
+            req_id=req_id,
+        )
 
     async def stream_complete_json_detect(
             self,
@@ -50,6 +50,10 @@ class GLMService(OpenaiLLMStyle):
     def get_api_key():
         return config.get_settings().BIGMODEL_API_KEY
 
+    @property
+    def concurrency(self) -> int:
+        return config.get_settings().BIGMODEL_CONCURRENCY
+
     @staticmethod
     async def _batch_complete_union(
             messages: List[MessagesType],
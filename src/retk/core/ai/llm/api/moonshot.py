@@ -1,6 +1,6 @@
 import asyncio
 from enum import Enum
-from typing import List, Tuple, Callable, Union, Dict
+from typing import List, Tuple, Callable, Union, Dict, Optional
 
 from retk import config, const
 from retk.core.utils import ratelimiter
@@ -50,15 +50,27 @@ class MoonshotService(OpenaiLLMStyle):
     def get_api_key():
         return config.get_settings().MOONSHOT_API_KEY
 
-    @staticmethod
+    @property
+    def concurrency(self) -> int:
+        return config.get_settings().MOONSHOT_CONCURRENCY
+
+    def _get_model_limiter(self, model: Optional[str]) -> ratelimiter.ModelLimiter:
+        # the limits depend on the account, they are set by the settings
+        m = self.default_model if model is None else self.key2model[model].value
+        settings = config.get_settings()
+        return ratelimiter.get_model_limiter(
+            service=self.name, model=m.key, rpm=settings.MOONSHOT_RPM, tpm=settings.MOONSHOT_TPM, rpd=m.RPD,
+        )
+
     async def _batch_complete_union(
+            self,
             messages: List[MessagesType],
             func: Callable,
             model: str = None,
             req_id: str = None,
     ) -> List[Tuple[Union[str, Dict[str, str]], const.CodeEnum]]:
         settings = config.get_settings()
-        rate_limiter = ratelimiter.RateLimiter(requests=settings.MOONSHOT_RPM, period=60)
+        rate_limiter = self._get_model_limiter(model)
         concurrent_limiter = ratelimiter.ConcurrentLimiter(n=settings.MOONSHOT_CONCURRENCY)
 
         tasks = [
@@ -101,6 +101,7 @@ class OpenaiLLMStyle(BaseLLMService, ABC):
         if rj.get("error") is not None:
             return rj["error"]["message"], const.CodeEnum.LLM_SERVICE_ERROR
         logger.info(f"rid='{req_id}' | {self.__class__.__name__} {model} | usage: {rj['usage']}")
+        ratelimiter.report_usage(rj["usage"].get("total_tokens"))
         return rj["choices"][0]["message"]["content"], code
 
     async def stream_complete(
@@ -137,6 +138,7 @@ class OpenaiLLMStyle(BaseLLMService, ABC):
                     except KeyError:
                         usage = choice["usage"]
                     logger.info(f"rid='{req_id}' | {self.__class__.__name__} {model} | usage: {usage}")
+                    ratelimiter.report_usage(usage.get("total_tokens"))
                     break
                 txt += choice["delta"]["content"]
             yield txt.encode("utf-8"), code
@@ -175,11 +177,7 @@ class OpenaiService(OpenaiLLMStyle):
             model: str = None,
             req_id: str = None,
     ) -> List[Tuple[Union[str, Dict[str, str]], const.CodeEnum]]:
-        if model is None:
-            m = self.default_model
-        else:
-            m = self.key2model[model].value
-        limiter = ratelimiter.RateLimiter(requests=m.RPM, period=60)
+        limiter = self._get_model_limiter(model)
 
         tasks = [
             func(
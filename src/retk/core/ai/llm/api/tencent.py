@@ -143,6 +143,7 @@ class TencentService(BaseLLMService):
         choice = choices[0]
         m = choice["Delta"] if stream else choice["Message"]
         logger.info(f"rid='{req_id}' | Tencent | usage: {resp['Usage']}")
+        ratelimiter.report_usage(resp["Usage"].get("TotalTokens"))
         return m["Content"], const.CodeEnum.OK
 
     async def complete(
@@ -209,6 +210,7 @@ class TencentService(BaseLLMService):
                 choice = json_data["Choices"][0]
                 if choice["FinishReason"] != "":
                     logger.info(f"rid='{req_id}' | Tencent {model} | usage: {json_data['Usage']}")
+                    ratelimiter.report_usage(json_data["Usage"].get("TotalTokens"))
                     break
                 content = choice["Delta"]["Content"]
                 txt += content
@@ -127,6 +127,7 @@ class VolcEngineService(OpenaiLLMStyle):
                 else:
                     usage = json_data.get("usage", {})
                     logger.info(f"rid='{req_id}' | {self.__class__.__name__} {model} | usage: {usage}")
+                    ratelimiter.report_usage(usage.get("total_tokens"))
                     break
             yield txt.encode("utf-8"), code
 
@@ -137,10 +138,7 @@ class VolcEngineService(OpenaiLLMStyle):
             model: str = None,
             req_id: str = None,
     ) -> List[Tuple[Union[str, Dict[str, str]], const.CodeEnum]]:
-        if model is None:
-            model = self.default_model.key
-        m = self.key2model[model].value
-        rate_limiter = ratelimiter.RateLimiter(requests=m.RPM, period=60)
+        rate_limiter = self._get_model_limiter(model)
 
         tasks = [
             func(
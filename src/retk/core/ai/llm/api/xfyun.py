@@ -105,6 +105,7 @@ class XfYunService(BaseLLMService):
         if rj["code"] != 0:
             return rj["message"], const.CodeEnum.LLM_SERVICE_ERROR
         logger.info(f"rid='{req_id}' | {self.__class__.__name__} {model} | usage: {rj['usage']}")
+        ratelimiter.report_usage(rj["usage"].get("total_tokens"))
         return rj["choices"][0]["message"]["content"], code
 
     async def stream_complete(
@@ -147,6 +148,7 @@ class XfYunService(BaseLLMService):
                     pass
                 else:
                     logger.info(f"rid='{req_id}' | {self.__class__.__name__} {model} | usage: {usage}")
+                    ratelimiter.report_usage(usage.get("total_tokens"))
                     break
                 txt += choice["delta"]["content"]
             yield txt.encode("utf-8"), code
@@ -1,3 +1,5 @@
-from . import extended
-from .extending import extend_on_node_update, extend_on_node_post
-from .ops import batch_summary, batch_extend, ExtendCase
+from . import extended, cache
+from .extending import (
+    extend_on_node_update, extend_on_node_post, extend_on_nodes_post, should_extend_on_update
+)
+from .ops import batch_summary, batch_extend, summary_extend_pipeline, ExtendCase
@@ -0,0 +1,127 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Union
+
+from bson import ObjectId
+from bson.tz_util import utc
+from pymongo.errors import BulkWriteError
+
+from retk import const
+from retk.logger import logger
+from retk.models.client import client
+from retk.models.tps.llm import LLMResponseCache
+
+__counters = {
+    "hits": 0,
+    "misses": 0,
+    "stored": 0,
+    "evicted": 0,
+    # estimated by the characters of the prompts and the responses
+    "tokensSaved": 0,
+}
+
+
+def enabled() -> bool:
+    return client.coll.llm_response_cache is not None and const.settings.LLM_CACHE_MAX_SIZE > 0
+
+
+def get_key(service: str, model: str, system_prompt: str, content: str) -> str:
+    s = json.dumps([service, model, system_prompt, content], ensure_ascii=False)
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+async def get_many(keys: List[str]) -> Dict[str, LLMResponseCache]:
+    """The cached responses not expired, by key. The hits and misses are counted."""
+    if not enabled() or len(keys) == 0:
+        return {}
+    unique_keys = list(set(keys))
+    now = datetime.now(tz=utc)
+    docs = await client.coll.llm_response_cache.find({
+        "key": {"$in": unique_keys},
+        "createdAt": {"$gte": now - timedelta(seconds=const.settings.LLM_CACHE_TTL)},
+    }).to_list(length=None)
+    key2doc = {doc["key"]: doc for doc in docs}
+    if len(key2doc) > 0:
+        await client.coll.llm_response_cache.update_many(
+            {"key": {"$in": list(key2doc.keys())}},
+            {"$set": {"hitAt": now}, "$inc": {"hits": 1}},
+        )
+    for key in keys:
+        doc = key2doc.get(key)
+        if doc is None:
+            __counters["misses"] += 1
+        else:
+            __counters["hits"] += 1
+            __counters["tokensSaved"] += doc["tokens"]
+    return key2doc
+
+
+async def put_many(docs: List[Dict[str, Union[str, int, Dict[str, str]]]]):
+    """Cache the responses of {key, service, model, response, tokens}, call evict() to keep the size."""
+    if not enabled() or len(docs) == 0:
+        return
+    now = datetime.now(tz=utc)
+    key2doc = {d["key"]: d for d in docs}
+    coll = client.coll.llm_response_cache
+    # an expired response is replaced, the key is unique
+    await coll.delete_many({
+        "key": {"$in": list(key2doc.keys())},
+        "createdAt": {"$lt": now - timedelta(seconds=const.settings.LLM_CACHE_TTL)},
+    })
+    cached = await coll.find({"key": {"$in": list(key2doc.keys())}}).to_list(length=None)
+    for doc in cached:
+        key2doc.pop(doc["key"], None)
+    if len(key2doc) == 0:
+        return
+    items: List[LLMResponseCache] = [
+        LLMResponseCache(
+            _id=ObjectId(),
+            key=d["key"],
+            service=d["service"],
+            model=d["model"],
+            response=d["response"],
+            tokens=d["tokens"],
+            hits=0,
+            createdAt=now,
+            hitAt=now,
+        ) for d in key2doc.values()
+    ]
+    try:
+        res = await coll.insert_many(items, ordered=False)
+        n = len(res.inserted_ids)
+    except BulkWriteError as e:
+        # cached by another batch at the same time
+        n = e.details["nInserted"]
+    __counters["stored"] += n
+
+
+async def evict() -> int:
+    """Remove the expired and then the least recently hit responses over LLM_CACHE_MAX_SIZE"""
+    if not enabled():
+        return 0
+    coll = client.coll.llm_response_cache
+    res = await coll.delete_many(
+        {"createdAt": {"$lt": datetime.now(tz=utc) - timedelta(seconds=const.settings.LLM_CACHE_TTL)}}
+    )
+    n = res.deleted_count
+    over = await coll.count_documents({}) - const.settings.LLM_CACHE_MAX_SIZE
+    if over > 0:
+        docs = await coll.find({}).sort("hitAt", 1).limit(over).to_list(length=None)
+        res = await coll.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        n += res.deleted_count
+    if n > 0:
+        logger.debug(f"llm response cache evicted {n}")
+    __counters["evicted"] += n
+    return n
+
+
+async def stats() -> Dict[str, float]:
+    """The cached responses, the hits and misses since startup and the hit rate"""
+    size = await client.coll.llm_response_cache.count_documents({}) if enabled() else 0
+    lookups = __counters["hits"] + __counters["misses"]
+    return {
+        "size": size,
+        "hitRate": __counters["hits"] / lookups if lookups > 0 else 0.,
+        **__counters,
+    }
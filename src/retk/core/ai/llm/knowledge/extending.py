@@ -1,4 +1,5 @@
 from datetime import timedelta
+from typing import List
 
 from bson import ObjectId
 from bson.tz_util import utc
@@ -8,6 +9,9 @@ from retk.models.client import client
 from retk.models.tps.llm import NodeExtendQueue
 from retk.models.tps.node import Node
 
+# the latest nodes of a user kept in the extend queue
+_QUEUE_MAX_KEEP = 5
+
 
 async def extend_on_node_post(data: Node):
     if data["md"].strip() == "":
@@ -44,28 +48,40 @@ async def extend_on_node_post(data: Node):
             )
             break
 
-    max_keep = 5
     if not has_q:
         # this is a new node in queue
-        if len(docs) >= max_keep:
+        if len(docs) >= _QUEUE_MAX_KEEP:
             # remove the oldest and only keep the latest 5
             await client.coll.llm_extend_node_queue.delete_many(
-                {"_id": {"$in": [doc["_id"] for doc in docs[max_keep:]]}}
+                {"_id": {"$in": [doc["_id"] for doc in docs[_QUEUE_MAX_KEEP:]]}}
             )
         await client.coll.llm_extend_node_queue.insert_one(q)
 
 
-async def extend_on_node_update(
+async def extend_on_nodes_post(data: List[Node]):
+    # only the latest nodes are kept in the queue, the older ones are not queued at all
+    for d in [d for d in data if d["md"].strip() != ""][-_QUEUE_MAX_KEEP:]:
+        await extend_on_node_post(d)
+
+
+def should_extend_on_update(
         old_data: Node,
         new_data: Node,
         cooling_time: int = 60,
-):
+) -> bool:
     # filter out frequent updates
     try:
         dt = new_data["modifiedAt"] - old_data["modifiedAt"]
     except TypeError:
         dt = new_data["modifiedAt"].replace(tzinfo=utc) - old_data["modifiedAt"].replace(tzinfo=utc)
+    return dt >= timedelta(seconds=cooling_time)
+
 
-    if dt < timedelta(seconds=cooling_time):
+async def extend_on_node_update(
+        old_data: Node,
+        new_data: Node,
+        cooling_time: int = 60,
+):
+    if not should_extend_on_update(old_data=old_data, new_data=new_data, cooling_time=cooling_time):
         return
     await extend_on_node_post(new_data)
@@ -1,13 +1,16 @@
+import asyncio
+import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import List, Dict, Union, AsyncIterator, Tuple
 
 from bson import ObjectId
 
 from retk import const
 from retk.logger import logger
 from ..api import LLM_DEFAULT_SERVICES
-from ..api.base import MessagesType
+from . import cache
+from ..api.base import MessagesType, estimate_tokens
 from ..utils import remove_links
 
 system_summary_prompt = (Path(__file__).parent / "system_summary.md").read_text(encoding="utf-8")
@@ -31,6 +34,10 @@ class ExtendCase:
     extend_content: str = ""
     extend_search_terms: List[str] = None
     extend_code: const.CodeEnum = const.CodeEnum.OK
+    # seconds, set by summary_extend_pipeline
+    summary_latency: float = 0.
+    extend_latency: float = 0.
+    latency: float = 0.
 
     def __post_init__(self):
         self.stripped_md = remove_links(self.md)
@@ -40,13 +47,26 @@ class ExtendCase:
         return f"{self.extend_title}\n\n{self.extend_content}"
 
 
+def _set_result(case: ExtendCase, is_extend: bool, data: Union[str, Dict[str, str]], code: const.CodeEnum) -> str:
+    if is_extend:
+        case.extend_title = data.get("title", data.get("标题", ""))
+        case.extend_content = data.get("content", data.get("内容", ""))
+        case.extend_search_terms = data.get("searchTerms", data.get("关键词", ""))
+        case.extend_code = code
+        return case.extend_md.replace('\n', '\\n')
+    case.summary = data
+    case.summary_code = code
+    return data.replace('\n', '\\n')
+
+
 async def _batch_send(
         is_extend: bool,
         system_prompt: str,
         cases: List[ExtendCase],
         req_id: str,
 ) -> List[ExtendCase]:
-    svr_group = {}
+    phase = "extend" if is_extend else "summary"
+    keyed_cases = []
     for case in cases:
         if is_extend:
             if case.summary_code != const.CodeEnum.OK:
@@ -58,46 +78,64 @@ async def _batch_send(
             service = case.summary_service
             model = case.summary_model
             content = case.stripped_md
+        keyed_cases.append((cache.get_key(service, model, system_prompt, content), service, model, content, case))
+
+    # the same content is answered by the cache or sent once
+    key2doc = await cache.get_many([k for k, *_ in keyed_cases])
+    svr_group = {}
+    for key, service, model, content, case in keyed_cases:
+        doc = key2doc.get(key)
+        if doc is not None:
+            _set_result(case=case, is_extend=is_extend, data=doc["response"], code=const.CodeEnum.OK)
+            logger.debug(
+                f"rid='{req_id}' "
+                f"| uid='{case.uid}' "
+                f"| knowledge {phase} "
+                f"| {service} {model} "
+                f"| cache hit"
+            )
+            continue
 
         if service not in svr_group:
             svr_group[service] = {}
         if model not in svr_group[service]:
-            svr_group[service][model] = {"case": [], "msgs": []}
-        _m: MessagesType = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": content},
-        ]
-        svr_group[service][model]["case"].append(case)
-        svr_group[service][model]["msgs"].append(_m)
-
-    for service, models in svr_group.items():
-        for model, model_cases in models.items():
-            llm_service = LLM_DEFAULT_SERVICES[service]
-            if is_extend:
-                results = await llm_service.batch_complete_json_detect(
-                    messages=model_cases["msgs"],
-                    model=model,
-                    req_id=req_id,
-                )
-            else:
-                results = await llm_service.batch_complete(
-                    messages=model_cases["msgs"],
-                    model=model,
-                    req_id=req_id,
-                )
-            for (_data, code), case in zip(results, model_cases["case"]):
-                if is_extend:
-                    case.extend_title = _data.get("title", _data.get("标题", ""))
-                    case.extend_content = _data.get("content", _data.get("内容", ""))
-                    case.extend_search_terms = _data.get("searchTerms", _data.get("关键词", ""))
-                    case.extend_code = code
-                    oneline_s = case.extend_md.replace('\n', '\\n')
-                else:
-                    case.summary = _data
-                    case.summary_code = code
-                    oneline_s = _data.replace('\n', '\\n')
+            svr_group[service][model] = {}
+        if key not in svr_group[service][model]:
+            _m: MessagesType = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": content},
+            ]
+            svr_group[service][model][key] = {"case": [], "msgs": _m}
+        svr_group[service][model][key]["case"].append(case)
+
+    to_cache = []
 
-                phase = "extend" if is_extend else "summary"
+    async def send_group(service: str, model: str, key2cases: Dict[str, Dict]):
+        llm_service = LLM_DEFAULT_SERVICES[service]
+        msgs = [c["msgs"] for c in key2cases.values()]
+        if is_extend:
+            results = await llm_service.batch_complete_json_detect(
+                messages=msgs,
+                model=model,
+                req_id=req_id,
+            )
+        else:
+            results = await llm_service.batch_complete(
+                messages=msgs,
+                model=model,
+                req_id=req_id,
+            )
+        for (_data, code), (key, c) in zip(results, key2cases.items()):
+            if code == const.CodeEnum.OK:
+                to_cache.append({
+                    "key": key,
+                    "service": service,
+                    "model": model,
+                    "response": _data,
+                    "tokens": estimate_tokens(c["msgs"] + [{"role": "assistant", "content": str(_data)}]),
+                })
+            for case in c["case"]:
+                oneline_s = _set_result(case=case, is_extend=is_extend, data=_data, code=code)
                 logger.debug(
                     f"rid='{req_id}' "
                     f"| uid='{case.uid}' "
@@ -115,6 +153,14 @@ async def _batch_send(
                         f"| error: {code.name} "
                         f"| summary: {oneline}"
                     )
+
+    # a slow service does not hold the others
+    await asyncio.gather(*[
+        send_group(service=service, model=model, key2cases=key2cases)
+        for service, models in svr_group.items()
+        for model, key2cases in models.items()
+    ])
+    await cache.put_many(to_cache)
     return cases
 
 
@@ -140,3 +186,92 @@ async def batch_extend(
         cases=cases,
         req_id=req_id,
     )
+
+
+async def summary_extend_pipeline(
+        cases: List[ExtendCase],
+        req_id: str = None,
+) -> AsyncIterator[ExtendCase]:
+    """Summarize then extend the cases, each case is yielded once it is done, in the order of finishing.
+
+    Each (stage, service, model) has a group of workers, a worker sends the cases waiting in its group
+    as one batch of up to LLM_PIPELINE_BATCH_SIZE, and the workers of a group send no more requests at
+    a time than the concurrency of the service. The groups run at the same time and a case goes to its
+    extend group as soon as it is summarized. The requests are limited by the shared model limiters of
+    the services.
+    """
+    done: asyncio.Queue = asyncio.Queue()
+    groups: Dict[Tuple[bool, str, str], asyncio.Queue] = {}
+    workers: List[asyncio.Task] = []
+    t0 = time.perf_counter()
+
+    def submit(is_extend: bool, case: ExtendCase):
+        service = case.extend_service if is_extend else case.summary_service
+        model = case.extend_model if is_extend else case.summary_model
+        try:
+            llm_service = LLM_DEFAULT_SERVICES[service]
+        except KeyError:
+            logger.error(f"rid='{req_id}' | uid='{case.uid}' | knowledge | unknown service: {service}")
+            if is_extend:
+                case.extend_code = const.CodeEnum.LLM_SERVICE_ERROR
+            else:
+                case.summary_code = const.CodeEnum.LLM_SERVICE_ERROR
+            finish(case)
+            return
+        key = (is_extend, service, model)
+        q = groups.get(key)
+        if q is None:
+            q = asyncio.Queue()
+            groups[key] = q
+            batch_size = const.settings.LLM_PIPELINE_BATCH_SIZE
+            workers.extend(
+                asyncio.create_task(work(is_extend=is_extend, q=q, batch_size=batch_size))
+                for _ in range(max(1, llm_service.concurrency // batch_size))
+            )
+        q.put_nowait(case)
+
+    def finish(case: ExtendCase):
+        case.latency = time.perf_counter() - t0
+        done.put_nowait(case)
+
+    async def work(is_extend: bool, q: asyncio.Queue, batch_size: int):
+        while True:
+            # the cases waiting now are sent together, without waiting for the batch to fill
+            batch = [await q.get()]
+            while len(batch) < batch_size and not q.empty():
+                batch.append(q.get_nowait())
+            s0 = time.perf_counter()
+            try:
+                await _batch_send(
+                    is_extend=is_extend,
+                    system_prompt=system_extend_prompt if is_extend else system_summary_prompt,
+                    cases=batch,
+                    req_id=req_id,
+                )
+            except Exception as e:  # pylint: disable=broad-except
+                for case in batch:
+                    logger.error(f"rid='{req_id}' | uid='{case.uid}' | knowledge | error: {e}")
+                    if is_extend:
+                        case.extend_code = const.CodeEnum.LLM_SERVICE_ERROR
+                    else:
+                        case.summary_code = const.CodeEnum.LLM_SERVICE_ERROR
+            latency = time.perf_counter() - s0
+            for case in batch:
+                if is_extend:
+                    case.extend_latency = latency
+                    finish(case)
+                else:
+                    case.summary_latency = latency
+                    if case.summary_code == const.CodeEnum.OK:
+                        submit(is_extend=True, case=case)
+                    else:
+                        finish(case)
+
+    for c in cases:
+        submit(is_extend=False, case=c)
+    try:
+        for _ in range(len(cases)):
+            yield await done.get()
+    finally:
+        for w in workers:
+            w.cancel()
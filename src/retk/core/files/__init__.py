@@ -6,3 +6,4 @@ from .upload import (
     upload_obsidian,
     fetch_image_vditor,
 )
+from .export import stream_account_zip
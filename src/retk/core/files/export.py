@@ -0,0 +1,186 @@
+import asyncio
+import io
+import os
+import re
+import time
+import zipfile
+from collections import deque
+from typing import AsyncIterator, List, Tuple, Set, Dict
+
+from retk import const, config
+from retk.core.node import backup
+from retk.core.utils.cos import cos_client
+from retk.core.utils.md_tools import replace_app_files_in_md
+from retk.logger import logger
+from retk.models import tps, db_ops
+from retk.models.client import client
+
+__INVALID_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|\r\n\t]')
+__NODES_SORT = [("_id", 1)]
+
+
+class _ZipStream(io.RawIOBase):
+    """A write only file of the zip, the written bytes are taken out by pop().
+    It is not seekable, so the zip is written in one pass with the sizes after each file data.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._buf += b
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    @property
+    def pending(self) -> int:
+        return len(self._buf)
+
+    def pop(self) -> bytes:
+        b = bytes(self._buf)
+        self._buf.clear()
+        return b
+
+
+async def stream_account_zip(au: tps.AuthedUser, with_history: bool = False) -> AsyncIterator[bytes]:
+    """All notes of the user, their history versions if with_history, and the files in the notes, as a zip.
+    The zip is yielded in chunks while it is written, the notes are read by pages and the files are
+    downloaded in chunks by a few at a time, so the memory does not grow with the account size.
+
+    Layout:
+        {title}.md
+        trash/{title}.md
+        history/{title}/{version}.md
+        files/{filename}
+    """
+    stream = _ZipStream()
+    filenames: Set[str] = set()
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        used_names: Set[str] = set()
+        cursor = ""
+        while True:
+            docs = await db_ops.find_page(
+                client.coll.nodes,
+                condition={"uid": au.u.id, "disabled": False},
+                sort=__NODES_SORT,
+                limit=const.settings.EXPORT_NODES_BATCH_SIZE,
+                cursor=cursor,
+            ).to_list(length=None)
+            for n in docs:
+                name = __unique_name(n, used_names)
+                md, fns = replace_app_files_in_md(au.u.id, n["md"])
+                # a file link out of the user's files is not followed
+                filenames.update(fn for fn in fns if os.path.basename(fn) == fn and fn not in ("", ".", ".."))
+                z.writestr(f"trash/{name}.md" if n["inTrash"] else f"{name}.md", md)
+                if with_history:
+                    for version in n.get("history", []):
+                        hist_md, code = await backup.get_md(uid=au.u.id, nid=n["id"], version=version)
+                        if code != const.CodeEnum.OK:
+                            continue
+                        hist_md, _ = replace_app_files_in_md(au.u.id, hist_md)
+                        z.writestr(f"history/{name}/{__INVALID_FILENAME_CHARS.sub('-', version)}.md", hist_md)
+                if stream.pending >= const.settings.EXPORT_CHUNK_SIZE:
+                    yield stream.pop()
+            cursor = db_ops.next_page_cursor(docs=docs, sort=__NODES_SORT, limit=const.settings.EXPORT_NODES_BATCH_SIZE)
+            if cursor == "":
+                break
+
+        async for filename, chunks in __iter_files(uid=au.u.id, filenames=sorted(filenames)):
+            chunk = await chunks.get()
+            if chunk is None:
+                # not found
+                continue
+            # the files are mostly compressed images, store them as is
+            zi = zipfile.ZipInfo(f"{const.settings.LOCAL_FILE_URL_PRE_DIR}/{filename}", time.localtime()[:6])
+            zi.compress_type = zipfile.ZIP_STORED
+            with z.open(zi, mode="w") as f:
+                while chunk is not None:
+                    f.write(chunk)
+                    if stream.pending >= const.settings.EXPORT_CHUNK_SIZE:
+                        yield stream.pop()
+                    chunk = await chunks.get()
+    # the central directory is written on close
+    yield stream.pop()
+
+
+def __unique_name(n: tps.Node, used_names: Set[str]) -> str:
+    name = __INVALID_FILENAME_CHARS.sub("_", n["title"]).strip(" .")[:100]
+    if name == "":
+        name = n["id"]
+    if name.lower() in used_names:
+        name = f"{name} ({n['id']})"
+    used_names.add(name.lower())
+    return name
+
+
+async def __iter_files(
+        uid: str,
+        filenames: List[str],
+) -> AsyncIterator[Tuple[str, "asyncio.Queue[bytes]"]]:
+    """The files in order, each is a queue of its chunks ended by None.
+    EXPORT_FILE_CONCURRENCY files are downloaded at the same time, and each holds at most
+    EXPORT_PREFETCH_CHUNKS chunks until they are taken.
+    """
+    names = iter(filenames)
+    window: deque = deque()
+    tasks: Dict[str, asyncio.Task] = {}
+
+    def start_next():
+        filename = next(names, None)
+        if filename is None:
+            return
+        q = asyncio.Queue(maxsize=const.settings.EXPORT_PREFETCH_CHUNKS)
+        tasks[filename] = asyncio.create_task(__download(uid=uid, filename=filename, q=q))
+        window.append((filename, q))
+
+    for _ in range(const.settings.EXPORT_FILE_CONCURRENCY):
+        start_next()
+    try:
+        while len(window) > 0:
+            filename, q = window.popleft()
+            yield filename, q
+            await tasks.pop(filename)
+            start_next()
+    finally:
+        # the client is disconnected
+        for t in tasks.values():
+            t.cancel()
+
+
+async def __download(uid: str, filename: str, q: asyncio.Queue):
+    try:
+        if config.is_local_db():
+            chunks = __iter_local_file(filename)
+        else:
+            chunks = cos_client.async_iter(uid=uid, filename=filename, chunk_size=const.settings.EXPORT_CHUNK_SIZE)
+        async for chunk in chunks:
+            await q.put(chunk)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error(f"export file failed, uid: {uid}, filename: {filename}, error: {e}")
+    # the end of the file, not put when it is cancelled
+    await q.put(None)
+
+
+async def __iter_local_file(filename: str) -> AsyncIterator[bytes]:
+    path = os.path.join(
+        config.get_settings().RETHINK_LOCAL_STORAGE_PATH,
+        const.settings.DOT_DATA, const.settings.LOCAL_FILE_URL_PRE_DIR, filename,
+    )
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        while True:
+            b = await asyncio.get_running_loop().run_in_executor(None, f.read, const.settings.EXPORT_CHUNK_SIZE)
+            if not b:
+                break
+            yield b
@@ -1,8 +1,6 @@
 import time
 import zipfile
 
-import pymongo.errors
-
 from retk import const, core
 from retk.logger import logger
 from retk.models.tps import AuthedUser, convert_user_dict_to_authed_user
@@ -81,46 +79,45 @@ async def upload_obsidian_task(
         request_id=request_id,
         language=u["settings"].get("language", const.LanguageEnum.EN.value),
     )
-    for i, (full_path, meta) in enumerate(unzipped_files.md_full.items()):
-        meta: ops.UnzipObsidian.Meta
-
-        if full_path in existed_path2nid:
-            continue
-
-        try:
-            n, code = await core.node.post(
-                au=au,
-                md=meta.title,
-                type_=const.NodeTypeEnum.MARKDOWN.value,
-            )
-        except pymongo.errors.DuplicateKeyError:
-            logger.error(f"duplicate key: {full_path}, uid: {uid}")
-            continue
+    new_md_full = [
+        (full_path, meta) for full_path, meta in unzipped_files.md_full.items()
+        if full_path not in existed_path2nid
+    ]
+    batch_size = const.settings.NODE_POST_BATCH_MAX_COUNT
+    for i in range(0, len(new_md_full), batch_size):
+        batch = new_md_full[i: i + batch_size]
+        nodes, code = await core.node.post_batch(
+            au=au,
+            mds=[meta.title for _, meta in batch],
+            type_=const.NodeTypeEnum.MARKDOWN.value,
+        )
         if code != const.CodeEnum.OK:
             await utils.set_running_false(
                 uid,
                 code,
-                msg=f"new file insert failed: {full_path}",
+                msg=f"new file insert failed: {batch[0][0]} ...",
             )
-            logger.error(f"error: {code}, filepath: {full_path}, uid: {uid}")
+            logger.error(f"error: {code}, filepath: {batch[0][0]} ..., uid: {uid}")
             return
 
-        # add full path and short name to existed_path2nid
-        existed_path2nid[full_path] = n["id"]
-        if meta.filename not in existed_path2nid:
-            existed_path2nid[meta.filename] = n["id"]
-        if i % 20 == 0:
-            doc, code = await utils.update_process(uid=uid, type_=type_, process=int(i / md_count * 10))
-            if code != const.CodeEnum.OK:
-                await utils.set_running_false(
-                    uid,
-                    code,
-                    msg="process updating failed",
-                )
-                logger.error(f"error: {code}, filepath: {full_path}, uid: {uid}")
-                return
-            if not doc["running"]:
-                break
+        for (full_path, meta), n in zip(batch, nodes):
+            meta: ops.UnzipObsidian.Meta
+            # add full path and short name to existed_path2nid
+            existed_path2nid[full_path] = n["id"]
+            if meta.filename not in existed_path2nid:
+                existed_path2nid[meta.filename] = n["id"]
+        doc, code = await utils.update_process(
+            uid=uid, type_=type_, process=int((i + len(batch)) / md_count * 10))
+        if code != const.CodeEnum.OK:
+            await utils.set_running_false(
+                uid,
+                code,
+                msg="process updating failed",
+            )
+            logger.error(f"error: {code}, uid: {uid}")
+            return
+        if not doc["running"]:
+            break
     t3 = time.time()
     logger.debug(f"obsidian upload, uid={uid}, add new md time: {t3 - t2:.2f}")
 
@@ -197,7 +194,7 @@ async def upload_obsidian_task(
     count = 0
     for base_name, nid in doc["obsidian"].items():
         if base_name not in existed_path2nid:
-            n, code = await core.node.get(au=au, nid=nid)
+            n, code = await core.node.get(au=au, nid=nid, fields=["md"], with_links=False)
             if code != const.CodeEnum.OK:
                 continue
             n, _, code = await core.node.update_md(
@@ -1,7 +1,5 @@
 from typing import List
 
-import pymongo.errors
-
 from retk import const, core
 from retk.logger import logger
 from retk.models.tps import AuthedUser, convert_user_dict_to_authed_user
@@ -43,7 +41,8 @@ async def update_text_task(
         request_id=request_id,
         language=u["settings"].get("language", const.LanguageEnum.EN.value),
     )
-    for i, file in enumerate(files):
+    mds = []
+    for file in files:
         try:
             md = file["content"].decode("utf-8")
         except (FileNotFoundError, OSError) as e:
@@ -55,32 +54,34 @@ async def update_text_task(
             )
             return
         title = file["filename"].rsplit(".", 1)[0]
-        md = title + "\n\n" + md
+        mds.append(title + "\n\n" + md)
+
+    batch_size = const.settings.NODE_POST_BATCH_MAX_COUNT
+    for i in range(0, len(mds), batch_size):
         try:
-            _, code = await core.node.post(
+            _, code = await core.node.post_batch(
                 au=au,
-                md=md,
+                mds=mds[i: i + batch_size],
                 type_=const.NodeTypeEnum.MARKDOWN.value,
             )
-        except pymongo.errors.DuplicateKeyError:
-            continue
         except Exception as e:  # pylint: disable=broad-except
-            logger.error(f"error: {e}. filepath: {file['filename']}")
+            logger.error(f"error: {e}. filepath: {files[i]['filename']} ...")
             await utils.set_running_false(
                 uid=uid,
                 code=const.CodeEnum.FILE_OPEN_ERROR,
-                msg=f"file decode utf-8 failed, {e}: {file['filename']}",
+                msg=f"file insert failed, {e}",
             )
             return
         if code != const.CodeEnum.OK:
             await utils.set_running_false(
                 uid=uid,
                 code=code,
-                msg=f"file insert failed: {file['filename']}",
+                msg=f"file insert failed: {files[i]['filename']} ...",
             )
             return
-        if i % 20 == 0:
-            doc, code = await utils.update_process(uid=uid, type_=type_, process=int(i / len(files) * 100))
+        if i + batch_size < len(mds):
+            doc, code = await utils.update_process(
+                uid=uid, type_=type_, process=int((i + batch_size) / len(mds) * 100))
             if code != const.CodeEnum.OK:
                 await utils.set_running_false(
                     uid=uid,
@@ -13,7 +13,7 @@ from retk.config import is_local_db
 from retk.logger import logger
 from retk.models.client import client
 from retk.models.tps import AuthedUser
-from retk.utils import ssrf_check, ASYNC_CLIENT_HEADERS
+from retk.utils import ssrf_check, ASYNC_CLIENT_HEADERS, http_pool
 from .importing import async_tasks, sync_tasks
 
 QUEUE_INITED = False
@@ -163,13 +163,12 @@ async def fetch_image_vditor(
     if user_agent != "":
         headers["User-Agent"] = user_agent
     try:
-        async with httpx.AsyncClient() as c:
-            response = await c.get(
-                url=url,
-                headers=headers,
-                follow_redirects=False,
-                timeout=5.
-            )
+        response = await http_pool.get("web").get(
+            url=url,
+            headers=headers,
+            follow_redirects=False,
+            timeout=5.
+        )
     except (
             httpx.ConnectTimeout,
             RuntimeError,
@@ -1,27 +1,35 @@
+import asyncio
+import json
 import shutil
+import zlib
 from datetime import datetime, timedelta
+from difflib import SequenceMatcher
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Tuple, Optional, Union
 
 from bson.tz_util import utc
-from pydantic_settings import BaseSettings
-
-try:
-    from qcloud_cos import CosConfig, CosServiceError, CosS3Client
-except ImportError:
-    pass
 
 from retk import config, const
+from retk.core.utils.cos import cos_client
 from retk.logger import logger
 from retk.models import tps
 from retk.models.client import client
 
+__DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%fZ"
+# a version is a keyframe of the full md, or a delta on a keyframe, both compressed
+__HIST_SUFFIX = ".mdz"
+__HIST_MAGIC = b"RKH1"
+__KEYFRAME = b"K"
+__DELTA = b"D"
+__MIGRATED_MARKER = ".migrated"
+__migrate_task: Optional[asyncio.Task] = None
+
 
 async def storage_md(node: tps.Node, keep_hist: bool) -> const.CodeEnum:
     nid = node["id"]
     md = node["md"]
     hist = node.get("history", [])
-    date_format = "%Y-%m-%d %H:%M:%S.%fZ"
+    keyframes = node.get("historyKeyframes", [])
 
     if config.is_local_db():
         # save to local
@@ -36,40 +44,21 @@ async def storage_md(node: tps.Node, keep_hist: bool) -> const.CodeEnum:
     # ignore if the time difference is less than n minutes
     if len(hist) != 0:
         last_hist = hist[0]
-        time = datetime.strptime(last_hist, date_format).replace(tzinfo=None)
+        time = datetime.strptime(last_hist, __DATE_FORMAT).replace(tzinfo=None)
         if (datetime.now(tz=utc).replace(tzinfo=None) - time) < timedelta(
                 seconds=config.get_settings().MD_BACKUP_INTERVAL
         ):
             return const.CodeEnum.OK
 
-    this_hist = node["modifiedAt"].strftime(date_format)
-    hist.insert(0, this_hist)
-
-    if config.is_local_db():
-        md_dir = __get_md_hist_dir(nid)
-        md_dir.mkdir(parents=True, exist_ok=True)
-        filename = __windows_safe_path(this_hist)
-        with open(md_dir / f"{filename}.md", "w", encoding="utf-8") as f:
-            f.write(md)
-    else:
-        code = __save_md_to_cos(node["uid"], nid, this_hist, md)
-        if code != const.CodeEnum.OK:
-            return code
-
-    if len(hist) > const.settings.MAX_MD_BACKUP_VERSIONS:
-        drop = hist[-const.settings.MAX_MD_BACKUP_VERSIONS:]
-        for h in drop:
-            if config.is_local_db():
-                md_dir = __get_md_hist_dir(nid)
-                filename = __windows_safe_path(h)
-                (md_dir / f"{filename}.md").unlink()
-            else:
-                __remove_md_from_cos(node["uid"], nid, h)
-        hist = hist[:-const.settings.MAX_MD_BACKUP_VERSIONS]
+    this_hist = node["modifiedAt"].strftime(__DATE_FORMAT)
+    code = await __add_version(node["uid"], nid, hist, keyframes, this_hist, md)
+    if code != const.CodeEnum.OK:
+        return code
+    hist, keyframes = await __drop_old_versions(node["uid"], nid, hist, keyframes)
 
     res = await client.coll.nodes.update_one(
         {"id": nid},
-        {"$set": {"history": hist}}
+        {"$set": {"history": hist, "historyKeyframes": keyframes}}
     )
     if res.modified_count != 1:
         logger.error(f"failed to update node history: {nid}")
@@ -77,7 +66,16 @@ async def storage_md(node: tps.Node, keep_hist: bool) -> const.CodeEnum:
     return const.CodeEnum.OK
 
 
-def delete_node_md(uid: str, nids: List[str]):
+async def storage_md_batch(nodes: List[tps.Node]) -> const.CodeEnum:
+    """The md of the new nodes, a new node has no history yet"""
+    if config.is_local_db():
+        md_dir = Path(config.get_settings().RETHINK_LOCAL_STORAGE_PATH) / const.settings.DOT_DATA / "md"
+        for node in nodes:
+            (md_dir / (node["id"] + ".md")).write_text(node["md"], encoding="utf-8")
+    return const.CodeEnum.OK
+
+
+async def delete_node_md(uid: str, nids: List[str]):
     if config.is_local_db():
         for nid in nids:
             dir_ = __get_md_hist_dir(nid)
@@ -90,20 +88,243 @@ def delete_node_md(uid: str, nids: List[str]):
             md_path.unlink(missing_ok=True)
     else:
         for nid in nids:
-            __remove_md_all_versions_from_cos(uid, nid)
+            await __remove_md_all_versions_from_cos(uid, nid)
 
 
-def get_md(uid: str, nid: str, version: str) -> Tuple[str, const.CodeEnum]:
+async def get_md(uid: str, nid: str, version: str) -> Tuple[str, const.CodeEnum]:
+    data, code = await __read_version(uid, nid, version)
+    if code != const.CodeEnum.OK:
+        return "", code
+    base, payload = _decode_version(data)
+    if base is None:
+        return payload, const.CodeEnum.OK
+    # a delta, applied onto its keyframe
+    base_data, code = await __read_version(uid, nid, base)
+    if code != const.CodeEnum.OK:
+        return "", code
+    _, base_md = _decode_version(base_data)
+    return _apply_delta(base_md, payload), const.CodeEnum.OK
+
+
+def start_migrate_md_hist() -> asyncio.Task:
+    """Run migrate_md_hist in background, the server does not wait for it"""
+    global __migrate_task
+    __migrate_task = asyncio.create_task(migrate_md_hist())
+    __migrate_task.add_done_callback(__on_migrate_done)
+    return __migrate_task
+
+
+def __on_migrate_done(task: asyncio.Task):
+    if task.cancelled():
+        return
+    e = task.exception()
+    if e is not None:
+        logger.error(f"migrate md history failed: {e}")
+
+
+async def migrate_md_hist():
+    """Rewrite the history saved as full md copies into keyframes and deltas.
+
+    The local history is found from the md/hist/<nid> directories, so the history list of a node
+    restored from the md files is recovered as well. A marker file is left after, so the directories
+    are not scanned again. The remote history is found from the nodes not marked by historyMigrated.
+    The versions saved before a node is migrated are kept, and the legacy versions are read until then.
+    """
     if config.is_local_db():
-        md_dir = __get_md_hist_dir(nid)
-        filename = __windows_safe_path(version)
-        with open(md_dir / f"{filename}.md", "r", encoding="utf-8") as f:
-            md = f.read()
+        hist_dir = __get_md_hist_dir()
+        if not hist_dir.exists():
+            return
+        marker = hist_dir / __MIGRATED_MARKER
+        if marker.exists():
+            return
+        for md_dir in hist_dir.iterdir():
+            if not md_dir.is_dir():
+                continue
+            legacy = sorted(p.stem for p in md_dir.glob("*.md"))
+            if len(legacy) == 0:
+                continue
+            node = await client.coll.nodes.find_one({"id": md_dir.name})
+            if node is None:
+                continue
+            # only ":" in a version is replaced for a windows safe file name
+            legacy = [name.replace("_", ":") for name in legacy]
+            await __migrate_node_hist(node, legacy)
+        marker.touch()
     else:
-        md, code = __get_md_from_cos(uid, nid, version)
-        if code != const.CodeEnum.OK:
-            return "", code
-    return md, const.CodeEnum.OK
+        await client.coll.nodes.update_many(
+            {"historyMigrated": {"$exists": False}, "history": []},
+            {"$set": {"historyMigrated": True, "historyKeyframes": []}},
+        )
+        nodes = await client.coll.nodes.find(
+            {"historyMigrated": {"$exists": False}},
+            projection={"id": 1, "uid": 1, "history": 1, "historyKeyframes": 1},
+        ).to_list(length=None)
+        for node in nodes:
+            # the versions saved by storage_md before the migration are newer than its first keyframe
+            keyframes = node.get("historyKeyframes", [])
+            legacy = [v for v in node["history"] if len(keyframes) == 0 or v < keyframes[-1]]
+            await __migrate_node_hist(node, sorted(legacy))
+
+
+async def __migrate_node_hist(node: tps.Node, legacy: List[str]):
+    nid = node["id"]
+    uid = node["uid"]
+    legacy_set = set(legacy)
+    keep = legacy_set.intersection(node.get("history", []))
+    if len(keep) == 0:
+        # recover the history list from the saved versions
+        keep = set(legacy[::-1][:const.settings.MAX_MD_BACKUP_VERSIONS])
+    new_hist, keyframes = [], []
+    for version in legacy:
+        if version in keep:
+            data, code = await __read_version(uid, nid, version, legacy=True)
+            if code == const.CodeEnum.OK:
+                _, md = _decode_version(data)
+                code = await __add_version(uid, nid, new_hist, keyframes, version, md)
+            if code != const.CodeEnum.OK:
+                logger.error(f"failed to migrate md history: {nid} {version}")
+        # the versions not in the history were left by a removal, they are dropped
+        await __remove_version(uid, nid, version, legacy=True)
+
+    # merged with the versions saved after the node was read, they are in their own keyframe chain
+    node = await client.coll.nodes.find_one({"id": nid})
+    if node is None:
+        return
+    hist = sorted(set(new_hist).union(v for v in node.get("history", []) if v not in legacy_set), reverse=True)
+    keyframes = sorted(
+        set(keyframes).union(k for k in node.get("historyKeyframes", []) if k not in legacy_set), reverse=True,
+    )
+    hist, keyframes = await __drop_old_versions(uid, nid, hist, keyframes)
+    await client.coll.nodes.update_one(
+        {"id": nid},
+        {"$set": {"history": hist, "historyKeyframes": keyframes, "historyMigrated": True}}
+    )
+    logger.debug(f"migrate md history: {nid} {len(hist)} versions, {len(keyframes)} keyframes")
+
+
+async def __add_version(uid: str, nid: str, hist: List[str], keyframes: List[str], version: str, md: str) -> const.CodeEnum:
+    """Save a version as a delta on the latest keyframe, or as a keyframe of the full md.
+
+    A keyframe is saved after every MD_HIST_KEYFRAME_INTERVAL versions, or when the delta is not
+    smaller than the keyframe itself.
+    """
+    full = _encode_keyframe(md)
+    data = full
+    if len(keyframes) != 0 and sum(
+            h > keyframes[0] for h in hist
+    ) + 1 < const.settings.MD_HIST_KEYFRAME_INTERVAL:
+        base_data, code = await __read_version(uid, nid, keyframes[0])
+        if code == const.CodeEnum.OK:
+            _, base_md = _decode_version(base_data)
+            delta = _encode_delta(keyframes[0], base_md, md)
+            if len(delta) < len(full):
+                data = delta
+
+    code = await __write_version(uid, nid, version, data)
+    if code != const.CodeEnum.OK:
+        return code
+    hist.insert(0, version)
+    if data is full:
+        keyframes.insert(0, version)
+    return const.CodeEnum.OK
+
+
+async def __drop_old_versions(
+        uid: str,
+        nid: str,
+        hist: List[str],
+        keyframes: List[str],
+) -> Tuple[List[str], List[str]]:
+    if len(hist) <= const.settings.MAX_MD_BACKUP_VERSIONS:
+        return hist, keyframes
+    hist, drop = hist[:const.settings.MAX_MD_BACKUP_VERSIONS], hist[const.settings.MAX_MD_BACKUP_VERSIONS:]
+    # the keyframe of the oldest kept version is kept even if it is dropped from the history
+    base = max((k for k in keyframes if k <= hist[-1]), default=None)
+    kept = set(hist)
+    kept.add(base)
+    for version in set(drop).union(keyframes).difference(kept):
+        await __remove_version(uid, nid, version)
+    return hist, [k for k in keyframes if k in kept]
+
+
+def _encode_keyframe(md: str) -> bytes:
+    return __HIST_MAGIC + __KEYFRAME + zlib.compress(md.encode("utf-8"))
+
+
+def _encode_delta(base_version: str, base_md: str, md: str) -> bytes:
+    """The lines of md, as the [start, end) line ranges copied from the base md and the inserted text"""
+    a = base_md.splitlines(keepends=True)
+    b = md.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j1 != j2:
+            ops.append("".join(b[j1:j2]))
+    payload = json.dumps({"base": base_version, "ops": ops}, ensure_ascii=False, separators=(",", ":"))
+    return __HIST_MAGIC + __DELTA + zlib.compress(payload.encode("utf-8"))
+
+
+def _decode_version(data: bytes) -> Tuple[Optional[str], Union[str, List]]:
+    """(None, md) of a keyframe, or (base version, delta ops) of a delta"""
+    if not data.startswith(__HIST_MAGIC):
+        # a full md copy saved before the delta history
+        return None, data.decode("utf-8")
+    kind = data[len(__HIST_MAGIC): len(__HIST_MAGIC) + 1]
+    payload = zlib.decompress(data[len(__HIST_MAGIC) + 1:]).decode("utf-8")
+    if kind == __KEYFRAME:
+        return None, payload
+    delta = json.loads(payload)
+    return delta["base"], delta["ops"]
+
+
+def _apply_delta(base_md: str, ops: List) -> str:
+    a = base_md.splitlines(keepends=True)
+    lines = []
+    for op in ops:
+        if isinstance(op, list):
+            lines.extend(a[op[0]:op[1]])
+        else:
+            lines.append(op)
+    return "".join(lines)
+
+
+async def __read_version(uid: str, nid: str, version: str, legacy: bool = False) -> Tuple[bytes, const.CodeEnum]:
+    # a version not migrated yet is still a legacy full md copy
+    suffixes = [".md"] if legacy else [__HIST_SUFFIX, ".md"]
+    if config.is_local_db():
+        for suffix in suffixes:
+            path = __get_md_hist_dir(nid) / f"{__windows_safe_path(version)}{suffix}"
+            try:
+                return path.read_bytes(), const.CodeEnum.OK
+            except FileNotFoundError:
+                pass
+        logger.error(f"md history not found: {nid} {version}")
+        return b"", const.CodeEnum.NODE_NOT_EXIST
+    for suffix in suffixes:
+        data, code = await __get_hist_from_cos(uid, nid, f"{version}{suffix}")
+        if code == const.CodeEnum.OK:
+            break
+    return data, code
+
+
+async def __write_version(uid: str, nid: str, version: str, data: bytes) -> const.CodeEnum:
+    if config.is_local_db():
+        md_dir = __get_md_hist_dir(nid)
+        md_dir.mkdir(parents=True, exist_ok=True)
+        (md_dir / f"{__windows_safe_path(version)}{__HIST_SUFFIX}").write_bytes(data)
+        return const.CodeEnum.OK
+    return await __save_hist_to_cos(uid, nid, f"{version}{__HIST_SUFFIX}", data)
+
+
+async def __remove_version(uid: str, nid: str, version: str, legacy: bool = False):
+    # a version dropped before it is migrated is a legacy one
+    suffixes = [".md"] if legacy else [__HIST_SUFFIX, ".md"]
+    for suffix in suffixes:
+        if config.is_local_db():
+            (__get_md_hist_dir(nid) / f"{__windows_safe_path(version)}{suffix}").unlink(missing_ok=True)
+        else:
+            await __remove_hist_from_cos(uid, nid, f"{version}{suffix}")
 
 
 def __windows_safe_path(filename: str) -> str:
@@ -117,123 +338,33 @@ def __get_md_hist_dir(nid: str = None) -> Path:
     return p
 
 
-def __get_md_from_cos(uid: str, nid: str, version: str) -> Tuple[str, const.CodeEnum]:
-    settings = config.get_settings()
-    cos_client, key = __get_client_and_key(settings, uid, nid, version)
-
-    try:
-        res = cos_client.get_object(
-            Bucket=settings.COS_BUCKET_NAME,
-            Key=key,
-        )
-        md_body = b""
-        while 1:
-            chunk = res["Body"].read()
-            if not chunk:
-                break
-            md_body += chunk
-    except CosServiceError as e:
-        logger.error(f"failed to get file from cos: {e}")
-        return "", const.CodeEnum.COS_ERROR
-    try:
-        md = md_body.decode("utf-8")
-    except UnicodeDecodeError as e:
-        logger.error(f"failed to decode md: {e}. md: {md_body}")
-        return "", const.CodeEnum.OPERATION_FAILED
-    return md, const.CodeEnum.OK
-
-
-def __save_md_to_cos(uid: str, nid: str, version: str, md: str) -> const.CodeEnum:
-    settings = config.get_settings()
-    cos_client, key, code = __cos_connect(settings, uid, nid, version)
+async def __get_hist_from_cos(uid: str, nid: str, name: str) -> Tuple[bytes, const.CodeEnum]:
+    data = await cos_client.async_get_object(key=__get_cos_key(uid, nid, name))
+    if data is None:
+        return b"", const.CodeEnum.COS_ERROR
+    return data, const.CodeEnum.OK
 
-    if code != const.CodeEnum.OK:
-        return code
 
-    # can raise error
-    try:
-        _ = cos_client.put_object(
-            Bucket=settings.COS_BUCKET_NAME,
-            Body=md.encode("utf-8"),
-            Key=key,
-            StorageClass='STANDARD',  # 'STANDARD'|'STANDARD_IA'|'ARCHIVE',
-            EnableMD5=False,
-            ContentType="text/markdown",
-        )
-    except CosServiceError as e:
-        logger.error(f"failed to save file to cos: {e}")
+async def __save_hist_to_cos(uid: str, nid: str, name: str, data: bytes) -> const.CodeEnum:
+    # a version is never rewritten, so it is put without checking its existence first
+    if not await cos_client.async_put_object(key=__get_cos_key(uid, nid, name), data=data):
         return const.CodeEnum.COS_ERROR
     return const.CodeEnum.OK
 
 
-def __remove_md_from_cos(uid: str, nid: str, version: str) -> const.CodeEnum:
-    settings = config.get_settings()
-    cos_client, key, code = __cos_connect(settings, uid, nid, version, exist_ok=False)
-    if code == const.CodeEnum.NODE_EXIST:
-        try:
-            _ = cos_client.delete_object(
-                Bucket=settings.COS_BUCKET_NAME,
-                Key=key
-            )
-        except CosServiceError as e:
-            logger.error(f"failed to delete md from cos: {e}")
-            return const.CodeEnum.COS_ERROR
-
+async def __remove_hist_from_cos(uid: str, nid: str, name: str) -> const.CodeEnum:
+    if not await cos_client.async_delete_object(key=__get_cos_key(uid, nid, name)):
+        return const.CodeEnum.COS_ERROR
     return const.CodeEnum.OK
 
 
-def __remove_md_all_versions_from_cos(uid: str, nid: str) -> const.CodeEnum:
-    settings = config.get_settings()
-    cos_client, to_delete_dir = __get_client_and_key(settings, uid, nid)
-
-    try:
-        _ = cos_client.delete_object(
-            Bucket=settings.COS_BUCKET_NAME,
-            Key=to_delete_dir
-        )
-    except CosServiceError as e:
-        logger.error(f"failed to delete md from cos: {e}")
+async def __remove_md_all_versions_from_cos(uid: str, nid: str) -> const.CodeEnum:
+    if not await cos_client.async_delete_object(key=__get_cos_key(uid, nid)):
         return const.CodeEnum.COS_ERROR
-
     return const.CodeEnum.OK
 
 
-def __cos_connect(
-        settings: BaseSettings,
-        uid: str,
-        nid: str,
-        version: str,
-        exist_ok: bool = False,
-) -> Tuple["CosS3Client", str, const.CodeEnum]:
-    cos_client, key = __get_client_and_key(settings, uid, nid, version)
-
-    if not exist_ok:
-        try:
-            _ = cos_client.head_object(
-                Bucket=settings.COS_BUCKET_NAME,
-                Key=key
-            )
-            return cos_client, key, const.CodeEnum.NODE_EXIST
-        except CosServiceError as e:
-            if e.get_status_code() != 404:
-                logger.error(f"failed to save md to cos: {e}")
-                return cos_client, key, const.CodeEnum.COS_ERROR
-    return cos_client, key, const.CodeEnum.OK
-
-
-def __get_client_and_key(settings: BaseSettings, uid: str, nid: str, version: str = None) -> Tuple["CosS3Client", str]:
-    cos_client = CosS3Client(
-        CosConfig(
-            Region=settings.COS_REGION,
-            SecretId=settings.COS_SECRET_ID,
-            SecretKey=settings.COS_SECRET_KEY,
-            Token=None,
-            Domain=settings.COS_DOMAIN,
-            Scheme='https',
-        )
-    )
-    if version:
-        key = f"mdHist/{uid}/{nid}/{version}.md"
-    else:
-        key = f"mdHist/{uid}/{nid}/"
-    return cos_client, key
+def __get_cos_key(uid: str, nid: str, name: str = None) -> str:
+    if name:
+        return f"mdHist/{uid}/{nid}/{name}"
+    return f"mdHist/{uid}/{nid}/"
@@ -0,0 +1,254 @@
+import asyncio
+import heapq
+import time
+from array import array
+from collections import OrderedDict as _OrderedDict
+from typing import List, Dict, Optional, Callable, Literal, Tuple, OrderedDict, Iterable
+
+from retk import config, const
+from retk.models import tps
+from retk.models.client import client
+
+Direction = Literal["out", "in", "both"]
+
+
+class LinkGraph:
+    """The @link graph of one user's nodes.
+
+    Nodes are numbered by int ids, each has the int arrays of its forward and back links,
+    so the neighbours of a node are visited in O(degree). A node in trash or disabled
+    stays in the graph but it is not visible to the queries.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._nids: List[str] = []
+        self._out: List[array] = []
+        self._in: List[array] = []
+        self._visible = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._nids)
+
+    def _id(self, nid: str) -> int:
+        i = self._ids.get(nid)
+        if i is None:
+            # a linked node may not exist, it is added invisible
+            i = len(self._nids)
+            self._ids[nid] = i
+            self._nids.append(nid)
+            self._out.append(array("I"))
+            self._in.append(array("I"))
+            self._visible.append(0)
+        return i
+
+    def set_visible(self, nid: str, visible: bool):
+        self._visible[self._id(nid)] = visible
+
+    def set_links(self, nid: str, to_nids: Iterable[str]):
+        i = self._id(nid)
+        new = {self._id(to_nid) for to_nid in to_nids}
+        old = set(self._out[i])
+        for j in old.difference(new):
+            self._in[j].remove(i)
+        for j in new.difference(old):
+            self._in[j].append(i)
+        self._out[i] = array("I", new)
+
+    def add_link(self, from_nid: str, to_nid: str):
+        i, j = self._id(from_nid), self._id(to_nid)
+        if j not in self._out[i]:
+            self._out[i].append(j)
+            self._in[j].append(i)
+
+    def remove(self, nid: str):
+        i = self._ids.get(nid)
+        if i is None:
+            return
+        # the back links are kept, the md of those nodes still links to it
+        self.set_links(nid, [])
+        self._visible[i] = 0
+
+    def degree(self, nid: str, direction: Direction = "out") -> int:
+        i = self._ids.get(nid)
+        if i is None:
+            return 0
+        return sum(len(adj[i]) for adj in self._adjacency(direction))
+
+    def _adjacency(self, direction: Direction) -> List[List[array]]:
+        if direction == "out":
+            return [self._out]
+        if direction == "in":
+            return [self._in]
+        return [self._out, self._in]
+
+    def degree_ranking(self, limit: int, direction: Direction = "out") -> List[Tuple[str, int]]:
+        adjacency = self._adjacency(direction)
+        degrees = (
+            (sum(len(adj[i]) for adj in adjacency), i)
+            for i in range(len(self._nids)) if self._visible[i]
+        )
+        # the later added node first in a tie, as the newest first order of the node list
+        return [(self._nids[i], d) for d, i in heapq.nlargest(limit, degrees)]
+
+    def neighbourhood(self, nid: str, hops: int = 1, direction: Direction = "both") -> Dict[str, int]:
+        """The visible nodes within the hops, mapped to their distance"""
+        start = self._ids.get(nid)
+        if start is None:
+            return {}
+        adjacency = self._adjacency(direction)
+        dist = {start: 0}
+        frontier = [start]
+        for hop in range(1, hops + 1):
+            next_frontier = []
+            for i in frontier:
+                for adj in adjacency:
+                    for j in adj[i]:
+                        if j not in dist and self._visible[j]:
+                            dist[j] = hop
+                            next_frontier.append(j)
+            frontier = next_frontier
+        del dist[start]
+        return {self._nids[i]: d for i, d in dist.items()}
+
+    def orphans(self) -> List[str]:
+        """The visible nodes without any visible link"""
+        orphans = []
+        for i, nid in enumerate(self._nids):
+            if not self._visible[i]:
+                continue
+            if any(self._visible[j] for j in self._out[i]) or any(self._visible[j] for j in self._in[i]):
+                continue
+            orphans.append(nid)
+        return orphans
+
+
+class _Entry:
+    def __init__(self):
+        self.graph: Optional[LinkGraph] = None
+        self.built_at = 0.
+        self.ready = asyncio.Event()
+        # changes made while the graph is being built, replayed after it
+        self.pending: Optional[List[Callable[[LinkGraph], None]]] = []
+
+
+# uid -> graph, the least recently used is dropped first
+__graphs: OrderedDict[str, _Entry] = _OrderedDict()
+
+
+async def get(uid: str) -> LinkGraph:
+    """The graph is built from the nodes collection when it is first asked.
+
+    It is only a cache of this process, it is rebuilt after LINK_GRAPH_TTL so the nodes
+    changed by other processes (e.g. the importing process) are seen eventually.
+    """
+    e = __graphs.get(uid)
+    if e is not None and (e.graph is None or time.monotonic() - e.built_at < const.settings.LINK_GRAPH_TTL):
+        __graphs.move_to_end(uid)
+        await e.ready.wait()
+        if e.graph is None:
+            # the build failed
+            return await get(uid)
+        return e.graph
+
+    e = _Entry()
+    __graphs[uid] = e
+    __graphs.move_to_end(uid)
+    if len(__graphs) > const.settings.MAX_LINK_GRAPHS:
+        __graphs.popitem(last=False)
+    try:
+        c = {"uid": uid}
+        if not config.is_local_db():
+            docs = await client.coll.nodes.find(
+                c, projection={"id": 1, "toNodeIds": 1, "inTrash": 1, "disabled": 1},
+            ).sort("_id", 1).to_list(length=None)
+        else:
+            # local db not support projection
+            docs = await client.coll.nodes.find(c).sort("_id", 1).to_list(length=None)
+        g = LinkGraph()
+        # the ids are given in the _id order first, so a tie in degree_ranking is the newer first as in the db
+        for doc in docs:
+            g.set_visible(doc["id"], not doc["inTrash"] and not doc["disabled"])
+        for doc in docs:
+            g.set_links(doc["id"], doc["toNodeIds"])
+        for op in e.pending:
+            op(g)
+    except Exception:
+        if __graphs.get(uid) is e:
+            del __graphs[uid]
+        raise
+    finally:
+        e.ready.set()
+    e.pending = None
+    e.graph = g
+    e.built_at = time.monotonic()
+    return g
+
+
+def _apply(uid: str, op: Callable[[LinkGraph], None]):
+    e = __graphs.get(uid)
+    if e is None:
+        # not built yet, it will be read from the db
+        return
+    if e.pending is not None:
+        e.pending.append(op)
+    else:
+        op(e.graph)
+
+
+def invalidate(uid: str):
+    __graphs.pop(uid, None)
+
+
+def on_post(uid: str, nid: str, to_nids: List[str], from_nid: str = ""):
+    def op(g: LinkGraph):
+        g.set_visible(nid, True)
+        g.set_links(nid, to_nids)
+        if from_nid != "":
+            g.add_link(from_nid, nid)
+
+    _apply(uid, op)
+
+
+def on_links_changed(uid: str, nid: str, to_nids: List[str]):
+    _apply(uid, lambda g: g.set_links(nid, to_nids))
+
+
+def on_visible_changed(uid: str, nids: List[str], visible: bool):
+    def op(g: LinkGraph):
+        for nid in nids:
+            g.set_visible(nid, visible)
+
+    _apply(uid, op)
+
+
+def on_deleted(uid: str, nids: List[str]):
+    def op(g: LinkGraph):
+        for nid in nids:
+            g.remove(nid)
+
+    _apply(uid, op)
+
+
+async def degree_ranking(
+        au: tps.AuthedUser,
+        limit: int = 10,
+        direction: Direction = "out",
+) -> List[Tuple[str, int]]:
+    g = await get(au.u.id)
+    return g.degree_ranking(limit=limit, direction=direction)
+
+
+async def neighbourhood(
+        au: tps.AuthedUser,
+        nid: str,
+        hops: int = 1,
+        direction: Direction = "both",
+) -> Dict[str, int]:
+    g = await get(au.u.id)
+    return g.neighbourhood(nid=nid, hops=hops, direction=direction)
+
+
+async def orphans(au: tps.AuthedUser) -> List[str]:
+    g = await get(au.u.id)
+    return g.orphans()
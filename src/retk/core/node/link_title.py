@@ -0,0 +1,176 @@
+import asyncio
+import datetime
+import re
+from collections import OrderedDict as _OrderedDict
+from dataclasses import dataclass
+from typing import List, Tuple, Optional, Dict, OrderedDict
+
+from bson.tz_util import utc
+from pymongo import UpdateOne
+
+from retk import config, const, utils
+from retk.core import user
+from retk.logger import logger
+from retk.models import tps
+from retk.models.client import client
+from retk.models.search_engine.engine import SearchDoc
+from . import backup
+
+
+@dataclass
+class LinkTitleProgress:
+    nid: str
+    title: str
+    total: int
+    done: int = 0
+    running: bool = True
+    code: const.CodeEnum = const.CodeEnum.OK
+
+
+# nid of the renamed node -> progress, the oldest is dropped first
+__progress: OrderedDict[str, LinkTitleProgress] = _OrderedDict()
+__tasks: Dict[str, asyncio.Task] = {}
+
+
+def start(au: tps.AuthedUser, nid: str, title: str, from_nids: List[str]) -> LinkTitleProgress:
+    """Rewrite the links to the renamed node in background.
+
+    Args:
+        au:
+        nid: the renamed node
+        title: the new title
+        from_nids: the nodes linking to the renamed node
+
+    Returns:
+        LinkTitleProgress: updated while the task is running
+    """
+    last = __tasks.pop(nid, None)
+    if last is not None and not last.done():
+        # all links are rewritten to the newest title anyway
+        last.cancel()
+
+    progress = LinkTitleProgress(nid=nid, title=title, total=len(from_nids))
+    __progress.pop(nid, None)
+    __progress[nid] = progress
+    if len(__progress) > const.settings.MAX_LINK_TITLE_PROGRESS_LEN:
+        __progress.popitem(last=False)
+
+    task = asyncio.create_task(propagate(au=au, nid=nid, title=title, from_nids=from_nids, progress=progress))
+    __tasks[nid] = task
+    task.add_done_callback(lambda t: __tasks.pop(nid) if __tasks.get(nid) is t else None)
+    return progress
+
+
+def get_progress(nid: str) -> Optional[LinkTitleProgress]:
+    return __progress.get(nid)
+
+
+async def wait(nid: str):
+    task = __tasks.get(nid)
+    if task is not None:
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def propagate(
+        au: tps.AuthedUser,
+        nid: str,
+        title: str,
+        from_nids: List[str],
+        progress: Optional[LinkTitleProgress] = None,
+) -> const.CodeEnum:
+    if progress is None:
+        progress = LinkTitleProgress(nid=nid, title=title, total=len(from_nids))
+    pattern = utils.get_at_node_md_link_pattern(nid)
+    updated = []
+    try:
+        for i in range(0, len(from_nids), const.settings.LINK_TITLE_BATCH_SIZE):
+            nids = from_nids[i: i + const.settings.LINK_TITLE_BATCH_SIZE]
+            nodes, code = await _rewrite_batch(au=au, nids=nids, nid=nid, title=title, pattern=pattern)
+            if code != const.CodeEnum.OK:
+                progress.code = code
+                logger.error(f"rewrite links to {nid} failed, code: {code}")
+            updated.extend(nodes)
+            progress.done += len(nids)
+
+        # the history is the slowest part, it is written after all links are rewritten
+        for n in updated:
+            code = await backup.storage_md(node=n, keep_hist=True)
+            if code != const.CodeEnum.OK:
+                logger.error(f"backup node {n['id']} failed, code: {code}")
+    finally:
+        progress.running = False
+    return progress.code
+
+
+async def _rewrite_batch(
+        au: tps.AuthedUser,
+        nids: List[str],
+        nid: str,
+        title: str,
+        pattern: re.Pattern,
+        retry: int = 1,
+) -> Tuple[List[tps.Node], const.CodeEnum]:
+    docs = await client.coll.nodes.find({"uid": au.u.id, "id": {"$in": nids}}).to_list(length=None)
+    now = datetime.datetime.now(tz=utc)
+    changes: List[Tuple[tps.Node, dict, str]] = []
+    for doc in docs:
+        new_md = utils.change_link_title(md=doc["md"], nid=nid, new_title=title, pattern=pattern)
+        if new_md == doc["md"]:
+            continue
+        new_title, body, snippet = await utils.preprocess_md_async(new_md)
+        changes.append((doc, {"md": new_md, "title": new_title, "snippet": snippet, "modifiedAt": now}, body))
+    if len(changes) == 0:
+        return [], const.CodeEnum.OK
+
+    # the md is in the filter, a note edited after it was read is not overwritten
+    if config.is_local_db():
+        written = set()
+        for doc, data, _ in changes:
+            res = await client.coll.nodes.update_one({"id": doc["id"], "md": doc["md"]}, {"$set": data})
+            if res.modified_count == 1:
+                written.add(doc["id"])
+    else:
+        res = await client.coll.nodes.bulk_write([
+            UpdateOne({"id": doc["id"], "md": doc["md"]}, {"$set": data}) for doc, data, _ in changes
+        ], ordered=False)
+        if res.modified_count == len(changes):
+            written = {doc["id"] for doc, _, _ in changes}
+        else:
+            written = set(await client.coll.nodes.distinct(
+                "id", {"id": {"$in": [doc["id"] for doc, _, _ in changes]}, "modifiedAt": now},
+            ))
+
+    nodes = []
+    search_docs = []
+    space_delta = 0
+    for doc, data, body in changes:
+        if doc["id"] not in written:
+            continue
+        n = {**doc, **data}
+        nodes.append(n)
+        space_delta += len(data["md"].encode("utf-8")) - len(doc["md"].encode("utf-8"))
+        if n["type"] == const.NodeTypeEnum.MARKDOWN.value:
+            search_docs.append(SearchDoc(nid=n["id"], title=n["title"], body=body))
+        if n["title"] != doc["title"] and len(n["fromNodeIds"]) > 0:
+            # the link is in its title line, the links to it change as well
+            start(au=au, nid=n["id"], title=n["title"], from_nids=n["fromNodeIds"])
+
+    await user.update_used_space(uid=au.u.id, delta=space_delta)
+    code = const.CodeEnum.OK
+    if len(search_docs) > 0:
+        code = await client.search.update_batch(au=au, docs=search_docs)
+        if code != const.CodeEnum.OK:
+            logger.error(f"update search index failed, code: {code}")
+
+    edited = [doc["id"] for doc, _, _ in changes if doc["id"] not in written]
+    if len(edited) > 0 and retry > 0:
+        retried, retry_code = await _rewrite_batch(
+            au=au, nids=edited, nid=nid, title=title, pattern=pattern, retry=retry - 1,
+        )
+        nodes.extend(retried)
+        if retry_code != const.CodeEnum.OK:
+            code = retry_code
+    elif len(edited) > 0:
+        logger.error(f"rewrite links to {nid} failed, nodes are being edited: {edited}")
+        code = const.CodeEnum.OPERATION_FAILED
+    return nodes, code
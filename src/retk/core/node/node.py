@@ -1,8 +1,9 @@
-import copy
+import asyncio
 import datetime
+import hashlib
 import urllib.parse
 from io import BytesIO
-from typing import List, Optional, Tuple, Dict, Any, Literal
+from typing import List, Optional, Tuple, Dict, Any, Literal, Sequence
 
 from bson import ObjectId
 from bson.tz_util import utc
@@ -15,7 +16,11 @@ from retk.logger import logger
 from retk.models import tps, db_ops
 from retk.models.client import client
 from retk.models.search_engine.engine import SearchDoc
-from . import backup, node_utils
+from . import backup, node_utils, link_title, graph, outbox
+
+# modifiedAt, and the fields of a node response that change without changing modifiedAt
+_ETAG_FIELDS = ["modifiedAt", "disabled", "favorite", "summary", "fromNodeIds", "toNodeIds"]
+_LINKED_ETAG_PROJECTION = {"id": 1, "modifiedAt": 1, "inTrash": 1, "disabled": 1}
 
 
 @plugins.handler.on_node_added
@@ -33,7 +38,7 @@ async def post(
     if await user.user_space_not_enough(au=au):
         return None, const.CodeEnum.USER_SPACE_NOT_ENOUGH
 
-    title, body, snippet = utils.preprocess_md(md)
+    title, body, snippet = await utils.preprocess_md_async(md)
 
     nid = utils.short_uuid()
 
@@ -72,17 +77,81 @@ async def post(
         return None, const.CodeEnum.OPERATION_FAILED
 
     await user.update_used_space(uid=au.u.id, delta=new_size)
+    graph.on_post(uid=au.u.id, nid=nid, to_nids=new_to_node_ids, from_nid=from_nid)
+
+    code = await outbox.enqueue(
+        au=au,
+        node=data,
+        search_add=True,
+        extend=True,
+        search_doc=SearchDoc(nid=nid, title=title, body=body),
+    )
+    return data, code
+
+
+@plugins.handler.on_nodes_added
+async def post_batch(
+        au: tps.AuthedUser,
+        mds: List[str],
+        type_: int = const.NodeTypeEnum.MARKDOWN.value,
+) -> Tuple[List[tps.Node], const.CodeEnum]:
+    """post many nodes at once, each kind of write is done once for all of them"""
+    mds = [md.strip() for md in mds]
+    if any(len(md) > const.settings.MD_MAX_LENGTH for md in mds):
+        return [], const.CodeEnum.NOTE_EXCEED_MAX_LENGTH
+    if len(mds) == 0:
+        return [], const.CodeEnum.OK
+    if await user.user_space_not_enough(au=au):
+        return [], const.CodeEnum.USER_SPACE_NOT_ENOUGH
 
-    code = await backup.storage_md(node=data, keep_hist=False)
+    preprocessed = await asyncio.gather(*[utils.preprocess_md_async(md) for md in mds])
+    modified_at = datetime.datetime.now(tz=utc)
+    nodes = []
+    for md, (title, _, snippet) in zip(mds, preprocessed):
+        to_nids, code = node_utils.get_linked_nodes(new_md=md)
+        if code != const.CodeEnum.OK:
+            return [], code
+        nodes.append(utils.get_node_dict(
+            _id=ObjectId(),
+            nid=utils.short_uuid(),
+            uid=au.u.id,
+            md=md,
+            title=title,
+            snippet=snippet,
+            type_=type_,
+            disabled=False,
+            in_trash=False,
+            modified_at=modified_at,
+            in_trash_at=None,
+            from_node_ids=[],
+            to_node_ids=list(to_nids),
+            history=[],
+        ))
+
+    res = await client.coll.nodes.insert_many(nodes)
+    if not res.acknowledged:
+        return [], const.CodeEnum.OPERATION_FAILED
+    for n in nodes:
+        # the backlinks, only the nodes with links have them
+        if len(n["toNodeIds"]) > 0:
+            await db_ops.nodes_add_to_set(ids=n["toNodeIds"], key="fromNodeIds", value=n["id"])
+        graph.on_post(uid=au.u.id, nid=n["id"], to_nids=n["toNodeIds"])
+
+    await user.update_used_space(uid=au.u.id, delta=sum(len(md.encode("utf-8")) for md in mds))
+
+    code = await backup.storage_md_batch(nodes=nodes)
     if code != const.CodeEnum.OK:
-        return data, code
+        return nodes, code
 
     if type_ == const.NodeTypeEnum.MARKDOWN.value:
-        code = await client.search.add(au=au, doc=SearchDoc(nid=nid, title=title, body=body))
+        code = await client.search.add_batch(au=au, docs=[
+            SearchDoc(nid=n["id"], title=title, body=body)
+            for n, (title, body, _) in zip(nodes, preprocessed)
+        ])
         if code != const.CodeEnum.OK:
             logger.error(f"add search index failed, code: {code}")
-    await ai.llm.knowledge.extend_on_node_post(data=data)
-    return data, const.CodeEnum.OK
+    await ai.llm.knowledge.extend_on_nodes_post(data=nodes)
+    return nodes, const.CodeEnum.OK
 
 
 async def get(
@@ -90,12 +159,16 @@ async def get(
         nid: str,
         with_disabled: bool = False,
         in_trash: bool = False,
+        fields: Optional[Sequence[str]] = None,
+        with_links: bool = True,
 ) -> Tuple[Optional[tps.Node], const.CodeEnum]:
     docs, code = await get_batch(
         au=au,
         nids=[nid],
         with_disabled=with_disabled,
         in_trash=in_trash,
+        fields=fields,
+        with_links=with_links,
     )
     return docs[0] if len(docs) > 0 else None, code
 
@@ -105,7 +178,23 @@ async def get_batch(
         nids: List[str],
         with_disabled: bool = False,
         in_trash: bool = False,
+        fields: Optional[Sequence[str]] = None,
+        with_links: bool = True,
 ) -> Tuple[List[tps.Node], const.CodeEnum]:
+    """
+
+    Args:
+        au:
+        nids:
+        with_disabled:
+        in_trash:
+        fields: only these fields (and "id") of the nodes are returned, all fields if None
+        with_links: set the linked nodes to "fromNodes" and "toNodes",
+            it needs "fromNodeIds" and "toNodeIds" in the fields
+
+    Returns:
+        Tuple[List[tps.Node], const.CodeEnum]: nodes, code
+    """
     for nid in nids:
         if regex.NID.match(nid) is None:
             logger.error(f"invalid nid: {nid}")
@@ -117,18 +206,68 @@ async def get_batch(
         c["id"] = nids[0]
     if not with_disabled:
         c["disabled"] = False
-    docs = await client.coll.nodes.find(c).to_list(length=None)
+    if fields is None:
+        docs = await client.coll.nodes.find(c).to_list(length=None)
+    else:
+        projection = {"_id": 1, "id": 1, **{f: 1 for f in fields}}
+        if with_links:
+            projection.update({"fromNodeIds": 1, "toNodeIds": 1})
+        if not config.is_local_db():
+            docs = await client.coll.nodes.find(c, projection=projection).to_list(length=None)
+        else:
+            # local db not support projection
+            docs = [
+                {k: v for k, v in doc.items() if k in projection}
+                for doc in await client.coll.nodes.find(c).to_list(length=None)
+            ]
     if len(docs) != len(nids):
         logger.error(f"rid: '{au.request_id}' | uid: '{au.u.id}' | docs len != nids len: {nids}")
         return [], const.CodeEnum.NODE_NOT_EXIST
 
-    await node_utils.set_linked_nodes(
-        docs=docs,
-        with_disabled=with_disabled,
-    )
+    if with_links:
+        await node_utils.set_linked_nodes(
+            docs=docs,
+            with_disabled=with_disabled,
+        )
     return docs, const.CodeEnum.OK
 
 
+async def get_etag(
+        au: tps.AuthedUser,
+        nid: str,
+) -> Tuple[str, const.CodeEnum]:
+    """A strong ETag of the node and its linked nodes, it changes when the node data of get() changes.
+    Only the version fields are read, the md of the node and linked nodes are not.
+
+    Args:
+        au:
+        nid:
+
+    Returns:
+        Tuple[str, const.CodeEnum]: etag, code
+    """
+    if regex.NID.match(nid) is None:
+        return "", const.CodeEnum.NODE_NOT_EXIST
+    docs, code = await get_batch(au=au, nids=[nid], fields=_ETAG_FIELDS, with_links=False)
+    if code != const.CodeEnum.OK:
+        return "", code
+    n = docs[0]
+    linked_nids = list(set(n["fromNodeIds"] + n["toNodeIds"]))
+    linked = []
+    if len(linked_nids) > 0:
+        c = {"id": {"$in": linked_nids}, "disabled": False}
+        if not config.is_local_db():
+            linked = await client.coll.nodes.find(c, projection=_LINKED_ETAG_PROJECTION).to_list(length=None)
+        else:
+            # local db not support projection
+            linked = await client.coll.nodes.find(c).to_list(length=None)
+    h = hashlib.sha1()
+    h.update(repr([n.get(k) for k in _ETAG_FIELDS]).encode("utf-8"))
+    for ln in sorted(linked, key=lambda x: x["id"]):
+        h.update(repr([ln.get(k) for k in _LINKED_ETAG_PROJECTION]).encode("utf-8"))
+    return f'"{h.hexdigest()}"', const.CodeEnum.OK
+
+
 @plugins.handler.on_node_updated
 @plugins.handler.before_node_updated
 async def update_md(
@@ -156,13 +295,15 @@ async def update_md(
     if await user.user_space_not_enough(au=au):
         return None, None, const.CodeEnum.USER_SPACE_NOT_ENOUGH
 
-    title, body, snippet = utils.preprocess_md(md)
+    title, body, snippet = await utils.preprocess_md_async(md)
 
-    n, code = await get(au=au, nid=nid)
+    # the old node is not changed below, and its linked nodes are only needed when it is returned as is
+    n, code = await get(au=au, nid=nid, with_links=False)
     if code != const.CodeEnum.OK:
         return None, None, code
-    old_n = copy.deepcopy(n)
+    old_n = n
     if n["md"] == md and not refresh_on_same_md:
+        await node_utils.set_linked_nodes(docs=[n], with_disabled=False)
         return n, old_n, const.CodeEnum.OK
 
     old_md_size = len(n["md"].encode("utf-8"))
@@ -171,13 +312,9 @@ async def update_md(
     }
 
     if n["title"] != title:
-        # update it's title in fromNodes md's link
-        from_nodes = await client.coll.nodes.find({"id": {"$in": n["fromNodeIds"]}}).to_list(length=None)
-        for from_node in from_nodes:
-            new_md = utils.change_link_title(md=from_node["md"], nid=nid, new_title=title)
-            n, old_n, code = await update_md(au=au, nid=from_node["id"], md=new_md)
-            if code != const.CodeEnum.OK:
-                logger.error(f"update fromNode {from_node['id']} failed")
+        # update it's title in fromNodes md's link, in background
+        if len(n["fromNodeIds"]) > 0:
+            link_title.start(au=au, nid=nid, title=title, from_nids=n["fromNodeIds"])
         new_data["title"] = title
 
     if n["md"] != md:
@@ -189,6 +326,7 @@ async def update_md(
         nid=n["id"], orig_to_nid=n["toNodeIds"], new_md=md)
     if code != const.CodeEnum.OK:
         return None, old_n, code
+    new_data["toNodeIdsLen"] = len(new_data["toNodeIds"])
 
     if not config.is_local_db():
         doc = await client.coll.nodes.find_one_and_update(
@@ -209,6 +347,7 @@ async def update_md(
 
     if doc is None:
         return None, old_n, const.CodeEnum.NODE_NOT_EXIST
+    graph.on_links_changed(uid=au.u.id, nid=nid, to_nids=doc["toNodeIds"])
     await node_utils.set_linked_nodes(
         docs=[doc],
         with_disabled=False,
@@ -216,16 +355,14 @@ async def update_md(
 
     await user.update_used_space(uid=au.u.id, delta=len(md.encode("utf-8")) - old_md_size)
 
-    if doc["type"] == const.NodeTypeEnum.MARKDOWN.value:
-        code = await client.search.update(au=au, doc=SearchDoc(nid=nid, title=title, body=body))
-        if code != const.CodeEnum.OK:
-            logger.error(f"update search index failed, code: {code}")
-
-    code = await backup.storage_md(node=doc, keep_hist=True)
-    if code != const.CodeEnum.OK:
-        return doc, old_n, code
-
-    await ai.llm.knowledge.extend_on_node_update(old_data=old_n, new_data=doc)
+    code = await outbox.enqueue(
+        au=au,
+        node=doc,
+        search_update=True,
+        hist=True,
+        extend=ai.llm.knowledge.should_extend_on_update(old_data=old_n, new_data=doc),
+        search_doc=SearchDoc(nid=nid, title=title, body=body),
+    )
     return doc, old_n, code
 
 
@@ -239,18 +376,59 @@ async def set_favorite(au: tps.AuthedUser, nid: str, favorite: bool) -> const.Co
     return const.CodeEnum.OK
 
 
-async def get_favorite(au: tps.AuthedUser, page: int, limit: int) -> Tuple[List[tps.Node], int]:
+async def get_favorite(
+        au: tps.AuthedUser,
+        page: int,
+        limit: int,
+        cursor: str = "",
+        with_total: bool = True,
+) -> Tuple[List[tps.Node], int, str]:
+    """
+
+    Args:
+        au:
+        page: ignored when cursor is given
+        limit:
+        cursor: the next cursor of the previous page
+        with_total: count the total, -1 is returned for total if False
+
+    Returns:
+        Tuple[List[tps.Node], int, str]: nodes, total, next cursor
+    """
     condition = {
         "uid": au.u.id,
         "disabled": False,
         "inTrash": False,  # "inTrash": False, "inTrashAt": None,
         "favorite": True,
     }
-    docs = client.coll.nodes.find(condition).sort([("modifiedAt", -1), ("_id", -1)])
-    total = await client.coll.nodes.count_documents(condition)
-    if limit > 0:
-        docs = docs.skip(page * limit).limit(limit)
-    return await docs.to_list(length=None), total
+    return await _find_page(
+        condition=condition,
+        sort=db_ops.FAVORITE_NODES_SORT,
+        page=page,
+        limit=limit,
+        cursor=cursor,
+        with_total=with_total,
+    )
+
+
+async def _find_page(
+        condition: dict,
+        sort: db_ops.Sort,
+        page: int,
+        limit: int,
+        cursor: str,
+        with_total: bool,
+) -> Tuple[List[tps.Node], int, str]:
+    docs = await db_ops.find_page(
+        coll=client.coll.nodes,
+        condition=condition,
+        sort=sort,
+        limit=limit,
+        page=page,
+        cursor=cursor,
+    ).to_list(length=None)
+    total = await client.coll.nodes.count_documents(condition) if with_total else -1
+    return docs, total, db_ops.next_page_cursor(docs=docs, sort=sort, limit=limit)
 
 
 async def to_trash(au: tps.AuthedUser, nid: str) -> const.CodeEnum:
@@ -258,7 +436,7 @@ async def to_trash(au: tps.AuthedUser, nid: str) -> const.CodeEnum:
 
 
 async def batch_to_trash(au: tps.AuthedUser, nids: List[str]) -> const.CodeEnum:
-    ns, code = await get_batch(au=au, nids=nids, with_disabled=True, in_trash=False)
+    ns, code = await get_batch(au=au, nids=nids, with_disabled=True, in_trash=False, fields=["id"], with_links=False)
     if code != const.CodeEnum.OK:
         return code
 
@@ -284,6 +462,7 @@ async def batch_to_trash(au: tps.AuthedUser, nids: List[str]) -> const.CodeEnum:
     if res.modified_count != len(nids):
         logger.error(f"update nodes {nids} failed")
         return const.CodeEnum.OPERATION_FAILED
+    graph.on_visible_changed(uid=au.u.id, nids=nids, visible=False)
 
     code = await client.search.batch_to_trash(au=au, nids=nids)
     if code != const.CodeEnum.OK:
@@ -294,19 +473,23 @@ async def batch_to_trash(au: tps.AuthedUser, nids: List[str]) -> const.CodeEnum:
 async def get_nodes_in_trash(
         au: tps.AuthedUser,
         page: int,
-        limit: int
-) -> Tuple[List[tps.Node], int]:
+        limit: int,
+        cursor: str = "",
+        with_total: bool = True,
+) -> Tuple[List[tps.Node], int, str]:
     condition = {
         "uid": au.u.id,
         "disabled": False,
         "inTrash": True,
     }
-    docs = client.coll.nodes.find(condition).sort([("inTrashAt", -1), ("_id", -1)])
-    total = await client.coll.nodes.count_documents(condition)
-    if limit > 0:
-        docs = docs.skip(page * limit).limit(limit)
-
-    return await docs.to_list(length=None), total
+    return await _find_page(
+        condition=condition,
+        sort=db_ops.TRASH_NODES_SORT,
+        page=page,
+        limit=limit,
+        cursor=cursor,
+        with_total=with_total,
+    )
 
 
 async def restore_from_trash(au: tps.AuthedUser, nid: str) -> const.CodeEnum:
@@ -322,6 +505,7 @@ async def restore_batch_from_trash(au: tps.AuthedUser, nids: List[str]) -> const
     if res.modified_count != len(nids):
         logger.error(f"restore nodes {nids} failed")
         return const.CodeEnum.OPERATION_FAILED
+    graph.on_visible_changed(uid=au.u.id, nids=nids, visible=True)
 
     code = await client.search.restore_batch_from_trash(au=au, nids=nids)
     if code != const.CodeEnum.OK:
@@ -334,7 +518,9 @@ async def delete(au: tps.AuthedUser, nid: str) -> const.CodeEnum:
 
 
 async def batch_delete(au: tps.AuthedUser, nids: List[str]) -> const.CodeEnum:
-    ns, code = await get_batch(au=au, nids=nids, with_disabled=True, in_trash=True)
+    ns, code = await get_batch(
+        au=au, nids=nids, with_disabled=True, in_trash=True, fields=["md", "toNodeIds"], with_links=False,
+    )
     if code != const.CodeEnum.OK:
         return code
 
@@ -347,8 +533,8 @@ async def batch_delete(au: tps.AuthedUser, nids: List[str]) -> const.CodeEnum:
     # remove toNodes for linked nodes
     for n in ns:
         used_space_delta -= len(n["md"].encode("utf-8"))
-        for linked_nid in n["toNodeIds"]:
-            await db_ops.remove_from_node(from_nid=n["id"], to_nid=linked_nid)
+        if len(n["toNodeIds"]) > 0:
+            await db_ops.nodes_pull(ids=n["toNodeIds"], key="fromNodeIds", value=n["id"])
 
     # delete user file
     await user.update_used_space(uid=au.u.id, delta=used_space_delta)
@@ -358,8 +544,9 @@ async def batch_delete(au: tps.AuthedUser, nids: List[str]) -> const.CodeEnum:
     if res.deleted_count != len(nids):
         logger.error(f"delete nodes {nids} failed")
         return const.CodeEnum.OPERATION_FAILED
+    graph.on_deleted(uid=au.u.id, nids=nids)
 
-    backup.delete_node_md(uid=au.u.id, nids=nids)
+    await backup.delete_node_md(uid=au.u.id, nids=nids)
 
     code = await client.search.delete_batch(au=au, nids=nids)
     if code != const.CodeEnum.OK:
@@ -381,6 +568,7 @@ async def disable(
     if res.modified_count != 1:
         logger.error(f"disable node {nid} failed")
         return const.CodeEnum.OPERATION_FAILED
+    graph.on_visible_changed(uid=au.u.id, nids=[nid], visible=False)
     code = await client.search.disable(au=au, nid=nid)
     if code != const.CodeEnum.OK:
         logger.error(f"disable search index failed, code: {code}")
@@ -391,16 +579,23 @@ async def core_nodes(
         au: tps.AuthedUser,
         page: int,
         limit: int,
-) -> Tuple[List[tps.Node], int]:
+        cursor: str = "",
+        with_total: bool = True,
+) -> Tuple[List[tps.Node], int, str]:
     condition = {
         "uid": au.u.id,
-        "disabled": False,
         "inTrash": False,
+        "disabled": False,
     }
-    # the key of toNodeIds is a list, sort by the toNodeIds length, from large to small
-    docs = db_ops.sort_nodes_by_to_nids(condition=condition, page=page, limit=limit)
-    total = await client.coll.nodes.count_documents(condition)
-    return await docs.to_list(length=None), total
+    # sort by the toNodeIds length, from large to small
+    return await _find_page(
+        condition=condition,
+        sort=db_ops.CORE_NODES_SORT,
+        page=page,
+        limit=limit,
+        cursor=cursor,
+        with_total=with_total,
+    )
 
 
 async def new_user_add_default_nodes(language: str, uid: str) -> const.CodeEnum:
@@ -436,19 +631,30 @@ async def get_hist_editions(
     Returns:
         Tuple[List[str], const.CodeEnum]: history, code
     """
-    n, code = await get(au=au, nid=nid)
+    n, code = await get(au=au, nid=nid, fields=["history"], with_links=False)
     if code != const.CodeEnum.OK:
         return [], code
     return n.get("history", []), const.CodeEnum.OK
 
 
+async def get_link_title_progress(
+        au: tps.AuthedUser,
+        nid: str,
+) -> Tuple[Optional[link_title.LinkTitleProgress], const.CodeEnum]:
+    """The progress of rewriting the links to the renamed node, None if it was not renamed recently"""
+    _, code = await get(au=au, nid=nid, fields=["id"], with_links=False)
+    if code != const.CodeEnum.OK:
+        return None, code
+    return link_title.get_progress(nid), const.CodeEnum.OK
+
+
 async def get_hist_edition_md(au: tps.AuthedUser, nid: str, version: str) -> Tuple[str, const.CodeEnum]:
-    n, code = await get(au=au, nid=nid)
+    n, code = await get(au=au, nid=nid, fields=["history"], with_links=False)
     if code != const.CodeEnum.OK:
         return "", code
     if version not in n["history"]:
         return "", const.CodeEnum.NODE_NOT_EXIST
-    return backup.get_md(uid=au.u.id, nid=nid, version=version)
+    return await backup.get_md(uid=au.u.id, nid=nid, version=version)
 
 
 async def md_export(
@@ -456,7 +662,7 @@ async def md_export(
         nid: str,
         format_: Literal["md", "html", "pdf"],
 ) -> Tuple[str, str, Optional[BytesIO], const.CodeEnum]:
-    n, code = await get(au=au, nid=nid)
+    n, code = await get(au=au, nid=nid, fields=["title", "md"], with_links=False)
     if code != const.CodeEnum.OK:
         return "", "", None, code
 
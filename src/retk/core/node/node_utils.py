@@ -1,9 +1,22 @@
 from typing import List, Set, Tuple
 
-from retk import const, regex
+from retk import const, regex, config
 from retk.models import tps, db_ops
 from retk.models.client import client
 
+# the fields of a linked node rendered by controllers.node.node_ops.get_node_data
+LINKED_NODE_PROJECTION = {
+    "_id": 1,
+    "id": 1,
+    "title": 1,
+    "md": 1,
+    "snippet": 1,
+    "type": 1,
+    "disabled": 1,
+    "inTrash": 1,
+    "modifiedAt": 1,
+}
+
 
 def get_linked_nodes(new_md) -> Tuple[set, const.CodeEnum]:
     # last first
@@ -30,12 +43,14 @@ async def flush_to_node_ids(
 
     # remove fromNodes for linked nodes
     orig_to_nid = set(orig_to_nid)
-    for to_nid in orig_to_nid.difference(new_to_nid):
-        await db_ops.remove_from_node(from_nid=nid, to_nid=to_nid)
+    removed = list(orig_to_nid.difference(new_to_nid))
+    if len(removed) > 0:
+        await db_ops.nodes_pull(ids=removed, key="fromNodeIds", value=nid)
 
     # add fromNodes for linked nodes
-    for to_nid in new_to_nid.difference(orig_to_nid):
-        await db_ops.node_add_to_set(id_=to_nid, key="fromNodeIds", value=nid)
+    added = list(new_to_nid.difference(orig_to_nid))
+    if len(added) > 0:
+        await db_ops.nodes_add_to_set(ids=added, key="fromNodeIds", value=nid)
 
     return list(new_to_nid), const.CodeEnum.OK
 
@@ -44,12 +59,24 @@ async def set_linked_nodes(
         docs: List[tps.Node],
         with_disabled: bool = False,
 ):
+    # the linked nodes of all docs are fetched by one query, then assigned back to each doc
+    nids = set()
+    for doc in docs:
+        nids.update(doc["fromNodeIds"])
+        nids.update(doc["toNodeIds"])
+    linked = {}
+    if len(nids) > 0:
+        c = {"id": {"$in": list(nids)}, "disabled": with_disabled}
+        if not config.is_local_db():
+            linked_nodes = await client.coll.nodes.find(
+                c,
+                projection=LINKED_NODE_PROJECTION,
+            ).to_list(length=None)
+        else:
+            # local db not support projection
+            linked_nodes = await client.coll.nodes.find(c).to_list(length=None)
+        linked = {n["id"]: n for n in linked_nodes}
+
     for doc in docs:
-        doc["fromNodes"] = await client.coll.nodes.find({
-            "id": {"$in": doc["fromNodeIds"]},
-            "disabled": with_disabled,
-        }).to_list(length=None)
-        doc["toNodes"] = await client.coll.nodes.find({
-            "id": {"$in": doc["toNodeIds"]},
-            "disabled": with_disabled,
-        }).to_list(length=None)
+        doc["fromNodes"] = [linked[nid] for nid in doc["fromNodeIds"] if nid in linked]
+        doc["toNodes"] = [linked[nid] for nid in doc["toNodeIds"] if nid in linked]
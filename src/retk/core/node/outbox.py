@@ -0,0 +1,289 @@
+"""The side effects of a node write, run after the write is saved.
+
+A write enqueues one job of the node, the search index, the md and history backup and the llm
+extend queue are then updated by a background worker. The job is saved in the nodeOutbox
+collection, so it is still run after a restart. A failed job is retried with a growing delay.
+
+Jobs are coalesced by nid: a node saved many times before its job runs has only one job,
+and the latest node is read when it runs. The flags of a job stay set while it runs and are
+cleared after it succeeds, so a job left by a crash or a stop is run again after its lease.
+
+Without a running worker (e.g. in scripts and tests), the side effects are run at once.
+"""
+import asyncio
+import time
+from typing import Optional, Dict, List
+
+from bson import ObjectId
+
+from retk import config, const, utils
+from retk.core import ai
+from retk.logger import logger
+from retk.models import tps
+from retk.models.client import client
+from retk.models.search_engine.engine import SearchDoc
+from . import backup
+
+_FLAGS = ("searchAdd", "searchUpdate", "hist", "extend")
+
+__worker: Optional[asyncio.Task] = None
+__wake: Optional[asyncio.Event] = None
+# made in the loop running the worker, a lock made at import is bound to another loop on python<3.10
+__local_lock: Optional[asyncio.Lock] = None
+__counters = {"processed": 0, "retried": 0, "failed": 0}
+
+
+def start():
+    global __worker, __wake, __local_lock
+    if __worker is not None:
+        return
+    __wake = asyncio.Event()
+    __local_lock = asyncio.Lock()
+    __worker = asyncio.get_running_loop().create_task(__run())
+
+
+async def stop():
+    global __worker
+    if __worker is None:
+        return
+    __worker.cancel()
+    try:
+        await __worker
+    except asyncio.CancelledError:
+        pass
+    # the unfinished jobs are kept in the db
+    __worker = None
+
+
+def is_running() -> bool:
+    return __worker is not None
+
+
+def __get_local_lock() -> asyncio.Lock:
+    global __local_lock
+    if __local_lock is None:
+        __local_lock = asyncio.Lock()
+    return __local_lock
+
+
+async def enqueue(
+        au: tps.AuthedUser,
+        node: tps.Node,
+        search_add: bool = False,
+        search_update: bool = False,
+        hist: bool = False,
+        extend: bool = False,
+        search_doc: Optional[SearchDoc] = None,
+) -> const.CodeEnum:
+    """
+    Args:
+        au: the node owner
+        node: the saved node
+        search_add: add the node to the search index
+        search_update: update the node in the search index
+        hist: save a history version of the md
+        extend: put the node in the llm extend queue
+        search_doc: the search doc of the node if it is known, only used when run at once
+
+    Returns:
+        const.CodeEnum: the code of the side effects when run at once, else the code of enqueue
+    """
+    flags = {"searchAdd": search_add, "searchUpdate": search_update, "hist": hist, "extend": extend}
+    if not is_running():
+        code = await __run_effects(au=au, node=node, flags=flags, search_doc=search_doc)
+        if code != const.CodeEnum.OK:
+            logger.error(f"node side effects failed, nid: {node['id']}, code: {code}")
+        return code
+
+    now = time.time()
+    # a flag is the id of the write which set it, the flag set again while the job runs is kept
+    write_id = ObjectId()
+    set_ = {k: write_id for k, v in flags.items() if v}
+    set_.update({"failed": False, "attempts": 0, "runAt": now})
+    if not config.is_local_db():
+        await client.coll.node_outbox.update_one(
+            {"nid": node["id"]},
+            {
+                "$set": set_,
+                "$inc": {"version": 1},
+                "$setOnInsert": {"uid": node["uid"], "createdAt": now, "lockedUntil": 0.},
+            },
+            upsert=True,
+        )
+    else:
+        # local db not support upsert
+        async with __get_local_lock():
+            job = await client.coll.node_outbox.find_one({"nid": node["id"]})
+            if job is None:
+                await client.coll.node_outbox.insert_one(tps.NodeOutboxJob(
+                    _id=ObjectId(),
+                    uid=node["uid"],
+                    nid=node["id"],
+                    version=1,
+                    createdAt=now,
+                    lockedUntil=0.,
+                    **{**{k: False for k in _FLAGS}, **set_},
+                ))
+            else:
+                await client.coll.node_outbox.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": set_, "$inc": {"version": 1}},
+                )
+    __wake.set()
+    return const.CodeEnum.OK
+
+
+async def process_due(limit: int = const.settings.NODE_OUTBOX_BATCH_SIZE) -> int:
+    """Run the jobs due now, the number of jobs run is returned"""
+    jobs = await __claim(limit=limit)
+    await asyncio.gather(*[__process(job) for job in jobs])
+    return len(jobs)
+
+
+async def join(timeout: float = 10.):
+    """Wait until the pending jobs are done or failed, e.g. before reading the search index in tests"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await client.coll.node_outbox.count_documents({"failed": False}) == 0:
+            return
+        await asyncio.sleep(0.01)
+
+
+async def stats() -> Dict[str, float]:
+    """The pending and failed jobs, and the lag: seconds since the oldest pending job was enqueued"""
+    oldest = await client.coll.node_outbox.find({"failed": False}).sort("createdAt", 1).limit(1).to_list(length=None)
+    pending = await client.coll.node_outbox.count_documents({"failed": False})
+    failed = await client.coll.node_outbox.count_documents({"failed": True})
+    return {
+        "pending": pending,
+        "failed": failed,
+        "lagSeconds": time.time() - oldest[0]["createdAt"] if len(oldest) > 0 else 0.,
+        **__counters,
+    }
+
+
+async def __run():
+    while True:
+        try:
+            n = await process_due()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"node outbox failed: {e}")
+            n = 0
+        if n > 0:
+            continue
+        __wake.clear()
+        try:
+            await asyncio.wait_for(__wake.wait(), timeout=const.settings.NODE_OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def __claim(limit: int) -> List[tps.NodeOutboxJob]:
+    """Lock the due jobs, their flags are cleared after they succeed"""
+    now = time.time()
+    update = {"$set": {"lockedUntil": now + const.settings.NODE_OUTBOX_LEASE}}
+    jobs = []
+    if not config.is_local_db():
+        for _ in range(limit):
+            job = await client.coll.node_outbox.find_one_and_update(
+                {"failed": False, "runAt": {"$lte": now}, "lockedUntil": {"$lte": now}},
+                update,
+                sort=[("runAt", 1)],
+            )
+            if job is None:
+                break
+            job["claimedAt"] = now
+            jobs.append(job)
+    else:
+        # local db not support find_one_and_update, the only worker is in this process
+        async with __get_local_lock():
+            docs = await client.coll.node_outbox.find({"failed": False}).to_list(length=None)
+            docs = sorted(
+                [d for d in docs if d["runAt"] <= now and d["lockedUntil"] <= now],
+                key=lambda d: d["runAt"],
+            )[:limit]
+            for job in docs:
+                await client.coll.node_outbox.update_one({"_id": job["_id"]}, update)
+                job["claimedAt"] = now
+                jobs.append(job)
+    return jobs
+
+
+async def __process(job: tps.NodeOutboxJob):
+    code = const.CodeEnum.OK
+    node = await client.coll.nodes.find_one({"id": job["nid"]})
+    u = await client.coll.users.find_one({"id": job["uid"]})
+    # the node or its user is deleted, nothing to do
+    if node is not None and u is not None:
+        au = tps.AuthedUser(
+            u=tps.convert_user_dict_to_authed_user(u),
+            language=u["settings"]["language"],
+            request_id="",
+        )
+        try:
+            code = await __run_effects(au=au, node=node, flags={k: bool(job[k]) for k in _FLAGS})
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"node outbox job failed, nid: {job['nid']}, error: {e}")
+            code = const.CodeEnum.OPERATION_FAILED
+
+    if code == const.CodeEnum.OK:
+        __counters["processed"] += 1
+        res = await client.coll.node_outbox.delete_one({"_id": job["_id"], "version": job["version"]})
+        if res.deleted_count == 0:
+            # enqueued again while running, clear the flags run and not set again, run the new flags next
+            for k in _FLAGS:
+                if job[k]:
+                    await client.coll.node_outbox.update_one({"_id": job["_id"], k: job[k]}, {"$set": {k: False}})
+            await client.coll.node_outbox.update_one(
+                {"_id": job["_id"]},
+                {"$set": {"lockedUntil": 0., "createdAt": job["claimedAt"]}},
+            )
+        return
+
+    attempts = job["attempts"] + 1
+    failed = attempts >= const.settings.NODE_OUTBOX_MAX_ATTEMPTS
+    if failed:
+        __counters["failed"] += 1
+        logger.error(f"node outbox job failed {attempts} times, nid: {job['nid']}, code: {code}")
+    else:
+        __counters["retried"] += 1
+    await client.coll.node_outbox.update_one(
+        {"_id": job["_id"]},
+        {"$set": {
+            "attempts": attempts,
+            "failed": failed,
+            "runAt": time.time() + const.settings.NODE_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1),
+            "lockedUntil": 0.,
+        }},
+    )
+
+
+async def __run_effects(
+        au: tps.AuthedUser,
+        node: tps.Node,
+        flags: Dict[str, bool],
+        search_doc: Optional[SearchDoc] = None,
+) -> const.CodeEnum:
+    code = await backup.storage_md(node=node, keep_hist=flags["hist"])
+    if code != const.CodeEnum.OK:
+        return code
+
+    if node["type"] == const.NodeTypeEnum.MARKDOWN.value and (flags["searchAdd"] or flags["searchUpdate"]):
+        if search_doc is None:
+            title, body, _ = await utils.preprocess_md_async(node["md"])
+            search_doc = SearchDoc(nid=node["id"], title=title, body=body)
+        if flags["searchAdd"]:
+            code = await client.search.add(au=au, doc=search_doc)
+            # the node may be trashed or disabled before the job runs, it is added with its current state
+            if code == const.CodeEnum.OK and node.get("inTrash", False):
+                code = await client.search.to_trash(au=au, nid=node["id"])
+            if code == const.CodeEnum.OK and node.get("disabled", False):
+                code = await client.search.disable(au=au, nid=node["id"])
+        else:
+            code = await client.search.update(au=au, doc=search_doc)
+        if code != const.CodeEnum.OK:
+            return code
+
+    if flags["extend"]:
+        await ai.llm.knowledge.extend_on_node_post(data=node)
+    return const.CodeEnum.OK
@@ -1,4 +1,4 @@
-from typing import List, Dict, Tuple, Sequence, Literal
+from typing import List, Dict, Tuple, Sequence, Literal, Optional, Any
 
 from retk.controllers.schemas.node import NodesSearchResponse
 from retk.core.recent import put_recent_search
@@ -42,7 +42,23 @@ async def user_nodes(
         page: int,
         limit: int,
         exclude_nids: Sequence[str],
-) -> Tuple[List[NodesSearchResponse.Data.Node], int]:
+        cursor: str = "",
+) -> Tuple[List[NodesSearchResponse.Data.Node], int, str]:
+    """
+
+    Args:
+        au:
+        query:
+        sort_key:
+        reverse:
+        page:
+        limit:
+        exclude_nids:
+        cursor: continue after this cursor instead of the page number
+
+    Returns:
+        Tuple[List[NodesSearchResponse.Data.Node], int, str]: nodes, total, next cursor
+    """
     # search nodes
     hits, total = await client.search.search(
         au=au,
@@ -52,12 +68,28 @@ async def user_nodes(
         page=page,
         limit=limit,
         exclude_nids=exclude_nids,
+        cursor=cursor,
     )
     results = await _2node_data(hits)
+    next_cursor = hits[-1].cursor if 0 < limit <= len(hits) else ""
 
     if query != "":
         await put_recent_search(au=au, query=query)
-    return results, total
+    return results, total, next_cursor
+
+
+def reindex_progress() -> Optional[Dict[str, Any]]:
+    """The progress of the last reindex since startup, None if there is none or the engine can not reindex"""
+    progress = getattr(client.search, "reindex_progress", None)
+    if progress is None:
+        return None
+    return {
+        "index": progress.index,
+        "total": progress.total,
+        "copied": progress.copied,
+        "conflicts": progress.conflicts,
+        "done": progress.done,
+    }
 
 
 async def recommend(
@@ -112,7 +144,7 @@ async def at(
             ) for n in _nodes
         ], len(rn)
 
-    return await user_nodes(
+    nodes, total, _ = await user_nodes(
         au=au,
         query=query,
         sort_key="similarity",
@@ -121,3 +153,4 @@ async def at(
         limit=limit,
         exclude_nids=[nid],
     )
+    return nodes, total
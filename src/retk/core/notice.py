@@ -5,6 +5,7 @@ from bson import ObjectId
 from bson.tz_util import utc
 
 from retk import const, config
+from retk.models import db_ops
 from retk.models.client import client
 from retk.models.tps import AuthedUser, NoticeManagerDelivery
 from retk.utils import datetime2str, md2html, md2txt
@@ -48,15 +49,37 @@ async def post_in_manager_delivery(
     return notice, const.CodeEnum.OK
 
 
+SYSTEM_NOTICES_SORT: db_ops.Sort = [("_id", 1)]
+USER_NOTICES_SORT: db_ops.Sort = [("_id", -1)]
+
+
 async def get_system_notices(
         page: int,
         limit: int,
-) -> Tuple[List[NoticeManagerDelivery], int]:
-    total = await client.coll.notice_manager_delivery.count_documents({})
-    notices = await client.coll.notice_manager_delivery.find(
-        {}
-    ).skip(page * limit).limit(limit=limit).to_list(None)
-    return notices, total
+        cursor: str = "",
+        with_total: bool = True,
+) -> Tuple[List[NoticeManagerDelivery], int, str]:
+    """
+
+    Args:
+        page: ignored when cursor is given
+        limit:
+        cursor: the next cursor of the previous page
+        with_total: count the total, -1 is returned for total if False
+
+    Returns:
+        Tuple[List[NoticeManagerDelivery], int, str]: notices, total, next cursor
+    """
+    total = await client.coll.notice_manager_delivery.count_documents({}) if with_total else -1
+    notices = await db_ops.find_page(
+        coll=client.coll.notice_manager_delivery,
+        condition={},
+        sort=SYSTEM_NOTICES_SORT,
+        limit=limit,
+        page=page,
+        cursor=cursor,
+    ).to_list(None)
+    return notices, total, db_ops.next_page_cursor(docs=notices, sort=SYSTEM_NOTICES_SORT, limit=limit)
 
 
 async def get_system_notice(
@@ -99,6 +122,7 @@ class Notice(TypedDict):
 class SystemNotices(TypedDict):
     total: int
     notices: List[Notice]
+    nextCursor: str
 
 
 class Notices(TypedDict):
@@ -111,25 +135,39 @@ async def get_user_notices(
         unread_only: bool = False,
         page: int = 0,
         limit: int = 10,
+        cursor: str = "",
+        with_total: bool = True,
 ) -> Tuple[Notices, const.CodeEnum]:
     c = {"recipientId": au.u.id}
     if unread_only:
         c["read"] = False
     if not config.is_local_db():
-        user_system_notices = await client.coll.notice_system.find(
-            c,
-            projection={"noticeId": 1, "read": 1, "readTime": 1}
-        ).sort("_id", -1).skip(page * limit).limit(limit=limit).to_list(None)
+        user_system_notices = await db_ops.find_page(
+            coll=client.coll.notice_system,
+            condition=c,
+            sort=USER_NOTICES_SORT,
+            limit=limit,
+            page=page,
+            cursor=cursor,
+            projection={"noticeId": 1, "read": 1, "readTime": 1},
+        ).to_list(None)
         # Get the details of the notices
         n_details = await client.coll.notice_manager_delivery.find(
             {"_id": {"$in": [n["noticeId"] for n in user_system_notices]}},
             projection={"title": 1, "snippet": 1, "publishAt": 1}
         ).to_list(None)
     else:
-        user_system_notices = await client.coll.notice_system.find(
-            c,
-        ).sort("_id", -1).skip(page * limit).limit(limit=limit).to_list(None)
+        # local db not support projection
+        user_system_notices = await db_ops.find_page(
+            coll=client.coll.notice_system,
+            condition=c,
+            sort=USER_NOTICES_SORT,
+            limit=limit,
+            page=page,
+            cursor=cursor,
+        ).to_list(None)
         user_system_notices = [{
+            "_id": n["_id"],
             "noticeId": n["noticeId"],
             "read": n["read"],
             "readTime": n["readTime"],
@@ -139,10 +177,10 @@ async def get_user_notices(
             {"_id": {"$in": [n["noticeId"] for n in user_system_notices]}},
         ).to_list(None)
 
-    total_system_system = await client.coll.notice_system.count_documents(c)
-    if c.get("read", True):
+    total_system_system = await client.coll.notice_system.count_documents(c) if with_total else -1
+    if c.get("read", True) or not with_total:
         # if not unread_only, check if there are unread notices
-        has_unread = await client.coll.notice_system.count_documents({"recipientId": au.u.id, "read": False}) > 0
+        has_unread = await client.coll.notice_system.find_one({"recipientId": au.u.id, "read": False}) is not None
     else:
         has_unread = total_system_system > 0
 
@@ -164,6 +202,7 @@ async def get_user_notices(
         "system": {
             "total": total_system_system,
             "notices": new_system_notices,
+            "nextCursor": db_ops.next_page_cursor(docs=user_system_notices, sort=USER_NOTICES_SORT, limit=limit),
         }
     }, const.CodeEnum.OK
 
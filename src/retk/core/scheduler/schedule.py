@@ -1,3 +1,4 @@
+import asyncio
 from collections import OrderedDict as _OrderedDict
 from dataclasses import dataclass
 from datetime import datetime, timedelta
@@ -132,13 +133,21 @@ def clear_jobs() -> None:
 
 def start():
     global __scheduler
+    try:
+        # the jobs that use the db and search clients of the app run in its loop
+        tasks.utils.set_app_loop(asyncio.get_running_loop())
+    except RuntimeError:
+        tasks.utils.set_app_loop(None)
     __scheduler = BackgroundScheduler()
     __scheduler.start()
 
 
 def stop():
     __scheduler.remove_all_jobs()
-    __scheduler.shutdown()
+    # called in the app loop, a job thread running in it can not finish until this returns
+    __scheduler.shutdown(wait=False)
+    tasks.utils.cancel_app_loop_jobs()
+    tasks.utils.set_app_loop(None)
 
 
 def _get_default(args, kwargs):
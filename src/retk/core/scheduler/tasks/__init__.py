@@ -1,4 +1,5 @@
 from . import (
+    utils,
     email,
     notice,
     extend_node,
@@ -1,41 +1,92 @@
-import asyncio
+import time
+from collections import defaultdict
 from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List
 
 from bson.tz_util import utc
 
-from retk import config
-from retk.models.client import init_mongo
-from retk.models.coll import CollNameEnum
+from retk import config, const
+from retk.core import node
+from retk.logger import logger
+from retk.models import db_ops
+from retk.models.client import client
+from retk.models.tps import AuthedUser, convert_user_dict_to_authed_user
+from .utils import run_in_app_loop
+
+__SORT = [("inTrashAt", 1), ("_id", 1)]
+__PROJECTION = {"_id": 1, "id": 1, "uid": 1, "inTrashAt": 1}
 
 
 def auto_clean_trash(delta_days=30):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    res = loop.run_until_complete(_auto_clean_trash(delta_days=delta_days))
-    loop.close()
-    return res
-
-
-async def _auto_clean_trash(delta_days=30):
-    _, db = init_mongo(connection_timeout=5)
-    # Get all nodes in trash
-    if config.is_local_db():
-        nodes = await db[CollNameEnum.nodes.value].find({
-            "inTrash": True
-        }).to_list(None)
-        old_nodes = [
-            node for node in nodes
-            if node["inTrashAt"].astimezone(utc) < datetime.now(tz=utc) - timedelta(days=delta_days)
-        ]
+    return run_in_app_loop(async_auto_clean_trash(delta_days=delta_days))
+
+
+async def async_auto_clean_trash(delta_days=30) -> str:
+    """Delete the nodes in trash for more than delta_days, a batch at a time by the inTrashAt index.
+    They are deleted by core.node.batch_delete, so the search index, md history and used space are updated.
+    """
+    t0 = time.perf_counter()
+    before = datetime.now(tz=utc) - timedelta(days=delta_days)
+    deleted = 0
+    failed = 0
+    batches = 0
+    async for docs in __expired_batches(before=before, batch_size=const.settings.TRASH_CLEAN_BATCH_SIZE):
+        batches += 1
+        uid2nids: Dict[str, List[str]] = defaultdict(list)
+        for doc in docs:
+            uid2nids[doc["uid"]].append(doc["id"])
+        users = await client.coll.users.find({"id": {"$in": list(uid2nids.keys())}}).to_list(length=None)
+        for u in users:
+            au = AuthedUser(
+                u=convert_user_dict_to_authed_user(u),
+                language=u["settings"]["language"],
+                request_id="auto_clean_trash",
+            )
+            nids = uid2nids[u["id"]]
+            code = await node.batch_delete(au=au, nids=nids)
+            if code == const.CodeEnum.OK:
+                deleted += len(nids)
+            else:
+                failed += len(nids)
+                logger.error(f"auto clean trash failed, uid: {u['id']}, code: {code}")
+
+    dt = time.perf_counter() - t0
+    return (
+        f"deleted {deleted} nodes, failed {failed}, in {batches} batches, "
+        f"{dt:.2f}s, {deleted / dt if dt > 0 else 0.:.1f} nodes/s"
+    )
+
+
+async def __expired_batches(before: datetime, batch_size: int) -> AsyncIterator[List[Dict]]:
+    if not config.is_local_db():
+        condition = {"inTrash": True, "inTrashAt": {"$lt": before}}
+        cursor = ""
+        while True:
+            docs = await db_ops.find_page(
+                client.coll.nodes,
+                condition=condition,
+                sort=__SORT,
+                limit=batch_size,
+                cursor=cursor,
+                projection=__PROJECTION,
+            ).to_list(length=None)
+            if len(docs) == 0:
+                break
+            yield docs
+            # the failed ones are skipped by the cursor
+            cursor = db_ops.next_page_cursor(docs=docs, sort=__SORT, limit=batch_size)
+            if cursor == "":
+                break
     else:
-        old_nodes = await db[CollNameEnum.nodes.value].find({
-            "inTrash": True,
-            # Get all nodes in trash that are older than 30 days
-            "inTrashAt": {"$lt": datetime.now(tz=utc) - timedelta(days=delta_days)}
-        }).to_list(None)
-
-    # Delete all old nodes in trash
-    result = await db[CollNameEnum.nodes.value].delete_many({
-        "_id": {"$in": [node["_id"] for node in old_nodes]}
-    })
-    return result.deleted_count
+        # local db loads the datetimes saved on disk as naive ones in utc,
+        # and it can not compare them with an aware one, so they are compared here
+        docs = await client.coll.nodes.find({"inTrash": True}).to_list(length=None)
+        docs = [d for d in docs if d["inTrashAt"] is not None and __as_utc(d["inTrashAt"]) < before]
+        for i in range(0, len(docs), batch_size):
+            yield docs[i:i + batch_size]
+
+
+def __as_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=utc)
+    return dt.astimezone(utc)
@@ -2,7 +2,7 @@ import asyncio
 import json
 import random
 import time
-from typing import List
+from typing import Dict, List
 
 from retk import const, config
 from retk.core.ai.llm import knowledge
@@ -10,23 +10,26 @@ from retk.core.statistic import add_user_behavior
 from retk.logger import logger
 from retk.models.client import init_mongo
 from retk.models.coll import CollNameEnum
+from retk.models.tps import Node
 from retk.models.tps.llm import NodeExtendQueue, ExtendedNode
+from .utils import run_in_app_loop
 
 
 def deliver_unscheduled_extend_nodes():
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    res = loop.run_until_complete(async_deliver_unscheduled_extend_nodes())
-    loop.close()
-    return res
+    # the llm requests of all batches share the pooled connections of the app,
+    # the job is cancelled when the app shuts down, the unfinished batch is kept in the queue
+    return run_in_app_loop(async_deliver_unscheduled_extend_nodes())
 
 
 async def get_cases(db, batch: List[NodeExtendQueue]) -> List[knowledge.ExtendCase]:
-    cases: List[knowledge.ExtendCase] = []
-
     nid2item = {item["nid"]: item for item in batch}
-
     nodes = await db[CollNameEnum.nodes.value].find({"id": {"$in": list(nid2item.keys())}}).to_list(None)
+    # the links are removed from each md, the cpu work is not run in the app loop serving the requests
+    return await asyncio.get_running_loop().run_in_executor(None, __new_cases, nid2item, nodes)
+
+
+def __new_cases(nid2item: Dict[str, NodeExtendQueue], nodes: List[Node]) -> List[knowledge.ExtendCase]:
+    cases: List[knowledge.ExtendCase] = []
     for node in nodes:
         if node is None:
             continue
@@ -76,11 +79,11 @@ async def update_extended_nodes(db, case: knowledge.ExtendCase):
 async def async_deliver_unscheduled_extend_nodes() -> str:
     _, db = init_mongo(connection_timeout=5)
     batch_size = 40
-    total_success_count = 0
-    total_summary_time = 0
-    total_extend_time = 0
+    done_count = 0
+    success_count = 0
+    latencies: List[float] = []
+    t0 = time.perf_counter()
     while True:
-        done_id_list = []
         batch: List[NodeExtendQueue] = await db[CollNameEnum.llm_extend_node_queue.value].find().limit(
             batch_size
         ).to_list(None)
@@ -89,31 +92,14 @@ async def async_deliver_unscheduled_extend_nodes() -> str:
         req_id = "".join([str(random.randint(0, 9)) for _ in range(10)])
         cases = await get_cases(db, batch)
 
-        s0 = time.perf_counter()
-        cases = await knowledge.batch_summary(
-            cases=cases,
-            req_id=req_id,
-        )
-
-        # set summary to nodes
-        for case in cases:
-            if case.summary_code != const.CodeEnum.OK:
-                continue
-            await db[CollNameEnum.nodes.value].update_one(
-                {"id": case.nid},
-                {"$set": {"summary": case.summary}}
-            )
-
-        s1 = time.perf_counter()
-
-        e0 = time.perf_counter()
-        cases = await knowledge.batch_extend(
-            cases=cases,
-            req_id=req_id,
-        )
-        e1 = time.perf_counter()
-
-        for case in cases:
+        # a case is saved once it is extended, while the others are still waiting for their services
+        async for case in knowledge.summary_extend_pipeline(cases=cases, req_id=req_id):
+            if case.summary_code == const.CodeEnum.OK:
+                # set summary to nodes
+                await db[CollNameEnum.nodes.value].update_one(
+                    {"id": case.nid},
+                    {"$set": {"summary": case.summary}}
+                )
             await add_user_behavior(
                 uid=case.uid,
                 type_=const.user_behavior_types.UserBehaviorTypeEnum.LLM_KNOWLEDGE_RESPONSE,
@@ -130,25 +116,36 @@ async def async_deliver_unscheduled_extend_nodes() -> str:
                     ensure_ascii=False
                 ),
             )
-            done_id_list.append(case._id)
+            done_count += 1
+            latencies.append(case.latency)
+            logger.debug(
+                f"rid='{req_id}' "
+                f"| uid='{case.uid}' "
+                f"| llm extend knowledge "
+                f"| summary={case.summary_latency:.2f}s "
+                f"| extend={case.extend_latency:.2f}s "
+                f"| latency={case.latency:.2f}s"
+            )
             if case.summary_code != const.CodeEnum.OK or case.extend_code != const.CodeEnum.OK:
                 continue
 
             await update_extended_nodes(db, case)
-
-        total_summary_time += s1 - s0
-        total_extend_time += e1 - e0
+            success_count += 1
 
         # remove the batch
         await db[CollNameEnum.llm_extend_node_queue.value].delete_many(
             {"_id": {"$in": [b["_id"] for b in batch]}}
         )
-
-    if len(done_id_list) > 0:
-        logger.info(
-            f"llm extend knowledge task: "
-            f"avg_summary_time: {total_summary_time / total_success_count:.2f}s, "
-            f"avg_extend_time: {total_extend_time / total_success_count:.2f}s"
-        )
-
-    return f"successfully extent {len(done_id_list)} node"
+        # once per batch rather than per cached response
+        await knowledge.cache.evict()
+
+    if done_count == 0:
+        return "successfully extent 0 node"
+    latencies.sort()
+    res = (
+        f"successfully extent {success_count} node, failed {done_count - success_count}, "
+        f"{time.perf_counter() - t0:.2f}s, "
+        f"latency p50={latencies[len(latencies) // 2]:.2f}s max={latencies[-1]:.2f}s"
+    )
+    logger.info(f"llm extend knowledge task: {res}")
+    return res
@@ -0,0 +1,51 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Optional, Coroutine, Any, Set
+
+from retk.logger import logger
+from retk.utils import http_pool
+
+__app_loop: Optional[asyncio.AbstractEventLoop] = None
+# the jobs waiting for the app loop, they are cancelled on shutdown
+__app_futures: Set[concurrent.futures.Future] = set()
+__app_futures_lock = threading.Lock()
+
+
+def set_app_loop(loop: Optional[asyncio.AbstractEventLoop]):
+    global __app_loop
+    __app_loop = loop
+
+
+def run_in_app_loop(coro: Coroutine) -> Any:
+    """Run a coroutine from a job thread in the event loop of the app, so it can use the
+    db, search and pooled http clients of the app. A new event loop is used if the scheduler is not started in the app.
+    """
+    if __app_loop is not None and __app_loop.is_running():
+        fut = asyncio.run_coroutine_threadsafe(coro, __app_loop)
+        with __app_futures_lock:
+            __app_futures.add(fut)
+        try:
+            return fut.result()
+        except concurrent.futures.CancelledError:
+            logger.info(f"scheduled job cancelled: {coro.__qualname__}")
+            return "cancelled"
+        finally:
+            with __app_futures_lock:
+                __app_futures.discard(fut)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    res = loop.run_until_complete(coro)
+    loop.run_until_complete(http_pool.close())
+    loop.close()
+    return res
+
+
+def cancel_app_loop_jobs():
+    """Cancel the jobs running in the app loop, called in the app loop which they wait for,
+    so it does not block.
+    """
+    with __app_futures_lock:
+        futures = list(__app_futures)
+    for fut in futures:
+        fut.cancel()
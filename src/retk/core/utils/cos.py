@@ -1,6 +1,6 @@
 import asyncio
 from datetime import datetime
-from typing import Optional, BinaryIO, List, Dict
+from typing import Optional, BinaryIO, List, Dict, AsyncIterator
 
 import httpx
 
@@ -13,6 +13,7 @@ except ImportError:
 
 from retk.config import get_settings
 from retk.logger import logger
+from retk.utils import http_pool
 
 
 class COSClient:
@@ -21,7 +22,11 @@ class COSClient:
         self.domain = None
         self.bucket = None
 
-    def init(self):
+    def init(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        Args:
+            transport: the transport of the "cos" http pool, e.g. a local S3-compatible stand-in in tests
+        """
         settings = get_settings()
         try:
             cos_conf = CosConfig(
@@ -39,6 +44,12 @@ class COSClient:
         self.domain = settings.COS_DOMAIN or f"{settings.COS_BUCKET_NAME}.cos.{settings.COS_REGION}.myqcloud.com"
         self.bucket = settings.COS_BUCKET_NAME
         self._client = CosS3Client(cos_conf)
+        if transport is not None:
+            http_pool.set_transport("cos", transport)
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return http_pool.get("cos")
 
     @staticmethod
     def get_user_data_key(
@@ -59,24 +70,26 @@ class COSClient:
         }
         return headers
 
+    def get_url(self, key: str) -> str:
+        return f"https://{self.domain}/{key}"
+
     async def async_has_file(self, uid: str, filename: str) -> bool:
         key = self.get_user_data_key(uid=uid, filename=filename)
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.head(
-                    url=f"https://{self.domain}/{key}",
-                    headers=self.get_auth_headers("head", key),
-                )
-            except (
-                    httpx.ConnectTimeout,
-                    httpx.ConnectError,
-                    httpx.ReadTimeout,
-                    httpx.HTTPError
-            ) as e:
-                logger.error(f"has_file | error: {e}")
-                return False
-            if resp.status_code != 200:
-                return False
+        try:
+            resp = await self.http.head(
+                url=self.get_url(key),
+                headers=self.get_auth_headers("head", key),
+            )
+        except (
+                httpx.ConnectTimeout,
+                httpx.ConnectError,
+                httpx.ReadTimeout,
+                httpx.HTTPError
+        ) as e:
+            logger.error(f"has_file | error: {e}")
+            return False
+        if resp.status_code != 200:
+            return False
         return True
 
     async def async_batch_has_file(self, uid: str, filenames: List[str]) -> Dict[str, bool]:
@@ -101,14 +114,16 @@ class COSClient:
 
     async def async_put(self, file: BinaryIO, uid: str, filename: str) -> bool:
         key = self.get_user_data_key(uid=uid, filename=filename)
+        return await self.async_put_object(key=key, data=file.read())
+
+    async def async_put_object(self, key: str, data: bytes) -> bool:
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.put(
-                    url=f"https://{self.domain}/{key}",
-                    headers=self.get_auth_headers("put", key),
-                    content=file.read(),
-                    timeout=60,
-                )
+            resp = await self.http.put(
+                url=self.get_url(key),
+                headers=self.get_auth_headers("put", key),
+                content=data,
+                timeout=60,
+            )
             if resp.status_code != 200:
                 logger.error(f"put_cos_object | error: {resp.text}")
                 return False
@@ -150,24 +165,72 @@ class COSClient:
 
     async def async_get(self, uid: str, filename: str) -> Optional[bytes]:
         key = self.get_user_data_key(uid=uid, filename=filename)
-        async with httpx.AsyncClient() as client:
-            try:
-                resp = await client.get(
-                    url=f"https://{self.domain}/{key}",
+        return await self.async_get_object(key=key)
+
+    async def async_get_object(self, key: str) -> Optional[bytes]:
+        try:
+            async with self.http.stream(
+                    "GET",
+                    url=self.get_url(key),
                     headers=self.get_auth_headers("get", key),
-                )
-            except (
-                    httpx.ConnectTimeout,
-                    httpx.ConnectError,
-                    httpx.ReadTimeout,
-                    httpx.HTTPError
-            ) as e:
-                logger.error(f"get_cos_object | error: {e}")
-                return None
-            if resp.status_code != 200:
-                logger.error(f"get_cos_object | error: {resp.text}")
-                return None
-            return resp.content
+            ) as resp:
+                if resp.status_code != 200:
+                    await resp.aread()
+                    logger.error(f"get_cos_object | error: {resp.text}")
+                    return None
+                chunks = [chunk async for chunk in resp.aiter_bytes()]
+        except (
+                httpx.ConnectTimeout,
+                httpx.ConnectError,
+                httpx.ReadTimeout,
+                httpx.HTTPError
+        ) as e:
+            logger.error(f"get_cos_object | error: {e}")
+            return None
+        return b"".join(chunks)
+
+    async def async_iter(self, uid: str, filename: str, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """The file in chunks as it is downloaded, nothing is yielded if it is not found"""
+        key = self.get_user_data_key(uid=uid, filename=filename)
+        try:
+            async with self.http.stream(
+                    "GET",
+                    url=self.get_url(key),
+                    headers=self.get_auth_headers("get", key),
+            ) as resp:
+                if resp.status_code != 200:
+                    await resp.aread()
+                    logger.error(f"iter_cos_object | error: {resp.text}")
+                    return
+                async for chunk in resp.aiter_bytes(chunk_size=chunk_size):
+                    yield chunk
+        except (
+                httpx.ConnectTimeout,
+                httpx.ConnectError,
+                httpx.ReadTimeout,
+                httpx.HTTPError
+        ) as e:
+            logger.error(f"iter_cos_object | error: {e}")
+
+    async def async_delete_object(self, key: str) -> bool:
+        try:
+            resp = await self.http.delete(
+                url=self.get_url(key),
+                headers=self.get_auth_headers("delete", key),
+            )
+        except (
+                httpx.ConnectTimeout,
+                httpx.ConnectError,
+                httpx.ReadTimeout,
+                httpx.HTTPError
+        ) as e:
+            logger.error(f"delete_cos_object | error: {e}")
+            return False
+        # a missing key is deleted as well
+        if resp.status_code not in (200, 204, 404):
+            logger.error(f"delete_cos_object | error: {resp.text}")
+            return False
+        return True
 
     async def async_batch_get(self, uid: str, filenames: List[str]) -> Dict[str, bytes]:
         async def get_file(filename: str):
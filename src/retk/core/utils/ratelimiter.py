@@ -1,10 +1,12 @@
 import asyncio
 import json
 import time
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import timedelta
 from functools import wraps
-from typing import Callable
+from typing import Awaitable, Callable, Deque, Dict, Iterator, Optional, Tuple
 from typing import Union
 
 from starlette.exceptions import HTTPException
@@ -16,30 +18,145 @@ from retk.models.tps import AuthedUser
 
 
 class RateLimiter:
-    def __init__(self, requests: int, period: Union[int, float, timedelta]):
-        if isinstance(period, (int, float)):
-            period = timedelta(seconds=period)
-        self.max_tokens = requests
-        self.period = period
-        self.tokens = requests
-        self.last_refill = time.monotonic()
+    """A token bucket of `requests` tokens, refilled continuously at `requests` per `period`.
+
+    The waiters are served in order, only the first one sleeps, and it sleeps until its tokens are refilled.
+    clock and sleep can be replaced by a virtual clock in tests.
+    """
+
+    def __init__(
+            self,
+            requests: Union[int, float],
+            period: Union[int, float, timedelta],
+            clock: Callable[[], float] = time.monotonic,
+            sleep: Callable[[float], Awaitable] = asyncio.sleep,
+    ):
+        if isinstance(period, timedelta):
+            period = period.total_seconds()
+        self.max_tokens = float(requests)
+        self.rate = requests / period
+        self.tokens = float(requests)
+        self.clock = clock
+        self.sleep = sleep
+        self.last_refill = clock()
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def wait_time(self, n: float = 1) -> float:
+        """Seconds until n tokens are available, not counting the waiters before."""
+        self._refill()
+        n = min(n, self.max_tokens)
+        return max(0., (n - self.tokens) / self.rate)
+
+    def try_acquire(self, n: float = 1) -> bool:
+        if len(self._waiters) > 0 or self.wait_time(n) > 0:
+            return False
+        self.tokens -= n
+        return True
+
+    async def acquire(self, n: float = 1):
+        # a request larger than the bucket waits for a full bucket and leaves it in debt
+        if self.try_acquire(n):
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            if self._waiters[0] is not fut:
+                await fut
+            while True:
+                wait = self.wait_time(n)
+                if wait <= 0:
+                    break
+                await self.sleep(wait)
+            self.tokens -= n
+        finally:
+            self._waiters.remove(fut)
+            if len(self._waiters) > 0 and not self._waiters[0].done():
+                self._waiters[0].set_result(None)
+
+    def consume(self, n: float):
+        """Take n more tokens after the fact, the bucket goes into debt if it has not enough,
+        a negative n gives the tokens back.
+        """
+        self._refill()
+        self.tokens = min(self.max_tokens, self.tokens - n)
 
     async def __aenter__(self):
-        while self.tokens < 1:
-            await asyncio.sleep(0.1)
-            now = time.monotonic()
-            elapsed_time = now - self.last_refill
-            if elapsed_time > self.period.total_seconds():
-                self.tokens = self.max_tokens
-                self.last_refill = now
-                break
-        self.tokens -= 1
+        await self.acquire(1)
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         pass
 
 
+class ModelLimiter:
+    """The limits of a model shared by all its requests: requests per minute and tokens per minute are
+    waited for, requests per day are not, a request over the daily quota is refused.
+    """
+
+    def __init__(
+            self,
+            rpm: int,
+            tpm: int,
+            rpd: int,
+            clock: Callable[[], float] = time.monotonic,
+            sleep: Callable[[float], Awaitable] = asyncio.sleep,
+    ):
+        self.limits = (rpm, tpm, rpd)
+        self.rpm = RateLimiter(requests=rpm, period=60, clock=clock, sleep=sleep)
+        self.tpm = RateLimiter(requests=tpm, period=60, clock=clock, sleep=sleep)
+        self.rpd = RateLimiter(requests=rpd, period=timedelta(days=1), clock=clock, sleep=sleep)
+
+    async def acquire(self, tokens: int) -> bool:
+        """Reserve a request of the estimated tokens, False if the daily quota is used up."""
+        if not self.rpd.try_acquire(1):
+            return False
+        await self.rpm.acquire(1)
+        await self.tpm.acquire(tokens)
+        return True
+
+    def settle(self, reserved: int, used: Optional[int]):
+        """Correct the reserved tokens by the usage reported by the service."""
+        if used is None:
+            return
+        self.tpm.consume(used - reserved)
+
+
+__model_limiters: Dict[Tuple[str, str], ModelLimiter] = {}
+__usage: ContextVar[Optional[Dict[str, int]]] = ContextVar("llm_usage", default=None)
+
+
+def get_model_limiter(service: str, model: str, rpm: int, tpm: int, rpd: int) -> ModelLimiter:
+    """The limiter shared by all batches of a model, it is made again when the limits are changed."""
+    key = (service, model)
+    limiter = __model_limiters.get(key)
+    if limiter is None or limiter.limits != (rpm, tpm, rpd):
+        limiter = ModelLimiter(rpm=rpm, tpm=tpm, rpd=rpd)
+        __model_limiters[key] = limiter
+    return limiter
+
+
+@contextmanager
+def track_usage() -> Iterator[Dict[str, int]]:
+    """Collect the tokens reported by report_usage() in the current task."""
+    usage = {}
+    token = __usage.set(usage)
+    try:
+        yield usage
+    finally:
+        __usage.reset(token)
+
+
+def report_usage(total_tokens: Optional[int]):
+    usage = __usage.get()
+    if usage is not None:
+        usage["total"] = total_tokens
+
+
 class ConcurrentLimiter:
     def __init__(self, n: int):
         self.semaphore = asyncio.Semaphore(n)
@@ -16,7 +16,7 @@ from .results import InsertOneResult, InsertManyResult, DeleteResult, UpdateResu
 from .write_concern import WriteConcern
 
 _SUPPORTED_FILTER_OPERATORS = ('$in', '$eq', '$gt', '$gte', '$lt', '$lte', '$ne', '$nin')
-_SUPPORTED_UPDATE_OPERATORS = ('$set', '$inc', '$push')
+_SUPPORTED_UPDATE_OPERATORS = ('$set', '$inc', '$push', '$addToSet', '$pull')
 _DEFAULT_METADATA = {
     'options': {},
     'indexes': {},
@@ -55,7 +55,13 @@ def _validate_filter(filter):
     if _id:
         if not isinstance(_id, (bson.ObjectId, str, dict)):
             raise MongitaError("If present, the '_id' filter must be a bson ObjectId, string, or a dict")
-    for query_ops in filter.values():
+    for k, query_ops in filter.items():
+        if k == '$or':
+            if not isinstance(query_ops, (list, tuple)) or not query_ops:
+                raise MongitaError("'$or' requires a non-empty list of filters")
+            for sub_filter in query_ops:
+                _validate_filter(sub_filter)
+            continue
         if isinstance(query_ops, dict):
             for op in query_ops.keys():
                 if op.startswith('$') and op not in _SUPPORTED_FILTER_OPERATORS:
@@ -150,6 +156,8 @@ def _doc_matches_agg(doc_v, query_ops):
             elif query_op == '$ne':
                 if doc_v == query_val:
                     return False
+                if isinstance(doc_v, list) and query_val in doc_v:
+                    return False
             elif query_op == '$in':
                 if not isinstance(query_val, (list, tuple, set)):
                     raise MongitaError("'$in' requires an iterable")
@@ -202,6 +210,10 @@ def _doc_matches_slow_filters(doc, slow_filters):
     :rtype: bool
     """
     for doc_key, query_ops in slow_filters.items():
+        if doc_key == '$or':
+            if any(_doc_matches_slow_filters(doc, sub_filter) for sub_filter in query_ops):
+                continue
+            return False
         if isinstance(query_ops, dict):
             doc_v = _get_item_from_doc(doc, doc_key)
             if _doc_matches_agg(doc_v, query_ops):
@@ -376,6 +388,30 @@ def _update_item_in_doc(update_op, update_op_dict, doc):
             else:
                 raise _failed_update_error(update_op, update_op_dict, doc,
                                            "Document value was not a list")
+        elif update_op == '$addToSet':
+            if isinstance(value, dict) and '$each' in value:
+                values = value['$each']
+            else:
+                values = [value]
+            if last_key not in ds:
+                ds[last_key] = []
+            elif not isinstance(ds[last_key], list):
+                raise _failed_update_error(update_op, update_op_dict, doc,
+                                           "Document value was not a list")
+            for v in values:
+                if v not in ds[last_key]:
+                    ds[last_key].append(v)
+        elif update_op == '$pull':
+            # only equality and $in conditions
+            if isinstance(value, dict) and '$in' in value:
+                values = value['$in']
+            else:
+                values = [value]
+            if isinstance(ds.get(last_key), list):
+                ds[last_key] = [v for v in ds[last_key] if v not in values]
+            elif last_key in ds:
+                raise _failed_update_error(update_op, update_op_dict, doc,
+                                           "Document value was not a list")
         # Should never get an update key we don't recognize b/c _validate_update
 
 
@@ -10,7 +10,7 @@ from bson.tz_util import utc
 from retk import config, const, utils, local_manager
 from retk.depend.mongita import MongitaClientDisk
 from retk.logger import logger
-from retk.models.search_engine.engine import BaseEngine, SearchDoc, RestoreSearchDoc
+from retk.models.search_engine.engine import BaseEngine, SearchDoc, new_restore_search_docs
 from retk.models.search_engine.engine_local import LocalSearcher
 from .coll import Collections, CollNameEnum
 from .indexing import remote_try_build_index
@@ -55,6 +55,7 @@ class Client:
         await self.init_search()
 
         if config.is_local_db():
+            await self.try_set_nodes_list_len()
             await self.local_try_create_or_restore()
             local_manager.llm.set_llm_api_to_config()
 
@@ -68,6 +69,7 @@ class Client:
 
         else:
             # self.mongo.get_io_loop = asyncio.get_running_loop
+            await self.try_set_nodes_list_len()
             await remote_try_build_index(self.coll)
 
         await self.try_restore_search()
@@ -82,6 +84,8 @@ class Client:
         self.coll.notice_system = db[CollNameEnum.notice_system.value]
         self.coll.llm_extend_node_queue = db[CollNameEnum.llm_extend_node_queue.value]
         self.coll.llm_extended_node = db[CollNameEnum.llm_extended_node.value]
+        self.coll.llm_response_cache = db[CollNameEnum.llm_response_cache.value]
+        self.coll.node_outbox = db[CollNameEnum.node_outbox.value]
 
     async def init_search(self):
         conf = config.get_settings()
@@ -111,6 +115,23 @@ class Client:
                 await self.mongo.close()
             await self.mongo.drop_database(config.get_settings().DB_NAME)
 
+    async def try_set_nodes_list_len(self):
+        """Set toNodeIdsLen and fromNodeIdsLen of the nodes saved before the lengths are kept"""
+        len_keys = {"toNodeIds": "toNodeIdsLen", "fromNodeIds": "fromNodeIdsLen"}
+        if config.is_local_db():
+            # local db not support $exists and the update pipeline, a missing field equals None.
+            # The lengths are set together, only the nodes not set yet are read
+            for doc in await self.coll.nodes.find({"toNodeIdsLen": None}).to_list(length=None):
+                await self.coll.nodes.update_one(
+                    {"id": doc["id"]},
+                    {"$set": {len_key: len(doc[key]) for key, len_key in len_keys.items()}}
+                )
+        else:
+            await self.coll.nodes.update_many(
+                {"toNodeIdsLen": {"$exists": False}},
+                [{"$set": {len_key: {"$size": f"${key}"} for key, len_key in len_keys.items()}}]
+            )
+
     async def local_try_add_default_user(self):
         _v = local_manager.recover.dump_default_dot_rethink()
 
@@ -367,23 +388,12 @@ class Client:
 
         await self.search.drop()
         await self.search.init()
-        docs = await self.coll.nodes.find({}).to_list(length=None)
+        nodes = await self.coll.nodes.find({}).to_list(length=None)
         search_docs = {}
-        for doc in docs:
-            if doc["uid"] not in search_docs:
-                search_docs[doc["uid"]] = []
-
-            search_docs[doc["uid"]].append(
-                RestoreSearchDoc(
-                    nid=doc["id"],
-                    title=doc["title"],
-                    body=doc["md"],
-                    createdAt=doc["_id"].generation_time,
-                    modifiedAt=doc["modifiedAt"],
-                    disabled=doc["disabled"],
-                    inTrash=doc["inTrash"],
-                )
-            )
+        for node, doc in zip(nodes, await new_restore_search_docs(nodes)):
+            if node["uid"] not in search_docs:
+                search_docs[node["uid"]] = []
+            search_docs[node["uid"]].append(doc)
         for uid, docs in search_docs.items():
             u = await self.coll.users.find_one({"id": uid})
             if u is None:
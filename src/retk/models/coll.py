@@ -23,6 +23,10 @@ class Collections:
     # llm
     llm_extend_node_queue: Union[Collection, "AsyncIOMotorCollection"] = None
     llm_extended_node: Union[Collection, "AsyncIOMotorCollection"] = None
+    llm_response_cache: Union[Collection, "AsyncIOMotorCollection"] = None
+
+    # the side effects of node writes
+    node_outbox: Union[Collection, "AsyncIOMotorCollection"] = None
 
 
 class CollNameEnum(str, Enum):
@@ -34,6 +38,8 @@ class CollNameEnum(str, Enum):
     notice_system = "noticeSystem"
     llm_extend_node_queue = "llmExtendNodeQueue"
     llm_extended_node = "llmExtendedNode"
+    llm_response_cache = "llmResponseCache"
+    node_outbox = "nodeOutbox"
 
     def __str__(self):
         return self.value
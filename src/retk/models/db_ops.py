@@ -1,33 +1,26 @@
-from typing import Any
+import base64
+import datetime
+import json
+from typing import Any, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
 
 from retk import config
 from retk.depend.mongita.results import UpdateResult
 from .client import client
 
 
-async def remove_from_node(from_nid: str, to_nid: str):
-    if config.is_local_db():
-        # no $pull support
-        to_n = await client.coll.nodes.find_one({"id": to_nid})
-        if to_n is None:
-            return
-        try:
-            to_n["fromNodeIds"].remove(from_nid)
-            await client.coll.nodes.update_one(
-                {"id": to_nid},
-                {"$set": {"fromNodeIds": to_n["fromNodeIds"]}}
-            )
-        except ValueError:
-            pass
-    else:
-        await client.coll.nodes.update_one(
-            {"id": to_nid},
-            {"$pull": {"fromNodeIds": from_nid}}
-        )
+# the list length is kept along with the list, so the nodes can be sorted by an index on it
+LIST_LEN_KEYS = {
+    "toNodeIds": "toNodeIdsLen",
+    "fromNodeIds": "fromNodeIdsLen",
+}
 
 
 async def node_add_to_set(id_: str, key: str, value: Any) -> UpdateResult:
     res = UpdateResult(0, 0)
+    len_key = LIST_LEN_KEYS.get(key)
     if config.is_local_db():
         # no $addToSet support
         has_new = False
@@ -40,30 +33,133 @@ async def node_add_to_set(id_: str, key: str, value: Any) -> UpdateResult:
             doc[key].append(value)
             has_new = True
         if has_new:
+            data = {key: doc[key]}
+            if len_key is not None:
+                data[len_key] = len(doc[key])
             res = await client.coll.nodes.update_one(
                 {"id": id_},
-                {"$set": {key: doc[key]}}
+                {"$set": data}
             )
     else:
+        update = {"$addToSet": {key: value}}
+        if len_key is not None:
+            update["$inc"] = {len_key: 1}
         res = await client.coll.nodes.update_one(
-            {"id": id_},
-            {"$addToSet": {key: value}}
+            {"id": id_, key: {"$ne": value}},
+            update
         )
     return res
 
 
-def sort_nodes_by_to_nids(condition: dict, page: int, limit: int):
-    if config.is_local_db():
-        docs = client.coll.nodes.find(condition).sort(
-            [("toNodeIdsLen", -1), ("_id", -1)]
-        ).skip(page * limit).limit(limit)
+async def nodes_add_to_set(ids: List[str], key: str, value: Any) -> UpdateResult:
+    # one write for all nodes, it runs under a single lock of the local db
+    update = {"$addToSet": {key: value}}
+    len_key = LIST_LEN_KEYS.get(key)
+    if len_key is not None:
+        update["$inc"] = {len_key: 1}
+    return await client.coll.nodes.update_many(
+        {"id": {"$in": ids}, key: {"$ne": value}},
+        update
+    )
+
+
+async def nodes_pull(ids: List[str], key: str, value: Any) -> UpdateResult:
+    update = {"$pull": {key: value}}
+    len_key = LIST_LEN_KEYS.get(key)
+    if len_key is not None:
+        update["$inc"] = {len_key: -1}
+    return await client.coll.nodes.update_many(
+        {"id": {"$in": ids}, key: value},
+        update
+    )
+
+
+Sort = List[Tuple[str, int]]
+
+# nodes with more links first, the newer first in a tie.
+# it is an index range scan of (uid, inTrash, disabled, toNodeIdsLen, _id)
+CORE_NODES_SORT: Sort = [("toNodeIdsLen", -1), ("_id", -1)]
+FAVORITE_NODES_SORT: Sort = [("modifiedAt", -1), ("_id", -1)]
+TRASH_NODES_SORT: Sort = [("inTrashAt", -1), ("_id", -1)]
+
+
+def encode_page_cursor(doc: dict, sort: Sort) -> str:
+    """The sort values of the last doc in a page, pass it back to continue after this doc"""
+    values = []
+    for key, _ in sort:
+        v = doc[key]
+        if isinstance(v, ObjectId):
+            v = {"oid": str(v)}
+        elif isinstance(v, datetime.datetime):
+            # iso format keeps the timezone of the stored value, the local db compares it in python
+            v = {"date": v.isoformat()}
+        values.append(v)
+    s = json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(s.encode("utf-8")).decode("ascii")
+
+
+def decode_page_cursor(cursor: str, sort: Optional[Sort] = None) -> Optional[List[Any]]:
+    """The sort values in the cursor, None if the cursor is invalid, or it does not match the sort"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        if not isinstance(values, list) or len(values) == 0:
+            return None
+        if sort is not None and len(values) != len(sort):
+            return None
+        for i, v in enumerate(values):
+            if isinstance(v, dict) and "oid" in v:
+                values[i] = ObjectId(v["oid"])
+            elif isinstance(v, dict) and "date" in v:
+                values[i] = datetime.datetime.fromisoformat(v["date"])
+    except (ValueError, TypeError, UnicodeError, InvalidId):
+        return None
+    return values
+
+
+def find_page(
+        coll,
+        condition: dict,
+        sort: Sort,
+        limit: int,
+        page: int = 0,
+        cursor: str = "",
+        projection: Optional[dict] = None,
+):
+    """Find a page of docs, continue after the cursor by the index instead of skipping the pages before it.
+
+    Args:
+        coll: the collection
+        condition:
+        sort: the keys and directions, the last key must be unique, e.g. _id
+        limit: 0 for all
+        page: ignored when cursor is given
+        cursor: the cursor of the last doc in the previous page, see `encode_page_cursor`.
+            An invalid cursor is ignored.
+        projection: not supported by the local db
+
+    Returns:
+        Cursor
+    """
+    values = decode_page_cursor(cursor, sort) if cursor != "" else None
+    if values is not None:
+        # (k0 after v0) or (k0 == v0 and k1 after v1) or ...
+        after = []
+        for i, (key, direction) in enumerate(sort):
+            c = {k: v for (k, _), v in zip(sort[:i], values[:i])}
+            c[key] = {"$lt" if direction == -1 else "$gt": values[i]}
+            after.append(c)
+        condition = {**condition, "$or": after}
+        page = 0
+    if projection is not None:
+        docs = coll.find(condition, projection=projection).sort(sort)
     else:
-        docs = client.coll.nodes.aggregate([
-            {"$match": condition},
-            {"$addFields": {"toNodeIdsLen": {"$size": "$toNodeIds"}}},
-            {"$sort": {"toNodeIdsLen": -1}},
-            {"$sort": {"_id": -1}},
-            {"$skip": page * limit},
-            {"$limit": limit},
-        ])
+        docs = coll.find(condition).sort(sort)
+    if limit > 0:
+        docs = docs.skip(page * limit).limit(limit)
     return docs
+
+
+def next_page_cursor(docs: List[dict], sort: Sort, limit: int) -> str:
+    if 0 < limit <= len(docs):
+        return encode_page_cursor(docs[-1], sort)
+    return ""
@@ -19,6 +19,8 @@ async def remote_try_build_index(coll: Collections):
     await notice_manager_delivery_coll(coll.notice_manager_delivery)
     await notice_system_coll(coll.notice_system)
     await llm_extend_node_queue_coll(coll.llm_extend_node_queue)
+    await node_outbox_coll(coll.node_outbox)
+    await llm_response_cache_coll(coll.llm_response_cache)
 
 
 async def not_in_and_create_index(coll: "AsyncIOMotorCollection", index_info, keys: list, unique: bool) -> str:
@@ -66,6 +68,20 @@ async def nodes_coll(coll: "AsyncIOMotorCollection"):
         keys=[("uid", 1), ("id", -1)],
         unique=True
     )
+    # core nodes, sorted by the toNodeIds length
+    await not_in_and_create_index(
+        coll=coll,
+        index_info=index_info,
+        keys=[("uid", 1), ("inTrash", 1), ("disabled", 1), ("toNodeIdsLen", -1), ("_id", -1)],
+        unique=False
+    )
+    # trash auto clean, by the time in trash
+    await not_in_and_create_index(
+        coll=coll,
+        index_info=index_info,
+        keys=[("inTrash", 1), ("inTrashAt", 1), ("_id", 1)],
+        unique=False
+    )
 
 
 async def import_data_coll(coll: "AsyncIOMotorCollection"):
@@ -122,6 +138,13 @@ async def notice_system_coll(coll: "AsyncIOMotorCollection"):
         keys=["recipientId", "read"],
         unique=False
     )
+    # the notices of a user, newest first
+    await not_in_and_create_index(
+        coll=coll,
+        index_info=index_info,
+        keys=[("recipientId", 1), ("_id", -1)],
+        unique=False
+    )
     await not_in_and_create_index(
         coll=coll,
         index_info=index_info,
@@ -148,3 +171,50 @@ async def llm_extended_node_coll(coll: "AsyncIOMotorCollection"):
         keys=["uid", "sourceNid"],
         unique=True,
     )
+
+
+async def node_outbox_coll(coll: "AsyncIOMotorCollection"):
+    index_info = await coll.index_information()
+    # one job of a node, the later side effects are merged into it
+    await not_in_and_create_index(
+        coll=coll,
+        index_info=index_info,
+        keys=["nid"],
+        unique=True,
+    )
+    await not_in_and_create_index(
+        coll=coll,
+        index_info=index_info,
+        keys=["failed", "runAt"],
+        unique=False,
+    )
+    # the oldest pending job for the lag
+    await not_in_and_create_index(
+        coll=coll,
+        index_info=index_info,
+        keys=["failed", "createdAt"],
+        unique=False,
+    )
+
+
+async def llm_response_cache_coll(coll: "AsyncIOMotorCollection"):
+    index_info = await coll.index_information()
+    await not_in_and_create_index(
+        coll=coll,
+        index_info=index_info,
+        keys=["key"],
+        unique=True,
+    )
+    # the expired and least recently hit responses are evicted
+    await not_in_and_create_index(
+        coll=coll,
+        index_info=index_info,
+        keys=["createdAt"],
+        unique=False,
+    )
+    await not_in_and_create_index(
+        coll=coll,
+        index_info=index_info,
+        keys=["hitAt"],
+        unique=False,
+    )
@@ -1,3 +1,6 @@
 # flake8: noqa
-from .engine import SearchDoc, SearchResult, BaseEngine
+from .engine import (
+    SearchDoc, SearchResult, BaseEngine, RestoreSearchDoc, new_restore_search_docs, encode_cursor, decode_cursor,
+)
 from .engine_local import LocalSearcher
+from .engine_memory import MemorySearcher
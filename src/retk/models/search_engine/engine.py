@@ -1,12 +1,14 @@
+import base64
 import datetime
+import json
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, InitVar
 from pathlib import Path
-from typing import List, Tuple, Sequence, Literal
+from typing import List, Tuple, Sequence, Literal, Optional, Any
 
 from retk import const
-from retk.models.tps import AuthedUser
-from retk.utils import strip_html_tags
+from retk.models.tps import AuthedUser, Node
+from retk.utils import strip_html_tags, strip_html_tags_batch
 
 
 @dataclass
@@ -29,10 +31,30 @@ class RestoreSearchDoc:
     modifiedAt: datetime.datetime
     disabled: bool
     inTrash: bool
-
-    def __post_init__(self):
-        self.title = strip_html_tags(self.title)
-        self.body = strip_html_tags(self.body)
+    # False if the title and body are stripped already, see `new_restore_search_docs`
+    strip: InitVar[bool] = True
+
+    def __post_init__(self, strip: bool):
+        if strip:
+            self.title = strip_html_tags(self.title)
+            self.body = strip_html_tags(self.body)
+
+
+async def new_restore_search_docs(nodes: List[Node]) -> List[RestoreSearchDoc]:
+    """The search docs of the nodes, their html are stripped in one batch"""
+    texts = await strip_html_tags_batch([n["title"] for n in nodes] + [n["md"] for n in nodes])
+    return [
+        RestoreSearchDoc(
+            nid=n["id"],
+            title=title,
+            body=body,
+            createdAt=n["_id"].generation_time,
+            modifiedAt=n["modifiedAt"],
+            disabled=n["disabled"],
+            inTrash=n["inTrash"],
+            strip=False,
+        ) for n, title, body in zip(nodes, texts[:len(nodes)], texts[len(nodes):])
+    ]
 
 
 @dataclass
@@ -41,6 +63,23 @@ class SearchResult:
     score: float
     titleHighlight: str
     bodyHighlights: List[str]
+    # opaque position of this hit, pass it back to continue after this hit
+    cursor: str = ""
+
+
+def encode_cursor(sort_values: Sequence[Any]) -> str:
+    s = json.dumps(list(sort_values), ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(s.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Optional[List[Any]]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(values, list) or len(values) < 2:
+        return None
+    return values
 
 
 __s1 = (Path(__file__).parent / "cn_stopwords.txt").read_text(encoding="utf-8").splitlines()
@@ -74,23 +113,23 @@ class BaseEngine(ABC):
         ...
 
     @abstractmethod
-    async def to_trash(self, au: AuthedUser, nid: str) -> const.CodeEnum:
+    async def to_trash(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
         ...
 
     @abstractmethod
-    async def restore_from_trash(self, au: AuthedUser, nid: str) -> const.CodeEnum:
+    async def restore_from_trash(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
         ...
 
     @abstractmethod
-    async def disable(self, au: AuthedUser, nid: str) -> const.CodeEnum:
+    async def disable(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
         ...
 
     @abstractmethod
-    async def enable(self, au: AuthedUser, nid: str) -> const.CodeEnum:
+    async def enable(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
         ...
 
     @abstractmethod
-    async def delete(self, au: AuthedUser, nid: str) -> const.CodeEnum:
+    async def delete(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
         ...
 
     @abstractmethod
@@ -128,6 +167,7 @@ class BaseEngine(ABC):
             page_size: int = 10,
             exclude_nids: Sequence[str] = None,
             with_stop_analyzer: bool = False,
+            cursor: str = "",
     ):
         ...
 
@@ -143,7 +183,24 @@ class BaseEngine(ABC):
             page: int = 1,
             limit: int = 10,
             exclude_nids: Sequence[str] = None,
+            cursor: str = "",
     ) -> Tuple[List[SearchResult], int]:
+        """
+
+        Args:
+            au:
+            query:
+            sort_key:
+            reverse:
+            page: ignored when cursor is given
+            limit:
+            exclude_nids:
+            cursor: SearchResult.cursor of the last hit in the previous page,
+                the results continue after it without skipping over the previous pages
+
+        Returns:
+            Tuple[List[SearchResult], int]: results, total
+        """
         ...
 
     @abstractmethod
@@ -160,6 +217,10 @@ class BaseEngine(ABC):
     async def refresh(self):
         ...
 
+    @abstractmethod
+    async def flush(self, refresh: bool = False) -> const.CodeEnum:
+        ...
+
     @abstractmethod
     async def count_all(self) -> int:
         ...
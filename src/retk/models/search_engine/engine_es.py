@@ -1,15 +1,17 @@
+import asyncio
 import datetime
-from typing import List, Tuple, Sequence, Dict, Any, Literal
+from dataclasses import dataclass
+from typing import List, Tuple, Sequence, Dict, Any, Literal, Optional, Set
 
 from bson.tz_util import utc
 from elastic_transport import ObjectApiResponse
-from elasticsearch import AsyncElasticsearch, helpers
+from elasticsearch import AsyncElasticsearch, BadRequestError, TransportError, helpers
 
 from retk import const
 from retk.config import get_settings
 from retk.logger import logger
 from retk.models.search_engine.engine import (
-    BaseEngine, SearchDoc, SearchResult, RestoreSearchDoc, STOPWORDS,
+    BaseEngine, SearchDoc, SearchResult, RestoreSearchDoc, STOPWORDS, encode_cursor, decode_cursor,
 )
 from retk.models.tps import AuthedUser
 
@@ -23,13 +25,32 @@ def get_utc_now() -> str:
     return datetime2str(now)
 
 
+@dataclass
+class ReindexProgress:
+    index: str
+    total: int = 0
+    created: int = 0
+    # documents written by the dual writes before the reindex tasks reached them
+    conflicts: int = 0
+    done: bool = False
+
+    @property
+    def copied(self) -> int:
+        return self.created + self.conflicts
+
+
 class ESSearcher(BaseEngine):
     es: AsyncElasticsearch
     index: str
+    reindex_poll_interval = 1.  # seconds
     properties = {
         "uid": {
             "type": "keyword"
         },
+        # a copy of _id, sorting on _id is not allowed, this is the tiebreaker for search_after
+        "nid": {
+            "type": "keyword"
+        },
         "title": {
             "type": "text",
             "analyzer": "ik_analyzer",
@@ -105,6 +126,27 @@ class ESSearcher(BaseEngine):
     def __init__(self):
         super().__init__()
         self.index = ""
+        # single-document writes are buffered per nid and sent by bulk requests
+        self._pending: Dict[str, dict] = {}
+        # resolved with the code when the pending actions are sent, the writers wait on it
+        self._pending_result: Optional[asyncio.Future] = None
+        # one of the pending actions asks to be visible to search once it is sent
+        self._pending_refresh = False
+        # the delayed flushes failed in a row by connection errors, the retry waits longer each time
+        self._flush_retries = 0
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # all bulk writes hold this lock, so the alias swap of reindex sees no write in flight
+        self._write_lock: Optional[asyncio.Lock] = None
+        # while reindexing, writes go to both the current index and this one
+        self._reindex_target: Optional[str] = None
+        self._reindex_task: Optional[asyncio.Task] = None
+        # nid -> uid of the documents which may be copied before their last write
+        self._reindex_stale: Dict[str, str] = {}
+        self._reindex_deleted_uids: Set[str] = set()
+        # the documents written during an unlocked catch up, by nid to the routing uid
+        self._reindex_written: Optional[Dict[str, str]] = None
+        self.reindex_progress: Optional[ReindexProgress] = None
 
     async def connect(self):
         try:
@@ -128,156 +170,283 @@ class ESSearcher(BaseEngine):
     async def init(self):
         # please install es 8.11.0
         await self.connect()
+        self._clear_pending()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._write_lock = asyncio.Lock()
         info = await self.es.info()
         if info.body["version"]["number"] != "8.11.0":
             raise ValueError("please install es 8.11.0")
 
         # if no index found, create one
         if self.index == "" or not await self.es.indices.exists(index=self.index):
-            # install ik plugin: https://github.com/medcl/elasticsearch-analysis-ik
             self.index = f"{get_settings().ES_INDEX_ALIAS}-1"
-            resp = await self.es.indices.create(
-                index=self.index,
-                aliases={get_settings().ES_INDEX_ALIAS: {}},
-                settings={
-                    "index": {
-                        "number_of_shards": 1,
-                        "number_of_replicas": 0,
-                        "refresh_interval": "3s",
-                    },
-                    "analysis": self.analysis,
-                },
-                mappings={
-                    "properties": self.properties,
-                }
-            )
+            resp = await self._create_index(index=self.index)
             if resp.meta.status != 200:
                 raise RuntimeError(f"create index failed, resp: {resp}")
 
+        mapping = await self.es.indices.get_mapping(index=self.index)
+        if "nid" not in mapping.body[self.index]["mappings"].get("properties", {}):
+            await self.es.indices.put_mapping(
+                index=self.index,
+                properties={"nid": self.properties["nid"]},
+            )
+            # fill the field for documents indexed before it was mapped
+            await self.es.update_by_query(
+                index=self.index,
+                query={"bool": {"must_not": {"exists": {"field": "nid"}}}},
+                script={"source": "ctx._source.nid = ctx._id"},
+                conflicts="proceed",
+                wait_for_completion=False,
+            )
+
         settings = await self.es.indices.get_settings(index=self.index)
-        try:
-            analysis = settings.body[self.index]["settings"]["index"]["analysis"]
-            if analysis != self.analysis:
-                await self.reindex()
-        except KeyError:
-            await self.reindex()
+        index_settings = settings.body[self.index]["settings"]["index"]
+        # the number of shards of an existing index cannot be changed, it has to be reindexed
+        if index_settings.get("analysis") != self.analysis \
+                or int(index_settings["number_of_shards"]) != get_settings().ES_NUMBER_OF_SHARDS:
+            # the old index keeps serving until the new one is ready
+            self._reindex_task = asyncio.create_task(self.reindex())
+            self._reindex_task.add_done_callback(self._on_reindex_done)
 
-    async def reindex(self):
-        await self.connect()
-        new_index_num = int(self.index.split("-")[-1]) + 1
-        new_index = f"{get_settings().ES_INDEX_ALIAS}-{new_index_num}"
+    @staticmethod
+    def _on_reindex_done(task: asyncio.Task):
+        if task.cancelled():
+            return
+        e = task.exception()
+        if e is not None:
+            logger.error(f"elasticsearch reindex failed: {e}")
 
-        resp = await self.es.indices.create(
-            index=new_index,
-            aliases={get_settings().ES_INDEX_ALIAS: {}},
+    async def _create_index(self, index: str, with_alias: bool = True) -> ObjectApiResponse[Any]:
+        # install ik plugin: https://github.com/medcl/elasticsearch-analysis-ik
+        return await self.es.indices.create(
+            index=index,
+            aliases={get_settings().ES_INDEX_ALIAS: {}} if with_alias else None,
             settings={
                 "index": {
-                    "number_of_shards": 1,
+                    "number_of_shards": get_settings().ES_NUMBER_OF_SHARDS,
                     "number_of_replicas": 0,
                     "refresh_interval": "3s",
                 },
                 "analysis": self.analysis,
             },
             mappings={
+                # documents are routed by uid, one user's notes stay in one shard
+                "_routing": {"required": True},
                 "properties": self.properties,
             }
         )
+
+    async def reindex(self):
+        """Copy all documents into a new index without blocking reads and writes.
+
+        Searches keep using the old index, and every write goes to both indices while the
+        documents are copied by sliced reindex tasks. The alias is moved to the new index in
+        one atomic request once the copy has caught up with the writes made during it.
+        """
+        await self.connect()
+        if self._reindex_target is not None:
+            logger.info(f"elasticsearch reindex to {self._reindex_target} is already running")
+            return
+        old_index = self.index
+        new_index_num = int(old_index.split("-")[-1]) + 1
+        new_index = f"{get_settings().ES_INDEX_ALIAS}-{new_index_num}"
+
+        # left by an interrupted reindex, the alias has never been moved to it
+        if await self.es.indices.exists(index=new_index):
+            await self.es.indices.delete(index=new_index)
+        resp = await self._create_index(index=new_index, with_alias=False)
         if resp.meta.status != 200:
             raise RuntimeError(f"create index for reindexing failed, resp: {resp}")
 
-        resp = await self.es.reindex(
-            body={
-                "source": {
-                    "index": self.index,
+        self._reindex_target = new_index
+        self._reindex_stale = {}
+        self._reindex_deleted_uids = set()
+        self.reindex_progress = ReindexProgress(index=new_index)
+        try:
+            resp = await self.es.reindex(
+                body={
+                    "source": {
+                        "index": old_index,
+                    },
+                    "dest": {
+                        "index": new_index,
+                        # documents already written by the dual writes are newer, keep them
+                        "op_type": "create",
+                    },
+                    "conflicts": "proceed",
+                    # the old index may not be routed by uid
+                    "script": {
+                        "source": "ctx._routing = ctx._source.uid",
+                    },
                 },
-                "dest": {
-                    "index": new_index,
-                }
-            }
-        )
-        if resp.meta.status != 200:
-            raise RuntimeError(f"reindex failed, resp: {resp}")
-        resp = await self.es.indices.delete(index=self.index)
+                slices="auto",
+                wait_for_completion=False,
+            )
+            task_id = resp["task"]
+            while True:
+                await asyncio.sleep(self.reindex_poll_interval)
+                task = await self.es.tasks.get(task_id=task_id)
+                status = task["task"]["status"]
+                self.reindex_progress.total = status.get("total", 0)
+                self.reindex_progress.created = status.get("created", 0)
+                self.reindex_progress.conflicts = status.get("version_conflicts", 0)
+                logger.info(
+                    f"elasticsearch reindex to {new_index}: "
+                    f"{self.reindex_progress.copied}/{self.reindex_progress.total}"
+                )
+                if task["completed"]:
+                    break
+            failures = task.get("response", {}).get("failures", [])
+            if len(failures) > 0:
+                raise RuntimeError(f"reindex failed, failures: {failures}")
+
+            # most of the stale documents are taken here without blocking the writes
+            await self._reindex_catch_up(unlocked=True)
+            # no write can slip in between the last catch up and the alias swap
+            async with self._write_lock:
+                await self._reindex_catch_up()
+                resp = await self.es.indices.update_aliases(actions=[
+                    {"remove": {"index": old_index, "alias": get_settings().ES_INDEX_ALIAS}},
+                    {"add": {"index": new_index, "alias": get_settings().ES_INDEX_ALIAS}},
+                ])
+                if resp.meta.status != 200:
+                    raise RuntimeError(f"swap index alias failed, resp: {resp}")
+                self.index = new_index
+                self._reindex_target = None
+        finally:
+            self._reindex_target = None
+
+        resp = await self.es.indices.delete(index=old_index)
         if resp.meta.status != 200:
-            raise RuntimeError(f"reindex failed, resp: {resp}")
+            raise RuntimeError(f"delete old index failed, resp: {resp}")
+        self.reindex_progress.done = True
+        logger.info(f"elasticsearch reindex finished, new index: {self.index}")
 
-        self.index = new_index
-        logger.debug(f"elasticsearch reindex finished, new index: {self.index}")
+    async def _reindex_catch_up(self, unlocked: bool = False):
+        if unlocked:
+            self._reindex_written = {}
+            try:
+                await self._reindex_catch_up()
+            finally:
+                # a copy taken by this pass may overwrite a newer dual write, take them again in the locked pass
+                self._reindex_stale.update(self._reindex_written)
+                self._reindex_written = None
+            return
+        # documents updated or deleted before the reindex tasks copied them,
+        # the copies may be stale, so take them again from the old index
+        stale, self._reindex_stale = self._reindex_stale, {}
+        deleted_uids, self._reindex_deleted_uids = self._reindex_deleted_uids, set()
+        for uid in deleted_uids:
+            await self.es.delete_by_query(
+                index=self._reindex_target,
+                query={"term": {"uid": uid}},
+                conflicts="proceed",
+                routing=uid,
+            )
+        if len(stale) == 0:
+            return
+        resp = await self.es.mget(
+            index=self.index,
+            docs=[{"_id": nid, "routing": uid} for nid, uid in stale.items()],
+        )
+        actions = []
+        for doc in resp["docs"]:
+            if doc.get("found", False):
+                actions.append({
+                    "_op_type": "index",
+                    "_id": doc["_id"],
+                    "_routing": doc["_source"]["uid"],
+                    "_source": doc["_source"],
+                })
+            else:
+                actions.append({
+                    "_op_type": "delete",
+                    "_id": doc["_id"],
+                    "_routing": stale[doc["_id"]],
+                })
+        await helpers.async_bulk(
+            client=self.es,
+            actions=actions,
+            index=self._reindex_target,
+            raise_on_error=False,
+        )
 
     async def close(self):
+        if self._reindex_task is not None:
+            self._reindex_task.cancel()
+            self._reindex_task = None
+        await self.flush()
+        if self._flush_task is not None:
+            # the retry of a failed flush
+            self._flush_task.cancel()
+            self._flush_task = None
         await self.es.close()
 
     async def drop(self):
         await self.connect()
-        if self.index != "" and await self.es.indices.exists(index=self.index):
-            await self.es.indices.delete(index=self.index)
+        self._clear_pending()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._reindex_task is not None:
+            self._reindex_task.cancel()
+            self._reindex_task = None
+        for index in [self.index, self._reindex_target]:
+            if index and await self.es.indices.exists(index=index):
+                await self.es.indices.delete(index=index)
+        self._reindex_target = None
         self.index = ""
         await self.es.close()
         del self.es
 
     async def add(self, au: AuthedUser, doc: SearchDoc) -> const.CodeEnum:
         now = get_utc_now()
-        resp = await self.es.index(
-            index=self.index,
-            document={
-                "uid": au.u.id,
-                "title": doc.title,
-                "body": doc.body,
-                "modifiedAt": now,
-                "createdAt": now,
-                "disabled": False,
-                "inTrash": False,
-            },
-            id=doc.nid,
-        )
-        if resp.meta.status != 201:
-            logger.error(f"add failed {au.u.id=} {doc.nid=}")
-            return const.CodeEnum.OPERATION_FAILED
-        return const.CodeEnum.OK
-
-    async def update(self, au: AuthedUser, doc: SearchDoc) -> const.CodeEnum:
-        now = get_utc_now()
-        resp = await self.es.update(
-            index=self.index,
-            id=doc.nid,
-            body={
-                "doc": {
+        return await self._enqueue(
+            nid=doc.nid,
+            action={
+                "_op_type": "index",
+                "_id": doc.nid,
+                "_routing": au.u.id,
+                "_source": {
                     "uid": au.u.id,
+                    "nid": doc.nid,
                     "title": doc.title,
                     "body": doc.body,
                     "modifiedAt": now,
-                }
-            }
+                    "createdAt": now,
+                    "disabled": False,
+                    "inTrash": False,
+                },
+            },
+            refresh=False,
         )
-        if resp.meta.status != 200:
-            logger.error(f"update failed {au.u.id=} {doc.nid=}")
-            return const.CodeEnum.OPERATION_FAILED
-        return const.CodeEnum.OK
 
-    async def to_trash(self, au: AuthedUser, nid: str) -> const.CodeEnum:
-        resp = await self.es.update(
-            index=self.index,
-            id=nid,
-            body={
-                "doc": {
-                    "inTrash": True,
-                }
+    async def update(self, au: AuthedUser, doc: SearchDoc) -> const.CodeEnum:
+        now = get_utc_now()
+        return await self._enqueue_update(
+            uid=au.u.id,
+            nid=doc.nid,
+            doc={
+                "uid": au.u.id,
+                "title": doc.title,
+                "body": doc.body,
+                "modifiedAt": now,
             },
-            refresh=True,
+            refresh=False,
         )
-        if resp.meta.status != 200:
-            logger.error(f"to trash failed {au.u.id=} {nid=}")
-            return const.CodeEnum.OPERATION_FAILED
-        return const.CodeEnum.OK
+
+    async def to_trash(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
+        return await self._enqueue_update(uid=au.u.id, nid=nid, doc={"inTrash": True}, refresh=refresh)
 
     async def batch_to_trash(self, au: AuthedUser, nids: List[str]) -> const.CodeEnum:
-        resp = await helpers.async_bulk(
-            client=self.es,
+        await self.flush()
+        resp = await self._bulk(
             actions=[
                 {
                     "_op_type": "update",
-                    "_index": get_settings().ES_INDEX_ALIAS,
                     "_id": nid,
+                    "_routing": au.u.id,
                     "doc": {
                         "inTrash": True,
                     }
@@ -291,30 +460,17 @@ class ESSearcher(BaseEngine):
         await self.refresh()
         return const.CodeEnum.OK
 
-    async def restore_from_trash(self, au: AuthedUser, nid: str) -> const.CodeEnum:
-        resp = await self.es.update(
-            index=self.index,
-            id=nid,
-            body={
-                "doc": {
-                    "inTrash": False,
-                }
-            },
-            refresh=True,
-        )
-        if resp.meta.status != 200:
-            logger.error(f"restore from trash failed {au.u.id=} {nid=}")
-            return const.CodeEnum.OPERATION_FAILED
-        return const.CodeEnum.OK
+    async def restore_from_trash(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
+        return await self._enqueue_update(uid=au.u.id, nid=nid, doc={"inTrash": False}, refresh=refresh)
 
     async def restore_batch_from_trash(self, au: AuthedUser, nids: str) -> const.CodeEnum:
-        resp = await helpers.async_bulk(
-            client=self.es,
+        await self.flush()
+        resp = await self._bulk(
             actions=[
                 {
                     "_op_type": "update",
-                    "_index": get_settings().ES_INDEX_ALIAS,
                     "_id": nid,
+                    "_routing": au.u.id,
                     "doc": {
                         "inTrash": False,
                     }
@@ -328,42 +484,20 @@ class ESSearcher(BaseEngine):
         await self.refresh()
         return const.CodeEnum.OK
 
-    async def disable(self, au: AuthedUser, nid: str) -> const.CodeEnum:
-        resp = await self.es.update(
-            index=self.index,
-            id=nid,
-            body={
-                "doc": {
-                    "disabled": True,
-                }
-            },
-            refresh=True,
-        )
-        if resp.meta.status != 200:
-            logger.error(f"disable failed {au.u.id=} {nid=}")
-            return const.CodeEnum.OPERATION_FAILED
-        return const.CodeEnum.OK
+    async def disable(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
+        return await self._enqueue_update(uid=au.u.id, nid=nid, doc={"disabled": True}, refresh=refresh)
 
-    async def enable(self, au: AuthedUser, nid: str) -> const.CodeEnum:
-        resp = await self.es.update(
-            index=self.index,
-            id=nid,
-            body={
-                "doc": {
-                    "disabled": False,
-                }
-            },
-            refresh=True,
-        )
-        if resp.meta.status != 200:
-            logger.error(f"enable failed {au.u.id=} {nid=}")
-            return const.CodeEnum.OPERATION_FAILED
-        return const.CodeEnum.OK
+    async def enable(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
+        return await self._enqueue_update(uid=au.u.id, nid=nid, doc={"disabled": False}, refresh=refresh)
 
-    async def delete(self, au: AuthedUser, nid: str) -> const.CodeEnum:
+    async def delete(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
+        # the ownership and trash checks below must see the buffered writes
+        if nid in self._pending:
+            await self.flush()
         doc = await self.es.get(
             index=self.index,
             id=nid,
+            routing=au.u.id,
         )
         if doc["_source"]["uid"] != au.u.id:
             logger.error(f"node not belong to user {au.u.id=} {nid=}")
@@ -372,15 +506,15 @@ class ESSearcher(BaseEngine):
             logger.error(f"doc not in trash, deletion failed {au.u.id=} {nid=}")
             return const.CodeEnum.OPERATION_FAILED
 
-        resp = await self.es.delete(
-            index=self.index,
-            id=nid,
-            refresh=True,
+        return await self._enqueue(
+            nid=nid,
+            action={
+                "_op_type": "delete",
+                "_id": nid,
+                "_routing": au.u.id,
+            },
+            refresh=refresh,
         )
-        if resp.meta.status != 201:
-            logger.error(f"delete failed {au.u.id=} {nid=}")
-            return const.CodeEnum.OPERATION_FAILED
-        return const.CodeEnum.OK
 
     async def add_batch(self, au: AuthedUser, docs: List[SearchDoc]) -> const.CodeEnum:
         actions = []
@@ -392,41 +526,47 @@ class ESSearcher(BaseEngine):
             d["createdAt"] = datetime2str(now)
             d["modifiedAt"] = d["createdAt"]
             d["uid"] = au.u.id
-            nid = d.pop("nid")
+            nid = d["nid"]
             # insert a creation operation
             actions.append({
                 "_op_type": "create",
-                "_index": get_settings().ES_INDEX_ALIAS,
                 "_id": nid,
+                "_routing": au.u.id,
                 "_source": d
             })
             now = now + datetime.timedelta(seconds=0.001)
         return await self._batch_ops(actions, op_type="add", refresh=False)
 
     async def delete_batch(self, au: AuthedUser, nids: List[str]) -> const.CodeEnum:
-        resp = await self.es.delete_by_query(
-            index=self.index,
-            body={
-                "query": {
-                    "bool": {
-                        "must": [
-                            {"ids": {"values": nids}},
-                            {
-                                "term": {
-                                    "uid": au.u.id
-                                }
-                            },
-                            {
-                                "term": {
-                                    "inTrash": True
+        await self.flush()
+        async with self._write_lock:
+            if self._reindex_target is not None:
+                # removed from the new index when the reindex catches up
+                self._reindex_stale.update({nid: au.u.id for nid in nids})
+            resp = await self.es.delete_by_query(
+                index=self.index,
+                body={
+                    "query": {
+                        "bool": {
+                            "must": [
+                                {"ids": {"values": nids}},
+                                {
+                                    "term": {
+                                        "uid": au.u.id
+                                    }
+                                },
+                                {
+                                    "term": {
+                                        "inTrash": True
+                                    }
                                 }
-                            }
-                        ]
+                            ]
+                        }
                     }
-                }
-            },
-            refresh=True,
-        )
+                },
+                refresh=True,
+                routing=au.u.id,
+            )
 
         if resp.meta.status != 200:
             logger.error(f"delete batch failed, resp: {resp}")
@@ -437,24 +577,29 @@ class ESSearcher(BaseEngine):
         return const.CodeEnum.OK
 
     async def force_delete_all(self, uid: str) -> const.CodeEnum:
-        resp = await self.es.delete_by_query(
-            index=self.index,
-            body={
-                "query": {
-                    "bool": {
-                        "must": [
-                            {
-                                "term": {
-                                    "uid": uid
-                                }
-                            },
+        await self.flush()
+        async with self._write_lock:
+            if self._reindex_target is not None:
+                self._reindex_deleted_uids.add(uid)
+            resp = await self.es.delete_by_query(
+                index=self.index,
+                body={
+                    "query": {
+                        "bool": {
+                            "must": [
+                                {
+                                    "term": {
+                                        "uid": uid
+                                    }
+                                },
 
-                        ]
+                            ]
+                        }
                     }
-                }
-            },
-            refresh=True,
-        )
+                },
+                refresh=True,
+                routing=uid,
+            )
         if resp.meta.status != 200:
             logger.error(f"force delete all failed, resp: {resp}")
             return const.CodeEnum.OPERATION_FAILED
@@ -470,8 +615,8 @@ class ESSearcher(BaseEngine):
             nid = d.pop("nid")
             actions.append({
                 "_op_type": "update",
-                "_index": get_settings().ES_INDEX_ALIAS,
                 "_id": nid,
+                "_routing": au.u.id,
                 "doc": d
             })
             now = now + datetime.timedelta(seconds=0.001)
@@ -484,12 +629,12 @@ class ESSearcher(BaseEngine):
             d["createdAt"] = datetime2str(d["createdAt"])
             d["modifiedAt"] = datetime2str(d["modifiedAt"])
             d["uid"] = au.u.id
-            nid = d.pop("nid")
+            nid = d["nid"]
             # insert a creation operation
             actions.append({
                 "_op_type": "create",
-                "_index": get_settings().ES_INDEX_ALIAS,
                 "_id": nid,
+                "_routing": au.u.id,
                 "_source": d
             })
         return await self._batch_ops(actions, "restore", refresh=True)
@@ -506,23 +651,27 @@ class ESSearcher(BaseEngine):
             page_size: int = 10,
             exclude_nids: Sequence[str] = None,
             with_stop_analyzer: bool = False,
+            cursor: str = "",
     ) -> ObjectApiResponse[Any]:
         if page < 0:
             raise ValueError("page must >= 0")
+        order = "desc" if reverse else "asc"
         if sort_key is None or sort_key in ["", "similarity"]:
             sort = ["_score"]
         elif sort_key == "title":
-            sort = [{"title.keyword": {"order": "desc" if reverse else "asc"}}, "_score"]
+            sort = [{"title.keyword": {"order": order}}, "_score"]
         elif sort_key in ["createdAt", "modifiedAt"]:
             sort = [
                 {sort_key: {
-                    "order": "desc" if reverse else "asc",
+                    "order": order,
                     "format": "strict_date_optional_time_nanos"
                 }},
                 "_score",
             ]
         else:
             raise ValueError(f"sort_key {sort_key} not supported")
+        # unique tiebreaker, so the sort values of a hit locate one position for search_after
+        sort.append({"nid": {"order": order, "missing": "_last"}})
         # select uid = au.u.id, disabled = false, inTrash = false
         query_dict: Dict[str, Any] = {
             "bool": {
@@ -568,25 +717,40 @@ class ESSearcher(BaseEngine):
                 }
             }]
 
-        resp = await self.es.search(
-            index=self.index,
-            body={
-                "query": query_dict,
-                "sort": sort,
-                "from": page * page_size,
-                "size": page_size,
-                "highlight": {
-                    "pre_tags": [
-                        f"<{self.hl_tag_name} class=\"{self.hl_class_name} {self.hl_term_prefix}{i}\">"
-                        for i in range(5)
-                    ],
-                    "post_tags": [f"</{self.hl_tag_name}>" for _ in range(5)],
-                    "fields": {
-                        "body": {},
-                        "title": {},
-                    }
-                },
-            })
+        body = {
+            "query": query_dict,
+            "sort": sort,
+            "from": page * page_size,
+            "size": page_size,
+            "highlight": {
+                "pre_tags": [
+                    f"<{self.hl_tag_name} class=\"{self.hl_class_name} {self.hl_term_prefix}{i}\">"
+                    for i in range(5)
+                ],
+                "post_tags": [f"</{self.hl_tag_name}>" for _ in range(5)],
+                "fields": {
+                    "body": {},
+                    "title": {},
+                }
+            },
+        }
+        if cursor != "":
+            search_after = decode_cursor(cursor)
+            if search_after is None or len(search_after) != len(sort):
+                raise ValueError(f"invalid cursor: {cursor}")
+            body["from"] = 0
+            body["search_after"] = search_after
+        try:
+            resp = await self.es.search(
+                index=self.index,
+                body=body,
+                routing=au.u.id,
+            )
+        except BadRequestError:
+            if cursor == "":
+                raise
+            # the values do not fit the sort, e.g. a cursor of another sort key
+            raise ValueError(f"invalid cursor: {cursor}")
         return resp
 
     async def search(
@@ -600,6 +764,7 @@ class ESSearcher(BaseEngine):
             page: int = 0,
             limit: int = 10,
             exclude_nids: Sequence[str] = None,
+            cursor: str = "",
     ) -> Tuple[List[SearchResult], int]:
         resp = await self._search(
             au=au,
@@ -610,6 +775,7 @@ class ESSearcher(BaseEngine):
             page_size=limit,
             exclude_nids=exclude_nids,
             with_stop_analyzer=False,
+            cursor=cursor,
         )
         hits = resp["hits"]["hits"]
         total = resp["hits"]["total"]["value"]
@@ -619,6 +785,7 @@ class ESSearcher(BaseEngine):
                 score=hit["_score"] if hit["_score"] is not None else 0.,
                 titleHighlight=self.get_hl(hit, "title", first=True, default=hit["_source"]["title"]),
                 bodyHighlights=self.get_hl(hit, "body", first=False, default=hit["_source"]["body"][:60] + "..."),
+                cursor=encode_cursor(hit["sort"]),
             ) for hit in hits
         ], total
 
@@ -661,11 +828,183 @@ class ESSearcher(BaseEngine):
         return resp["count"]
 
     async def refresh(self):
+        await self.flush()
         await self.es.indices.refresh(index=self.index)
 
+    async def flush(self, refresh: bool = False) -> const.CodeEnum:
+        if self._flush_lock is None:
+            return const.CodeEnum.OK
+        async with self._flush_lock:
+            if self._flush_task is not None:
+                self._flush_task.cancel()
+                self._flush_task = None
+            actions = list(self._pending.values())
+            result = self._pending_result
+            # the writers may ask for a refresh before another flush takes their actions
+            refresh = refresh or self._pending_refresh
+            self._pending = {}
+            self._pending_result = None
+            self._pending_refresh = False
+            if len(actions) == 0:
+                return const.CodeEnum.OK
+            code = const.CodeEnum.OPERATION_FAILED
+            try:
+                code = await self._flush_actions(actions=actions, refresh=refresh)
+            finally:
+                if result is not None and not result.done():
+                    result.set_result(code)
+        return code
+
+    async def _flush_actions(self, actions: List[dict], refresh: bool) -> const.CodeEnum:
+        try:
+            resp = await self._bulk(
+                actions=actions,
+                # "wait_for" blocks until the writes are visible to search
+                refresh="wait_for" if refresh else "false",
+            )
+        except helpers.BulkIndexError as e:
+            logger.error(f"flush buffered actions failed, resp: {e.args[0]}")
+            return const.CodeEnum.OPERATION_FAILED
+        except TransportError as e:
+            # not sent, keep the actions for the retry
+            self._requeue(actions)
+            self._flush_retries += 1
+            delay = min(
+                get_settings().ES_BULK_FLUSH_INTERVAL * 2 ** self._flush_retries,
+                get_settings().ES_BULK_FLUSH_MAX_BACKOFF,
+            )
+            logger.error(f"flush buffered actions failed, retry in {delay}s: {e}")
+            self._flush_task = asyncio.create_task(self._delayed_flush(delay=delay))
+            return const.CodeEnum.OPERATION_FAILED
+        self._flush_retries = 0
+        if resp[0] != len(actions):
+            logger.error(f"flush buffered actions failed, resp: {resp}")
+            return const.CodeEnum.OPERATION_FAILED
+        return const.CodeEnum.OK
+
+    async def _bulk(self, actions: List[dict], refresh: str = "false") -> Tuple[int, list]:
+        async with self._write_lock:
+            # resolved here rather than when the action is made, an alias swap may happen in between
+            resp = await helpers.async_bulk(
+                client=self.es,
+                actions=actions,
+                index=self.index,
+                refresh=refresh,
+            )
+            if self._reindex_target is not None:
+                await self._dual_write(actions)
+                if self._reindex_written is not None:
+                    self._reindex_written.update({action["_id"]: action["_routing"] for action in actions})
+        return resp
+
+    async def _dual_write(self, actions: List[dict]):
+        copies = []
+        for action in actions:
+            copy = dict(action)
+            # the reindex tasks may have copied the document already
+            if copy["_op_type"] == "create":
+                copy["_op_type"] = "index"
+            copies.append(copy)
+        _, errors = await helpers.async_bulk(
+            client=self.es,
+            actions=copies,
+            index=self._reindex_target,
+            raise_on_error=False,
+        )
+        routing = {action["_id"]: action["_routing"] for action in copies}
+        for error in errors:
+            op_type, item = next(iter(error.items()))
+            if item.get("status") == 404:
+                # not copied yet, the reindex tasks may still copy the version before this write
+                self._reindex_stale[item["_id"]] = routing[item["_id"]]
+            else:
+                logger.error(f"dual write to {self._reindex_target} failed, resp: {item}")
+
+    async def _delayed_flush(self, delay: Optional[float] = None):
+        await asyncio.sleep(get_settings().ES_BULK_FLUSH_INTERVAL if delay is None else delay)
+        # detach first, so flush() won't cancel the task it is running in
+        self._flush_task = None
+        await self.flush()
+
+    async def _enqueue(self, nid: str, action: dict, refresh: bool) -> const.CodeEnum:
+        prev = self._pending.get(nid)
+        if prev is not None:
+            merged = self._merge_action(prev=prev, new=action)
+            if merged is None:
+                # cannot be coalesced, keep the order by sending the previous one first
+                code = await self.flush()
+                if code != const.CodeEnum.OK:
+                    return code
+            else:
+                action = merged
+        self._pending[nid] = action
+        if self._pending_result is None:
+            self._pending_result = asyncio.get_running_loop().create_future()
+        # the flush below may find the action already taken by another one, wait for the batch it went with
+        result = self._pending_result
+        self._pending_refresh = self._pending_refresh or refresh
+
+        if refresh or len(self._pending) >= get_settings().ES_BULK_MAX_ACTIONS:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+        # shielded, the other writers of the batch still wait on it if this one is cancelled
+        return await asyncio.shield(result)
+
+    def _clear_pending(self):
+        if self._pending_result is not None and not self._pending_result.done():
+            # dropped without being sent
+            self._pending_result.set_result(const.CodeEnum.OPERATION_FAILED)
+        self._pending = {}
+        self._pending_result = None
+        self._pending_refresh = False
+
+    def _requeue(self, actions: List[dict]):
+        # the failed actions go before the ones enqueued while they were being sent
+        pending = {}
+        for action in actions:
+            newer = self._pending.pop(action["_id"], None)
+            if newer is None:
+                pending[action["_id"]] = action
+                continue
+            merged = self._merge_action(prev=action, new=newer)
+            if merged is None:
+                logger.error(f"drop the failed action before a newer one, action: {action}")
+                merged = newer
+            pending[action["_id"]] = merged
+        pending.update(self._pending)
+        self._pending = pending
+
+    async def _enqueue_update(self, uid: str, nid: str, doc: dict, refresh: bool) -> const.CodeEnum:
+        return await self._enqueue(
+            nid=nid,
+            action={
+                "_op_type": "update",
+                "_id": nid,
+                "_routing": uid,
+                "doc": doc,
+            },
+            refresh=refresh,
+        )
+
+    @staticmethod
+    def _merge_action(prev: dict, new: dict) -> Optional[dict]:
+        # index and delete replace the whole document, so they overwrite anything before
+        if new["_op_type"] in ["index", "delete"]:
+            return new
+        if prev["_op_type"] == "index":
+            merged = {**prev, "_source": {**prev["_source"], **new["doc"]}}
+            return merged
+        if prev["_op_type"] == "update":
+            merged = {**prev, "doc": {**prev["doc"], **new["doc"]}}
+            return merged
+        # update after delete must fail as it did without buffering
+        return None
+
     async def _batch_ops(self, actions: List[dict], op_type: str, refresh: bool) -> const.CodeEnum:
+        await self.flush()
         try:
-            resp = await helpers.async_bulk(client=self.es, actions=actions)
+            resp = await self._bulk(actions=actions)
         except helpers.BulkIndexError as e:
             logger.error(f"{op_type} batch failed, resp: {e.args[0]}")
             return const.CodeEnum.OPERATION_FAILED
@@ -1,6 +1,6 @@
 import datetime
 import logging
-from typing import List, Tuple, Sequence, Literal
+from typing import List, Tuple, Sequence, Literal, Optional
 
 import jieba
 from bson.tz_util import utc
@@ -9,12 +9,12 @@ from whoosh.fields import TEXT, ID, Schema, DATETIME, BOOLEAN
 from whoosh.highlight import Highlighter, HtmlFormatter
 from whoosh.index import create_in, open_dir, FileIndex
 from whoosh.qparser import QueryParser, syntax
-from whoosh.query import Term, And, Or, Every
+from whoosh.query import Term, And, Or, Every, DateRange, TermRange
 
 from retk import config, const
 from retk.logger import logger
 from retk.models.search_engine.engine import (
-    BaseEngine, SearchDoc, SearchResult, RestoreSearchDoc, STOPWORDS,
+    BaseEngine, SearchDoc, SearchResult, RestoreSearchDoc, STOPWORDS, encode_cursor, decode_cursor,
 )
 from retk.models.tps import AuthedUser
 
@@ -102,19 +102,19 @@ class LocalSearcher(BaseEngine):
     async def update(self, au: AuthedUser, doc: SearchDoc) -> const.CodeEnum:
         return await self.update_batch(au=au, docs=[doc])
 
-    async def to_trash(self, au: AuthedUser, nid: str) -> const.CodeEnum:
+    async def to_trash(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
         return await self.batch_to_trash(au=au, nids=[nid])
 
-    async def restore_from_trash(self, au: AuthedUser, nid: str) -> const.CodeEnum:
+    async def restore_from_trash(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
         return await self.restore_batch_from_trash(au=au, nids=[nid])
 
-    async def disable(self, au: AuthedUser, nid: str) -> const.CodeEnum:
+    async def disable(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
         return await self._trash_disable_ops_batch(au=au, nids=[nid], disable=True)
 
-    async def enable(self, au: AuthedUser, nid: str) -> const.CodeEnum:
+    async def enable(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
         return await self._trash_disable_ops_batch(au=au, nids=[nid], disable=False)
 
-    async def delete(self, au: AuthedUser, nid: str) -> const.CodeEnum:
+    async def delete(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
         return await self.delete_batch(au=au, nids=[nid])
 
     async def add_batch(self, au: AuthedUser, docs: List[SearchDoc]) -> const.CodeEnum:
@@ -194,9 +194,15 @@ class LocalSearcher(BaseEngine):
             page_size: int = 10,
             exclude_nids: Sequence[str] = None,
             with_stop_analyzer: bool = False,
+            cursor: str = "",
     ) -> Tuple[List[SearchResult], int]:
         if sort_key in ["", "similarity"]:
             sort_key = None
+        after = None
+        if cursor != "":
+            after = decode_cursor(cursor)
+            if after is None or not isinstance(after[-1], str):
+                raise ValueError(f"invalid cursor: {cursor}")
         with self.ix.searcher() as searcher:
             cs = [Term("uid", au.u.id), Term("disabled", False), Term("inTrash", False)]
             if query != "":
@@ -209,16 +215,54 @@ class LocalSearcher(BaseEngine):
                 mask = Term("nid", exclude_nids)
             else:
                 mask = None
-            hits = searcher.search_page(
-                query=query_terms,
-                pagenum=page + 1,
-                pagelen=page_size,
-                sortedby=sort_key,
-                reverse=reverse,
-                mask=mask,
-            )
-            if page * page_size > hits.total:
-                return [], hits.total
+            # the nid breaks the ties, so the cursor pages continue the same order as the first page
+            sortedby = None if sort_key is None else [sort_key, "nid"]
+            if after is None:
+                hits = searcher.search_page(
+                    query=query_terms,
+                    pagenum=page + 1,
+                    pagelen=page_size,
+                    sortedby=sortedby,
+                    reverse=reverse,
+                    mask=mask,
+                )
+                if page * page_size > hits.total:
+                    return [], hits.total
+                total = hits.total
+            elif sort_key in ["createdAt", "modifiedAt"]:
+                # only collect the hits after the cursor, this won't get slower on deeper pages
+                try:
+                    after_query = self._after_date_query(sort_key, after, reverse)
+                except (TypeError, ValueError):
+                    # e.g. a cursor of another sort key
+                    raise ValueError(f"invalid cursor: {cursor}")
+                total = len(searcher.search(query_terms, limit=1, mask=mask))
+                hits = searcher.search(
+                    And([query_terms, after_query]),
+                    limit=page_size,
+                    sortedby=sortedby,
+                    reverse=reverse,
+                    mask=mask,
+                )
+            else:
+                # title and score are not range searchable, locate the cursor nid in the sorted hits
+                results = searcher.search(
+                    query_terms,
+                    limit=None,
+                    sortedby=sortedby,
+                    reverse=reverse,
+                    mask=mask,
+                )
+                total = len(results)
+                start = None
+                for i, hit in enumerate(results):
+                    if hit["nid"] == after[-1]:
+                        start = i + 1
+                        break
+                if start is None:
+                    # the cursor node is not in the hits anymore, don't restart from the first page
+                    return [], total
+                hits = results[start: start + page_size]
             hl = Highlighter(formatter=HtmlFormatter(
                 tagname=self.hl_tag_name,
                 classname=self.hl_class_name,
@@ -228,11 +272,12 @@ class LocalSearcher(BaseEngine):
             return [
                 SearchResult(
                     nid=hit["nid"],
-                    score=hit.score if sort_key != "title" else 0.,
+                    score=self.get_score(hit, sort_key),
                     titleHighlight=self.get_hl(hl, hit, "title", return_list=False, default=hit["title"]),
                     bodyHighlights=self.get_hl(hl, hit, "body", return_list=True, default=hit["body"][:60] + "..."),
+                    cursor=self.get_cursor(hit, sort_key),
                 ) for hit in hits
-            ], hits.total
+            ], total
 
     async def search(
             self,
@@ -245,6 +290,7 @@ class LocalSearcher(BaseEngine):
             page: int = 0,
             limit: int = 10,
             exclude_nids: Sequence[str] = None,
+            cursor: str = "",
     ) -> Tuple[List[SearchResult], int]:
         return await self._search(
             au=au,
@@ -255,6 +301,7 @@ class LocalSearcher(BaseEngine):
             page_size=limit,
             exclude_nids=exclude_nids,
             with_stop_analyzer=False,
+            cursor=cursor,
         )
 
     async def recommend(
@@ -280,6 +327,10 @@ class LocalSearcher(BaseEngine):
     async def refresh(self):
         pass
 
+    async def flush(self, refresh: bool = False) -> const.CodeEnum:
+        # every whoosh write is committed immediately, nothing is buffered
+        return const.CodeEnum.OK
+
     async def count_all(self) -> int:
         with self.ix.searcher() as searcher:
             resp = searcher.search(Every("nid"))
@@ -302,3 +353,36 @@ class LocalSearcher(BaseEngine):
         if hl_str == "":
             return default
         return hl_str
+
+    @staticmethod
+    def get_score(hit: dict, sort_key: Optional[str]) -> float:
+        if sort_key == "title":
+            return 0.
+        # sorted by multiple facets, the score is a tuple of the sort values
+        if isinstance(hit.score, tuple):
+            return hit.score[0]
+        return hit.score
+
+    @staticmethod
+    def get_cursor(hit: dict, sort_key: Optional[str]) -> str:
+        if sort_key in ["createdAt", "modifiedAt"]:
+            value = hit[sort_key].isoformat()
+        elif sort_key == "title":
+            value = hit["title"]
+        else:
+            value = hit.score
+        return encode_cursor([value, hit["nid"]])
+
+    @staticmethod
+    def _after_date_query(sort_key: str, after: list, reverse: bool):
+        dt = datetime.datetime.fromisoformat(after[0])
+        nid = after[-1]
+        if reverse:
+            return Or([
+                DateRange(sort_key, None, dt, endexcl=True),
+                And([DateRange(sort_key, dt, dt), TermRange("nid", None, nid, endexcl=True)]),
+            ])
+        return Or([
+            DateRange(sort_key, dt, None, startexcl=True),
+            And([DateRange(sort_key, dt, dt), TermRange("nid", nid, None, startexcl=True)]),
+        ])
@@ -0,0 +1,468 @@
+import datetime
+import heapq
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Tuple, Sequence, Dict, Literal, Optional, Callable, Any, FrozenSet
+
+import jieba
+from bson.tz_util import utc
+
+from retk import const
+from retk.logger import logger
+from retk.models.search_engine.engine import (
+    BaseEngine, SearchDoc, SearchResult, RestoreSearchDoc, STOPWORDS, encode_cursor, decode_cursor,
+)
+from retk.models.tps import AuthedUser
+
+jieba.setLogLevel(logging.ERROR)
+
+# the "_english_" stop words of elasticsearch
+ENGLISH_STOPWORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if", "in", "into", "is", "it",
+    "no", "not", "of", "on", "or", "such", "that", "the", "their", "then", "there", "these",
+    "they", "this", "to", "was", "will", "with",
+])
+SEARCH_STOPWORDS = ENGLISH_STOPWORDS | frozenset(STOPWORDS)
+FIELDS = ("title", "body")
+_WORD = re.compile(r"\w")
+_ASCII_WORD = re.compile(r"^[a-z0-9]+$")
+
+
+def tokenize(text: str, stopwords: FrozenSet[str] = ENGLISH_STOPWORDS) -> List[str]:
+    return [t for t in jieba.cut_for_search(text.lower()) if _WORD.search(t) and t not in stopwords]
+
+
+@dataclass
+class _Doc:
+    uid: str
+    nid: str
+    title: str
+    body: str
+    createdAt: datetime.datetime
+    modifiedAt: datetime.datetime
+    disabled: bool = False
+    inTrash: bool = False
+    # field -> term -> term frequency
+    tfs: Dict[str, Counter] = field(default_factory=dict)
+    # field -> number of terms
+    lengths: Dict[str, int] = field(default_factory=dict)
+
+
+class _UserIndex:
+    def __init__(self):
+        self.docs: Dict[str, _Doc] = {}
+        # field -> term -> nid -> term frequency
+        self.postings: Dict[str, Dict[str, Dict[str, int]]] = {f: {} for f in FIELDS}
+        self.total_length: Dict[str, int] = {f: 0 for f in FIELDS}
+
+    def add(self, doc: _Doc):
+        self.remove(doc.nid)
+        self.docs[doc.nid] = doc
+        for f in FIELDS:
+            tf = Counter(tokenize(getattr(doc, f)))
+            doc.tfs[f] = tf
+            doc.lengths[f] = sum(tf.values())
+            self.total_length[f] += doc.lengths[f]
+            postings = self.postings[f]
+            for term, n in tf.items():
+                postings.setdefault(term, {})[doc.nid] = n
+
+    def remove(self, nid: str) -> Optional[_Doc]:
+        doc = self.docs.pop(nid, None)
+        if doc is None:
+            return None
+        for f, tf in doc.tfs.items():
+            self.total_length[f] -= doc.lengths[f]
+            postings = self.postings[f]
+            for term in tf:
+                nids = postings[term]
+                del nids[nid]
+                if len(nids) == 0:
+                    del postings[term]
+        return doc
+
+
+class MemorySearcher(BaseEngine):
+    """An in-process search engine, nothing is persisted.
+
+    Each user has an inverted index of dicts, hits are ranked by BM25 with the title boosted
+    the same way as the elasticsearch query. It follows the behaviours of ESSearcher
+    (trash, disable, highlights and cursors), so tests and benchmarks can run without a search service.
+    """
+    k1 = 1.2
+    b = 0.75
+    title_boost = 2.
+    fragment_size = 100
+    fragment_margin = 20
+    max_fragments = 5
+
+    def __init__(self):
+        super().__init__()
+        self._users: Dict[str, _UserIndex] = {}
+
+    async def init(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def drop(self):
+        self._users = {}
+
+    def _user(self, uid: str) -> _UserIndex:
+        try:
+            return self._users[uid]
+        except KeyError:
+            index = self._users[uid] = _UserIndex()
+            return index
+
+    @staticmethod
+    def _now_series(n: int) -> List[datetime.datetime]:
+        # strictly increasing, so the creation order is kept when sorting by time
+        now = datetime.datetime.now(tz=utc)
+        return [now + datetime.timedelta(microseconds=i) for i in range(n)]
+
+    async def add(self, au: AuthedUser, doc: SearchDoc) -> const.CodeEnum:
+        now = datetime.datetime.now(tz=utc)
+        self._user(au.u.id).add(_Doc(
+            uid=au.u.id, nid=doc.nid, title=doc.title, body=doc.body, createdAt=now, modifiedAt=now,
+        ))
+        return const.CodeEnum.OK
+
+    async def add_batch(self, au: AuthedUser, docs: List[SearchDoc]) -> const.CodeEnum:
+        index = self._user(au.u.id)
+        for doc in docs:
+            if doc.nid in index.docs:
+                logger.error(f"add batch failed, nid {doc.nid} already exists")
+                return const.CodeEnum.OPERATION_FAILED
+        for doc, now in zip(docs, self._now_series(len(docs))):
+            index.add(_Doc(
+                uid=au.u.id, nid=doc.nid, title=doc.title, body=doc.body, createdAt=now, modifiedAt=now,
+            ))
+        return const.CodeEnum.OK
+
+    async def update(self, au: AuthedUser, doc: SearchDoc) -> const.CodeEnum:
+        return await self.update_batch(au=au, docs=[doc])
+
+    async def update_batch(self, au: AuthedUser, docs: List[SearchDoc]) -> const.CodeEnum:
+        index = self._user(au.u.id)
+        for doc in docs:
+            if doc.nid not in index.docs:
+                logger.error(f"nid {doc.nid} not found")
+                return const.CodeEnum.NODE_NOT_EXIST
+        for doc, now in zip(docs, self._now_series(len(docs))):
+            old = index.docs[doc.nid]
+            index.add(_Doc(
+                uid=au.u.id,
+                nid=doc.nid,
+                title=doc.title,
+                body=doc.body,
+                createdAt=old.createdAt,
+                modifiedAt=now,
+                disabled=old.disabled,
+                inTrash=old.inTrash,
+            ))
+        return const.CodeEnum.OK
+
+    def _set_flags(self, au: AuthedUser, nids: Sequence[str], **flags: bool) -> const.CodeEnum:
+        index = self._user(au.u.id)
+        for nid in nids:
+            if nid not in index.docs:
+                logger.error(f"nid {nid} not found")
+                return const.CodeEnum.NODE_NOT_EXIST
+        for nid in nids:
+            # the flags are not indexed terms, no need to rebuild the postings
+            for k, v in flags.items():
+                setattr(index.docs[nid], k, v)
+        return const.CodeEnum.OK
+
+    async def to_trash(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
+        return self._set_flags(au=au, nids=[nid], inTrash=True)
+
+    async def batch_to_trash(self, au: AuthedUser, nids: List[str]) -> const.CodeEnum:
+        return self._set_flags(au=au, nids=nids, inTrash=True)
+
+    async def restore_from_trash(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
+        return self._set_flags(au=au, nids=[nid], inTrash=False)
+
+    async def restore_batch_from_trash(self, au: AuthedUser, nids: List[str]) -> const.CodeEnum:
+        return self._set_flags(au=au, nids=nids, inTrash=False)
+
+    async def disable(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
+        return self._set_flags(au=au, nids=[nid], disabled=True)
+
+    async def enable(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
+        return self._set_flags(au=au, nids=[nid], disabled=False)
+
+    async def delete(self, au: AuthedUser, nid: str, refresh: bool = True) -> const.CodeEnum:
+        index = self._user(au.u.id)
+        doc = index.docs.get(nid)
+        if doc is None:
+            logger.error(f"node not belong to user {au.u.id=} {nid=}")
+            return const.CodeEnum.NODE_NOT_EXIST
+        if not doc.inTrash:
+            logger.error(f"doc not in trash, deletion failed {au.u.id=} {nid=}")
+            return const.CodeEnum.OPERATION_FAILED
+        index.remove(nid)
+        return const.CodeEnum.OK
+
+    async def delete_batch(self, au: AuthedUser, nids: List[str]) -> const.CodeEnum:
+        index = self._user(au.u.id)
+        deleted = 0
+        for nid in nids:
+            doc = index.docs.get(nid)
+            if doc is not None and doc.inTrash:
+                index.remove(nid)
+                deleted += 1
+        if deleted != len(nids):
+            logger.error(f"delete batch failed, {deleted} of {len(nids)} deleted")
+            return const.CodeEnum.OPERATION_FAILED
+        return const.CodeEnum.OK
+
+    async def force_delete_all(self, uid: str) -> const.CodeEnum:
+        self._users.pop(uid, None)
+        return const.CodeEnum.OK
+
+    async def batch_restore_docs(self, au: AuthedUser, docs: List[RestoreSearchDoc]) -> const.CodeEnum:
+        index = self._user(au.u.id)
+        for doc in docs:
+            if doc.nid in index.docs:
+                logger.error(f"restore batch failed, nid {doc.nid} already exists")
+                return const.CodeEnum.OPERATION_FAILED
+        for doc in docs:
+            d = dict(doc.__dict__)
+            for k in ["createdAt", "modifiedAt"]:
+                if d[k].tzinfo is None:
+                    d[k] = d[k].replace(tzinfo=utc)
+            index.add(_Doc(uid=au.u.id, **d))
+        return const.CodeEnum.OK
+
+    def _bm25(self, index: _UserIndex, terms: Sequence[str]) -> Dict[str, float]:
+        n_docs = len(index.docs)
+        scores: Dict[str, float] = {}
+        for f in FIELDS:
+            boost = self.title_boost if f == "title" else 1.
+            avg_len = index.total_length[f] / n_docs if n_docs > 0 else 0.
+            postings = index.postings[f]
+            for term in terms:
+                nids = postings.get(term)
+                if nids is None:
+                    continue
+                df = len(nids)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for nid, tf in nids.items():
+                    length = index.docs[nid].lengths[f]
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_len)
+                    scores[nid] = scores.get(nid, 0.) + boost * idf * tf * (self.k1 + 1) / norm
+        return scores
+
+    @staticmethod
+    def _sort_value(doc: _Doc, score: float, sort_key: Optional[str]) -> Any:
+        if sort_key is None:
+            return score
+        return getattr(doc, sort_key)
+
+    @staticmethod
+    def _sort_fn(sort_key: Optional[str]) -> Callable[[Tuple[_Doc, float]], tuple]:
+        if sort_key is None:
+            # the best score first, whatever the order is
+            return lambda hit: (-hit[1], hit[0].nid)
+        return lambda hit: (getattr(hit[0], sort_key), hit[0].nid)
+
+    @staticmethod
+    def _cursor_key(after: list, sort_key: Optional[str]) -> tuple:
+        value, nid = after[0], after[-1]
+        if sort_key is None:
+            return -float(value), nid
+        if sort_key == "title":
+            return str(value), nid
+        dt = datetime.datetime.fromisoformat(value)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=utc)
+        return dt, nid
+
+    async def _search(
+            self,
+            au: AuthedUser,
+            query: str = "",
+            sort_key: Literal[
+                "createdAt", "modifiedAt", "title", "similarity"
+            ] = None,
+            reverse: bool = False,
+            page: int = 0,
+            page_size: int = 10,
+            exclude_nids: Sequence[str] = None,
+            with_stop_analyzer: bool = False,
+            cursor: str = "",
+    ) -> Tuple[List[SearchResult], int]:
+        if page < 0:
+            raise ValueError("page must >= 0")
+        if sort_key in ["", "similarity"]:
+            sort_key = None
+        elif sort_key not in [None, "title", "createdAt", "modifiedAt"]:
+            raise ValueError(f"sort_key {sort_key} not supported")
+        # similarity is always from the best, as the elasticsearch "_score" sort
+        reverse = reverse and sort_key is not None
+        after = None
+        if cursor != "":
+            after = decode_cursor(cursor)
+            if after is None:
+                raise ValueError(f"invalid cursor: {cursor}")
+
+        index = self._users.get(au.u.id)
+        if index is None:
+            return [], 0
+        terms = []
+        if query != "":
+            stopwords = SEARCH_STOPWORDS if with_stop_analyzer else ENGLISH_STOPWORDS
+            terms = list(dict.fromkeys(tokenize(query, stopwords)))
+            scores = self._bm25(index, terms)
+        else:
+            scores = dict.fromkeys(index.docs, 0.)
+        exclude = set(exclude_nids) if exclude_nids is not None else set()
+        hits = []
+        for nid, score in scores.items():
+            doc = index.docs[nid]
+            if doc.disabled or doc.inTrash or nid in exclude:
+                continue
+            hits.append((doc, score))
+        total = len(hits)
+
+        sort_fn = self._sort_fn(sort_key)
+        if after is None:
+            n = (page + 1) * page_size
+            # only the hits up to this page are sorted
+            top = heapq.nlargest(n, hits, key=sort_fn) if reverse else heapq.nsmallest(n, hits, key=sort_fn)
+            hits = top[page * page_size:]
+        else:
+            try:
+                key = self._cursor_key(after, sort_key)
+                if reverse:
+                    hits = heapq.nlargest(page_size, [h for h in hits if sort_fn(h) < key], key=sort_fn)
+                else:
+                    hits = heapq.nsmallest(page_size, [h for h in hits if sort_fn(h) > key], key=sort_fn)
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid cursor: {cursor}")
+
+        pattern = self._hl_pattern(terms)
+        return [
+            SearchResult(
+                nid=doc.nid,
+                score=score,
+                titleHighlight=self._hl_title(pattern, terms, doc.title),
+                bodyHighlights=self._hl_body(pattern, terms, doc.body),
+                cursor=encode_cursor([self._cursor_value(doc, score, sort_key), doc.nid]),
+            ) for doc, score in hits
+        ], total
+
+    @classmethod
+    def _cursor_value(cls, doc: _Doc, score: float, sort_key: Optional[str]) -> Any:
+        value = cls._sort_value(doc, score, sort_key)
+        if isinstance(value, datetime.datetime):
+            return value.isoformat()
+        return value
+
+    async def search(
+            self,
+            au: AuthedUser,
+            query: str = "",
+            sort_key: Literal[
+                "createdAt", "modifiedAt", "title", "similarity"
+            ] = None,
+            reverse: bool = False,
+            page: int = 0,
+            limit: int = 10,
+            exclude_nids: Sequence[str] = None,
+            cursor: str = "",
+    ) -> Tuple[List[SearchResult], int]:
+        return await self._search(
+            au=au,
+            query=query,
+            sort_key=sort_key,
+            reverse=reverse,
+            page=page,
+            page_size=limit,
+            exclude_nids=exclude_nids,
+            with_stop_analyzer=False,
+            cursor=cursor,
+        )
+
+    async def recommend(
+            self,
+            au: AuthedUser,
+            content: str,
+            max_return: int = 10,
+            exclude_nids: Sequence[str] = None,
+    ) -> List[SearchResult]:
+        res, _ = await self._search(
+            au=au,
+            query=content,
+            sort_key="similarity",
+            page=0,
+            page_size=max_return,
+            exclude_nids=exclude_nids,
+            with_stop_analyzer=True,
+        )
+        # the elasticsearch threshold minus the constant score of its filters, any match is taken
+        return [r for r in res if r.score > 0.]
+
+    async def refresh(self):
+        pass
+
+    async def flush(self, refresh: bool = False) -> const.CodeEnum:
+        # every write is applied in place, nothing is buffered
+        return const.CodeEnum.OK
+
+    async def count_all(self) -> int:
+        return sum(len(index.docs) for index in self._users.values())
+
+    @staticmethod
+    def _hl_pattern(terms: Sequence[str]) -> Optional[re.Pattern]:
+        if len(terms) == 0:
+            return None
+        alternatives = []
+        for term in sorted(terms, key=len, reverse=True):
+            t = re.escape(term)
+            if _ASCII_WORD.match(term):
+                # not inside a longer word
+                t = rf"(?<![a-z0-9]){t}(?![a-z0-9])"
+            alternatives.append(t)
+        return re.compile("|".join(alternatives), re.IGNORECASE)
+
+    def _hl_tag(self, terms: Sequence[str], match: re.Match) -> str:
+        i = terms.index(match.group(0).lower()) % 5
+        return f"<{self.hl_tag_name} class=\"{self.hl_class_name} {self.hl_term_prefix}{i}\">" \
+               f"{match.group(0)}</{self.hl_tag_name}>"
+
+    def _hl_title(self, pattern: Optional[re.Pattern], terms: Sequence[str], title: str) -> str:
+        if pattern is None:
+            return title
+        return pattern.sub(lambda m: self._hl_tag(terms, m), title)
+
+    def _hl_body(self, pattern: Optional[re.Pattern], terms: Sequence[str], body: str) -> List[str]:
+        if pattern is None:
+            return [body[:60] + "..."]
+        matches = list(pattern.finditer(body))
+        if len(matches) == 0:
+            return [body[:60] + "..."]
+        fragments = []
+        i = 0
+        prev_end = 0
+        while i < len(matches) and len(fragments) < self.max_fragments:
+            start = max(prev_end, matches[i].start() - self.fragment_margin)
+            end = max(min(len(body), start + self.fragment_size), matches[i].end())
+            parts = []
+            pos = start
+            while i < len(matches) and matches[i].end() <= end:
+                m = matches[i]
+                parts.append(body[pos:m.start()])
+                parts.append(self._hl_tag(terms, m))
+                pos = m.end()
+                i += 1
+            parts.append(body[pos:end])
+            fragments.append("".join(parts))
+            prev_end = end
+        return fragments
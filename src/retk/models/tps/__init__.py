@@ -1,6 +1,6 @@
 from retk.models.tps.auth_user import AuthedUser, convert_user_dict_to_authed_user
 from retk.models.tps.import_data import ImportData
-from retk.models.tps.node import Node, LinkedNode
+from retk.models.tps.node import Node, LinkedNode, NodeOutboxJob
 from retk.models.tps.notice import NoticeManagerDelivery, NoticeSystem
 from retk.models.tps.statistic import UserBehavior
 from retk.models.tps.user import UserMeta, CODE_THEME_TYPES
@@ -1,4 +1,5 @@
-from typing import TypedDict
+from datetime import datetime
+from typing import TypedDict, Union, Dict
 
 from bson import ObjectId
 
@@ -21,3 +22,16 @@ class ExtendedNode(TypedDict):
     sourceMd: str
     extendMd: str
     extendSearchTerms: str
+
+
+class LLMResponseCache(TypedDict):
+    _id: ObjectId
+    # sha256 of the service, model, system prompt and content
+    key: str
+    service: str
+    model: str
+    response: Union[str, Dict[str, str]]
+    tokens: int
+    hits: int
+    createdAt: datetime
+    hitAt: datetime
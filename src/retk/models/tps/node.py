@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional, TypedDict
+from typing import List, Optional, TypedDict, Union
 
 from bson import ObjectId
 
@@ -29,6 +29,30 @@ class Node(TypedDict):
     inTrashAt: Optional[datetime]
     fromNodeIds: List[str]
     toNodeIds: List[str]
+    fromNodeIdsLen: int
+    toNodeIdsLen: int
     history: List[str]
+    historyKeyframes: List[str]
+    # the history is saved as keyframes and deltas, see core.node.backup.migrate_md_hist
+    historyMigrated: bool
     favorite: bool
     summary: str
+
+
+class NodeOutboxJob(TypedDict):
+    _id: ObjectId
+    uid: str
+    nid: str
+    # the side effects to run, False or the id of the write which set it, a later write sets more of them
+    searchAdd: Union[bool, ObjectId]
+    searchUpdate: Union[bool, ObjectId]
+    hist: Union[bool, ObjectId]
+    extend: Union[bool, ObjectId]
+    # increased on each write, a job changed while running is not removed
+    version: int
+    attempts: int
+    failed: bool
+    # unix timestamps
+    createdAt: float
+    runAt: float
+    lockedUntil: float
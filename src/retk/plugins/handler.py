@@ -41,6 +41,19 @@ def on_node_updated(func: Callable):
     return wrapper
 
 
+def on_nodes_added(func: Callable):
+    async def wrapper(*args, **kwargs):
+        data, code = await func(*args, **kwargs)
+        if code != CodeEnum.OK:
+            return data, code
+        for inst in event_plugin_map["on_node_added"]:
+            for node in data:
+                inst.on_node_added(node=node)
+        return data, code
+
+    return wrapper
+
+
 def before_node_updated(func: Callable):
     async def wrapper(
             au: AuthedUser,
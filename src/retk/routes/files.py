@@ -1,9 +1,10 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, UploadFile, Request
+from fastapi import APIRouter, UploadFile, Request, Query
+from fastapi.responses import StreamingResponse
 
 from retk.controllers import schemas
-from retk.controllers.files import upload_files
+from retk.controllers.files import upload_files, export_files
 from retk.core.utils.ratelimiter import req_limit
 from retk.routes import utils
 
@@ -102,3 +103,20 @@ async def get_upload_process(
     return await upload_files.get_upload_process(
         au=au,
     )
+
+
+@router.get(
+    path="/export",
+    status_code=200,
+)
+@utils.measure_time_spend
+@req_limit(requests=1, in_seconds=60)
+async def stream_export_account(
+        au: utils.ANNOTATED_AUTHED_USER,
+        history: bool = Query(default=False, description="export the history versions of the notes"),
+        referer: Optional[str] = utils.DEPENDS_REFERER,
+) -> StreamingResponse:
+    return await export_files.stream_account_export(
+        au=au,
+        with_history=history,
+    )
@@ -24,6 +24,48 @@ async def get_manager_data(
     return await manager.get_manager_data(au=au)
 
 
+@router.get(
+    "/outbox",
+    status_code=200,
+    response_model=schemas.manager.GetNodeOutboxResponse,
+    summary="Get node outbox stats",
+    description="Get the pending, failed jobs and the lag of the node side effects",
+)
+@utils.measure_time_spend
+async def get_node_outbox(
+        au: ADMIN_AUTH,
+) -> schemas.manager.GetNodeOutboxResponse:
+    return await manager.get_node_outbox(au=au)
+
+
+@router.get(
+    "/search-reindex",
+    status_code=200,
+    response_model=schemas.manager.GetSearchReindexResponse,
+    summary="Get search reindex progress",
+    description="Get the progress of the last online reindex of the search engine since startup",
+)
+@utils.measure_time_spend
+async def get_search_reindex(
+        au: ADMIN_AUTH,
+) -> schemas.manager.GetSearchReindexResponse:
+    return await manager.get_search_reindex(au=au)
+
+
+@router.get(
+    "/llm-cache",
+    status_code=200,
+    response_model=schemas.manager.GetLLMCacheResponse,
+    summary="Get llm response cache stats",
+    description="Get the size and the hit rate of the cached knowledge summary and extend responses",
+)
+@utils.measure_time_spend
+async def get_llm_cache(
+        au: ADMIN_AUTH,
+) -> schemas.manager.GetLLMCacheResponse:
+    return await manager.get_llm_cache(au=au)
+
+
 @router.put(
     "/users",
     status_code=200,
@@ -116,5 +158,9 @@ async def get_unscheduled_system_notices(
         au: ADMIN_AUTH,
         p: int = Query(0, ge=0),
         limit: int = Query(10, ge=1, le=100),
+        cursor: utils.ANNOTATED_PAGE_CURSOR = "",
+        with_total: utils.ANNOTATED_WITH_TOTAL = True,
 ) -> schemas.manager.GetSystemNoticesResponse:
-    return await manager.get_system_notices(au=au, page=p, limit=limit)
+    return await manager.get_system_notices(
+        au=au, page=p, limit=limit, cursor=cursor, with_total=with_total,
+    )
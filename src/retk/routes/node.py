@@ -1,6 +1,6 @@
 from typing import Optional, Literal
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 from fastapi.params import Path, Query
 from fastapi.responses import StreamingResponse
 from typing_extensions import Annotated
@@ -8,6 +8,7 @@ from typing_extensions import Annotated
 from retk import const
 from retk.controllers import schemas
 from retk.controllers.node import node_ops, search
+from retk.controllers.utils import weak_etag_response
 from retk.core.utils.ratelimiter import req_limit
 from retk.routes import utils
 
@@ -36,6 +37,24 @@ async def post_node(
     )
 
 
+@router.post(
+    path="/batch",
+    status_code=201,
+    response_model=schemas.node.NodesResponse,
+)
+@utils.measure_time_spend
+@req_limit(requests=2, in_seconds=1)
+async def post_batch_nodes(
+        au: utils.ANNOTATED_AUTHED_USER,
+        req: schemas.node.BatchCreateRequest,
+        referer: Optional[str] = utils.DEPENDS_REFERER,
+) -> schemas.node.NodesResponse:
+    return await node_ops.post_batch_nodes(
+        au=au,
+        req=req,
+    )
+
+
 @router.post(
     path="/quick",
     status_code=201,
@@ -70,16 +89,25 @@ async def get_search_nodes(
         order: Optional[Literal["asc", "desc"]] = Query(default="asc", alias="ord"),
         page: Optional[int] = Query(default=0, ge=0, alias="p"),
         limit: Optional[int] = Query(default=20, ge=0, le=const.settings.SEARCH_LIMIT_MAX),
+        cursor: Optional[str] = Query(
+            default="",
+            max_length=const.settings.SEARCH_CURSOR_MAX_LENGTH,
+            description="nextCursor of the previous page, used instead of p",
+        ),
+        if_none_match: utils.ANNOTATED_IF_NONE_MATCH = None,
+        response: Response = None,
         referer: Optional[str] = utils.DEPENDS_REFERER,
 ) -> schemas.node.NodesSearchResponse:
-    return await search.user_nodes(
+    resp = await search.user_nodes(
         au=au,
         q=q,
         sort=sort,
         order=order,
         page=page,
         limit=limit,
+        cursor=cursor,
     )
+    return weak_etag_response(resp=resp, if_none_match=if_none_match, response=response)
 
 
 # make sure this is before /{nid} otherwise it will be treated as a nid
@@ -93,13 +121,20 @@ async def get_favorite_nodes(
         au: utils.ANNOTATED_AUTHED_USER,
         p: int = Query(default=0, ge=0, description="page number"),
         limit: int = Query(default=10, ge=0, le=const.settings.SEARCH_LIMIT_MAX),
+        cursor: utils.ANNOTATED_PAGE_CURSOR = "",
+        with_total: utils.ANNOTATED_WITH_TOTAL = True,
+        if_none_match: utils.ANNOTATED_IF_NONE_MATCH = None,
+        response: Response = None,
         referer: Optional[str] = utils.DEPENDS_REFERER,
 ) -> schemas.node.NodesSearchResponse:
-    return await node_ops.get_favorite_nodes(
+    resp = await node_ops.get_favorite_nodes(
         au=au,
         p=p,
         limit=limit,
+        cursor=cursor,
+        with_total=with_total,
     )
+    return weak_etag_response(resp=resp, if_none_match=if_none_match, response=response)
 
 
 # make sure this is before /{nid} otherwise it will be treated as a nid
@@ -113,13 +148,20 @@ async def get_core_nodes(
         au: utils.ANNOTATED_AUTHED_USER,
         p: int = Query(default=0, ge=0, description="page number"),
         limit: int = Query(default=10, ge=0, le=const.settings.SEARCH_LIMIT_MAX),
+        cursor: utils.ANNOTATED_PAGE_CURSOR = "",
+        with_total: utils.ANNOTATED_WITH_TOTAL = True,
+        if_none_match: utils.ANNOTATED_IF_NONE_MATCH = None,
+        response: Response = None,
         referer: Optional[str] = utils.DEPENDS_REFERER,
 ) -> schemas.node.NodesSearchResponse:
-    return await node_ops.get_core_nodes(
+    resp = await node_ops.get_core_nodes(
         au=au,
         p=p,
         limit=limit,
+        cursor=cursor,
+        with_total=with_total,
     )
+    return weak_etag_response(resp=resp, if_none_match=if_none_match, response=response)
 
 
 @router.get(
@@ -131,11 +173,15 @@ async def get_core_nodes(
 async def get_node(
         au: utils.ANNOTATED_AUTHED_USER,
         nid: str = utils.ANNOTATED_NID,
+        if_none_match: utils.ANNOTATED_IF_NONE_MATCH = None,
+        response: Response = None,
         referer: Optional[str] = utils.DEPENDS_REFERER,
 ) -> schemas.node.NodeResponse:
     return await node_ops.get_node(
         au=au,
         nid=nid,
+        if_none_match=if_none_match,
+        response=response,
     )
 
 
@@ -203,6 +249,23 @@ async def get_hist_editions(
     )
 
 
+@router.get(
+    path="/{nid}/link-title",
+    status_code=200,
+    response_model=schemas.node.LinkTitleProgressResponse,
+)
+@utils.measure_time_spend
+async def get_link_title_progress(
+        au: utils.ANNOTATED_AUTHED_USER,
+        nid: str = utils.ANNOTATED_NID,
+        referer: Optional[str] = utils.DEPENDS_REFERER,
+) -> schemas.node.LinkTitleProgressResponse:
+    return await node_ops.get_link_title_progress(
+        au=au,
+        nid=nid,
+    )
+
+
 @router.get(
     path="/{nid}/history/{version}/md",
     status_code=200,
@@ -1,9 +1,10 @@
 from typing import Optional
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Response
 
 from retk.controllers import schemas
 from retk.controllers.node import trash_ops
+from retk.controllers.utils import weak_etag_response
 from retk.routes import utils
 
 router = APIRouter(
@@ -23,13 +24,20 @@ async def get_from_trash(
         au: utils.ANNOTATED_AUTHED_USER,
         p: int = Query(default=0, ge=0, description="page number"),
         limit: int = Query(default=10, ge=0, le=200, description="page size"),
+        cursor: utils.ANNOTATED_PAGE_CURSOR = "",
+        with_total: utils.ANNOTATED_WITH_TOTAL = True,
+        if_none_match: utils.ANNOTATED_IF_NONE_MATCH = None,
+        response: Response = None,
         referer: Optional[str] = utils.DEPENDS_REFERER,
 ) -> schemas.node.NodesSearchResponse:
-    return await trash_ops.get_from_trash(
+    resp = await trash_ops.get_from_trash(
         au=au,
         p=p,
         limit=limit,
+        cursor=cursor,
+        with_total=with_total,
     )
+    return weak_etag_response(resp=resp, if_none_match=if_none_match, response=response)
 
 
 # has to be before /{nid} otherwise it will be treated as a nid
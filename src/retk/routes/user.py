@@ -73,6 +73,8 @@ async def get_notifications(
         unread: Optional[bool] = Query(default=False),
         p: int = Query(0, ge=0),
         limit: int = Query(10, ge=1, le=100),
+        cursor: utils.ANNOTATED_PAGE_CURSOR = "",
+        with_total: utils.ANNOTATED_WITH_TOTAL = True,
         referer: Optional[str] = utils.DEPENDS_REFERER,
 ) -> schemas.user.NotificationResponse:
     return await user.get_user_notices(
@@ -80,6 +82,8 @@ async def get_notifications(
         unread_only=unread,
         page=p,
         limit=limit,
+        cursor=cursor,
+        with_total=with_total,
     )
 
 
@@ -6,7 +6,7 @@ from typing import Optional
 
 import jwt
 from fastapi import HTTPException, Header, Cookie, Depends, Request
-from fastapi.params import Path
+from fastapi.params import Path, Query
 from starlette.status import HTTP_403_FORBIDDEN
 from typing_extensions import Annotated
 
@@ -106,6 +106,13 @@ async def on_startup():
     logger.debug(f'startup_event VUE_APP_API_URL: {os.environ.get("VUE_APP_API_URL")}')
     logger.debug(f'startup_event RETHINK_DEFAULT_LANGUAGE: {os.environ.get("RETHINK_DEFAULT_LANGUAGE")}')
     await client.init()
+    # the old history is migrated in background
+    core.node.backup.start_migrate_md_hist()
+    # run the side effects of node writes in background
+    core.node.outbox.start()
+
+    # pooled http clients of the llm services, cos and web links
+    utils.http_pool.init()
 
     # cos client
     try:
@@ -135,9 +142,13 @@ async def on_startup():
 async def on_shutdown():
     # on shutdown
     scheduler.stop()
+    await core.node.outbox.stop()
+    # send the buffered search writes before the connection is closed
+    await client.search.flush()
     await client.close()
     await client.search.close()
     logger.debug("fastapi shutdown event: db and searcher closed")
+    await utils.http_pool.close()
 
     async_tasks.stop()
     logger.debug("fastapi shutdown event: async_tasks stopped")
@@ -306,6 +317,19 @@ ANNOTATED_UID = Annotated[str, Path(title="The ID of user", max_length=const.set
 ANNOTATED_NID = Annotated[str, Path(title="The ID of node", max_length=const.settings.NID_MAX_LENGTH, min_length=8)]
 ANNOTATED_PID = Annotated[str, Path(title="The ID of plugin", max_length=const.settings.PLUGIN_ID_MAX_LENGTH)]
 ANNOTATED_FID = Annotated[str, Path(title="The ID of file", max_length=const.settings.FID_MAX_LENGTH)]
+ANNOTATED_PAGE_CURSOR = Annotated[str, Query(
+    max_length=const.settings.PAGE_CURSOR_MAX_LENGTH,
+    description="nextCursor of the previous page, used instead of p",
+)]
+ANNOTATED_WITH_TOTAL = Annotated[bool, Query(
+    alias="total",
+    description="count the total, -1 is returned if false. It can be skipped after the first page",
+)]
+
+ANNOTATED_IF_NONE_MATCH = Annotated[Optional[str], Header(
+    alias="If-None-Match",
+    description="ETag of the cached response, 304 is returned if it is not modified",
+)]
 
 DEPENDS_REFERER = Depends(verify_referer)
 DEPENDS_IP = Depends(get_ip)
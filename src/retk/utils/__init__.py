@@ -6,10 +6,14 @@ from .auth import (
 )
 from .md import (
     strip_html_tags,
+    strip_html_tags_batch,
     md2txt,
+    fast_md2txt,
     preprocess_md,
+    preprocess_md_async,
     md2html,
     get_at_node_md_link,
+    get_at_node_md_link_pattern,
     change_link_title,
     split_title_body,
     contain_only_http_link,
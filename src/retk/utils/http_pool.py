@@ -0,0 +1,93 @@
+"""Process-wide pooled http clients, one for each kind of remote service in each event loop.
+
+All requests to a service share the keep-alive connections of its client, instead of a new client
+and new TCP and TLS handshakes per request. HTTP/2 is used when the h2 package is installed.
+A client is bound to the event loop it is created in, so a job running in its own loop has its own clients.
+"""
+import asyncio
+import weakref
+from typing import Dict, Literal, Optional
+
+import httpx
+
+from retk import const
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+PoolName = Literal["llm", "cos", "web"]
+
+__clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = \
+    weakref.WeakKeyDictionary()
+__transports: Dict[str, httpx.AsyncBaseTransport] = {}
+
+
+def get(name: PoolName) -> httpx.AsyncClient:
+    """
+    Args:
+        name: "llm" for the LLM services, "cos" for the COS bucket,
+            "web" for the pages and images of the links in user notes
+
+    Returns:
+        httpx.AsyncClient: the pooled client of the running event loop
+    """
+    clients = __clients.setdefault(asyncio.get_running_loop(), {})
+    c = clients.get(name)
+    if c is None or c.is_closed:
+        c = __new_client(name)
+        clients[name] = c
+    return c
+
+
+def init():
+    """Create the clients of the app event loop on startup"""
+    for name in ("llm", "cos", "web"):
+        get(name)
+
+
+async def close():
+    """Close the clients of the running event loop, e.g. on shutdown or before a job closes its loop"""
+    clients = __clients.pop(asyncio.get_running_loop(), {})
+    for c in clients.values():
+        await c.aclose()
+
+
+def set_transport(name: PoolName, transport: Optional[httpx.AsyncBaseTransport]):
+    """Send the requests of a pool by this transport, e.g. a local stand-in of the remote in tests"""
+    if transport is None:
+        __transports.pop(name, None)
+    else:
+        __transports[name] = transport
+    for clients in __clients.values():
+        clients.pop(name, None)
+
+
+def __new_client(name: str) -> httpx.AsyncClient:
+    if name == "llm":
+        max_connections = const.settings.LLM_HTTP_MAX_CONNECTIONS
+        max_keepalive = const.settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS
+        timeout = const.settings.LLM_HTTP_TIMEOUT
+    elif name == "cos":
+        max_connections = const.settings.COS_MAX_CONNECTIONS
+        max_keepalive = const.settings.COS_MAX_KEEPALIVE_CONNECTIONS
+        timeout = const.settings.COS_TIMEOUT
+    elif name == "web":
+        max_connections = const.settings.WEB_HTTP_MAX_CONNECTIONS
+        max_keepalive = const.settings.WEB_HTTP_MAX_KEEPALIVE_CONNECTIONS
+        timeout = const.settings.WEB_HTTP_TIMEOUT
+    else:
+        raise ValueError(f"unknown http pool: {name}")
+    return httpx.AsyncClient(
+        transport=__transports.get(name),
+        http2=HTTP2 and name not in __transports,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=const.settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=timeout,
+    )
@@ -1,20 +1,25 @@
+import asyncio
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
 from html.parser import HTMLParser
 from io import StringIO
-from typing import Tuple
+from typing import Tuple, Optional, List
 
 from markdown import Markdown
 
-from retk import regex
+from retk import const, regex
 
 
 class HTMLStripper(HTMLParser):
     def __init__(self):
         super().__init__()
-        self.reset()
         self.strict = False
         self.convert_charrefs = True
+
+    def reset(self):
+        super().reset()
         self.text = StringIO()
 
     def handle_data(self, d):
@@ -24,10 +29,70 @@ class HTMLStripper(HTMLParser):
         return self.text.getvalue()
 
 
-def strip_html_tags(html: str) -> str:
-    s = HTMLStripper()
-    s.feed(html[:1000])
-    return s.get_data()
+# the parsers are reused, a restore strips the html of every note
+__strippers: List[HTMLStripper] = []
+__HTML_TAG = re.compile(
+    r"<!--.*?-->"
+    r"|</?[A-Za-z][A-Za-z0-9-]*"
+    r"(?:\s+[^\s<>\"'=/]+(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s<>\"'=`]+))?)*\s*/?>",
+    re.DOTALL,
+)
+
+
+def strip_html_tags(html: str, max_length: int = 1000) -> str:
+    """The text in the html, only the first max_length characters of the html are parsed"""
+    html = html[:max_length]
+    if "<" in html:
+        text = __HTML_TAG.sub("", html)
+        if "<" in text:
+            # a bare "<" or an unclosed tag, leave them to the parser
+            return __parse_html_text(html)
+    else:
+        text = html
+    if "&" in text:
+        text = unescape(text)
+    return text
+
+
+def __parse_html_text(html: str) -> str:
+    try:
+        s = __strippers.pop()
+    except IndexError:
+        s = HTMLStripper()
+    try:
+        s.feed(html)
+        return s.get_data()
+    finally:
+        s.reset()
+        if len(__strippers) < const.settings.MAX_HTML_STRIPPERS:
+            __strippers.append(s)
+
+
+async def strip_html_tags_batch(htmls: List[str], max_length: int = 1000) -> List[str]:
+    """strip_html_tags of many htmls, chunk by chunk in the worker threads"""
+    loop = asyncio.get_running_loop()
+    texts = []
+    for i in range(0, len(htmls), const.settings.STRIP_HTML_BATCH_CHUNK_SIZE):
+        chunk = htmls[i: i + const.settings.STRIP_HTML_BATCH_CHUNK_SIZE]
+        texts.extend(await loop.run_in_executor(_text_executor(), _strip_html_tags_chunk, chunk, max_length))
+    return texts
+
+
+def _strip_html_tags_chunk(htmls: List[str], max_length: int) -> List[str]:
+    return [strip_html_tags(h, max_length) for h in htmls]
+
+
+__text_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _text_executor() -> ThreadPoolExecutor:
+    global __text_executor
+    if __text_executor is None:
+        __text_executor = ThreadPoolExecutor(
+            max_workers=const.settings.TEXT_POOL_SIZE,
+            thread_name_prefix="text",
+        )
+    return __text_executor
 
 
 def __unmark_element(element, stream=None):
@@ -86,14 +151,93 @@ def md2txt(md: str) -> str:
     return __md.convert(md)
 
 
+# fenced code, the text in it is kept as it is
+__FENCED_CODE = re.compile(
+    r"^[ \t]*(`{3,}|~{3,})[^\n]*\n(.*?)(?:\n[ \t]*\1[ \t]*$|\Z)",
+    re.MULTILINE | re.DOTALL,
+)
+# lines without text: thematic break, setext underline, table delimiter row, link reference definition
+__NO_TEXT_LINE = re.compile(
+    r"^[ \t]*(?:"
+    r"([-=*_])(?:[ \t]*\1){2,}"
+    r"|\|?[ \t]*:?-+:?[ \t]*(?:\|[ \t]*:?-+:?[ \t]*)+\|?"
+    r"|\[[^\]\n]+]:[ \t]*\S.*"
+    r")[ \t]*$",
+    re.MULTILINE,
+)
+# block markers at the line start: blockquote, heading, list item and task
+__BLOCK_PREFIX = re.compile(
+    r"^[ \t]*(?:>[ \t]?)*[ \t]*(?:#{1,6}(?=[ \t]|$)|(?:[-*+]|\d{1,9}[.)])[ \t]+(?:\[[ xX]][ \t]+)?)?",
+    re.MULTILINE,
+)
+__INLINE = re.compile(
+    r"(`+)(.+?)\1"  # code span
+    r"|!\[[^\]\n]*]\([^)\n]*\)"  # image
+    r"|\[([^\]\n]*)](?:\([^)\n]*\)|\[[^\]\n]*])"  # link and reference link
+    r"|<((?:https?|ftp)://[^>\s]+)>"  # autolink
+    r"|</?[A-Za-z][^<>]*>|<!--.*?-->"  # html tag and comment
+    r"|(\*{1,3}|~~|(?<!\w)_{1,3})(?=\S)(.+?)(?<=\S)\5(?!\w)"  # emphasis and strikethrough
+    r"|\\([!-/:-@\[-`{-~])",  # backslash escape
+)
+__TABLE_ROW = re.compile(r"^\|(.*?)\|?[ \t]*$", re.MULTILINE)
+
+
+def __inline_text(m: re.Match) -> str:
+    if m.group(1) is not None:
+        return m.group(2).strip()
+    if m.group(3) is not None:
+        return __INLINE.sub(__inline_text, m.group(3))
+    if m.group(4) is not None:
+        return m.group(4)
+    if m.group(5) is not None:
+        return __INLINE.sub(__inline_text, m.group(6))
+    if m.group(7) is not None:
+        return m.group(7)
+    # image and html
+    return ""
+
+
+def __text_to_txt(text: str) -> str:
+    text = __NO_TEXT_LINE.sub("", text)
+    text = __BLOCK_PREFIX.sub("", text)
+    text = __TABLE_ROW.sub(lambda m: m.group(1).replace("|", " "), text)
+    text = __INLINE.sub(__inline_text, text)
+    return unescape(text)
+
+
+def fast_md2txt(md: str) -> str:
+    """Markdown to plain text by scanning the lines, no html is rendered.
+
+    The text is close to md2txt: markers, links, images and html tags are removed,
+    the text of code is kept, and the blank lines are dropped.
+    """
+    parts = []
+    start = 0
+    for found in __FENCED_CODE.finditer(md):
+        parts.append(__text_to_txt(md[start: found.start()]))
+        parts.append(found.group(2))
+        start = found.end()
+    parts.append(__text_to_txt(md[start:]))
+    lines = (line.strip() for line in "\n".join(parts).replace("\t", " ").splitlines())
+    return "\n".join(line for line in lines if line != "")
+
+
 def preprocess_md(md: str, snippet_len: int = 200) -> Tuple[str, str, str]:
     title, body = split_title_body(fulltext=md)
-    title = md2txt(title.strip())
-    body = md2txt(body.strip())
-    snippet = strip_html_tags(body)[:snippet_len]
+    title = fast_md2txt(title)
+    body = fast_md2txt(body)
+    snippet = body[:snippet_len]
     return title, body, snippet
 
 
+async def preprocess_md_async(md: str, snippet_len: int = 200) -> Tuple[str, str, str]:
+    """preprocess_md in a worker thread for a long md, the event loop keeps serving other requests"""
+    if len(md) < const.settings.PREPROCESS_MD_IN_POOL_MIN_LENGTH:
+        return preprocess_md(md, snippet_len)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_text_executor(), preprocess_md, md, snippet_len)
+
+
 def md2html(md: str, with_css=False) -> str:
     _html = __md_html.convert(md)
     # prevent XSS and other security issues
@@ -107,13 +251,16 @@ def get_at_node_md_link(title: str, nid: str) -> str:
     return f"[@{title}](/n/{nid})"
 
 
-def change_link_title(md: str, nid: str, new_title: str) -> str:
-    new_md = re.sub(
-        r"\[@[^].]*?]\(/n/{}/?\)".format(nid),
-        get_at_node_md_link(new_title, nid),
-        md,
-    )
-    return new_md
+def get_at_node_md_link_pattern(nid: str) -> re.Pattern:
+    return re.compile(r"\[@[^].]*?]\(/n/{}/?\)".format(re.escape(nid)))
+
+
+def change_link_title(md: str, nid: str, new_title: str, pattern: re.Pattern = None) -> str:
+    if pattern is None:
+        pattern = get_at_node_md_link_pattern(nid)
+    link = get_at_node_md_link(new_title, nid)
+    # a function replacement, the backslashes in title are not escapes
+    return pattern.sub(lambda _: link, md)
 
 
 def split_title_body(fulltext: str) -> (str, str):
@@ -13,6 +13,7 @@ from bson import ObjectId
 from retk import config, const
 from retk.logger import logger
 from retk.models import tps
+from . import http_pool
 
 
 def datetime2str(dt: datetime.datetime) -> str:
@@ -104,12 +105,12 @@ async def get_title_description_from_link(
     # end of SSRF protection
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url=url,
-                headers=ASYNC_CLIENT_HEADERS,
-                timeout=3.
-            )
+        response = await http_pool.get("web").get(
+            url=url,
+            headers=ASYNC_CLIENT_HEADERS,
+            follow_redirects=False,
+            timeout=3.
+        )
     except (
             httpx.ConnectTimeout,
             RuntimeError,
@@ -262,7 +263,11 @@ def get_node_dict(
         inTrashAt=in_trash_at,
         fromNodeIds=from_node_ids,
         toNodeIds=to_node_ids,
+        fromNodeIdsLen=len(from_node_ids),
+        toNodeIdsLen=len(to_node_ids),
         history=history,
+        historyKeyframes=[],
+        historyMigrated=True,
         favorite=False,
         summary="",
     )
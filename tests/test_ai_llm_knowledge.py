@@ -1,10 +1,17 @@
+import asyncio
+import datetime
+import shutil
 import unittest
+from pathlib import Path
+from unittest.mock import patch, AsyncMock
 
 from bson import ObjectId
+from bson.tz_util import utc
 
 from retk import const
 from retk.core.ai import llm
 from retk.core.ai.llm.knowledge.ops import ExtendCase
+from retk.models.client import client
 from tests import utils
 from tests.test_ai_llm_api import skip_no_api_key, clear_all_api_key
 
@@ -134,3 +141,142 @@ class LLMKnowledgeExtendTest(unittest.IsolatedAsyncioTestCase):
             for case in cases:
                 # self.assertEqual(const.CodeEnum.OK, case.extend_code, msg=case.summary)
                 print(f"{service} {model.value.key}\n{case.extend_md}\nkeywords={case.extend_search_terms}\n\n")
+
+
+class LLMKnowledgeLocalTest(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        utils.set_env(".env.test.local")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        utils.drop_env(".env.test.local")
+        shutil.rmtree(Path(__file__).parent / "temp", ignore_errors=True)
+
+    async def asyncSetUp(self) -> None:
+        await client.init()
+
+    async def asyncTearDown(self) -> None:
+        await client.drop()
+
+    async def test_llm_response_cache(self):
+        service = llm.api.MoonshotService.name
+        model = llm.api.MoonshotModelEnum.V1_8K.value.key
+        svr = llm.api.LLM_DEFAULT_SERVICES[service]
+
+        def new_cases(mds):
+            return [
+                ExtendCase(
+                    _id=ObjectId(), uid="testuid", nid=f"nid{i}",
+                    summary_service=service, summary_model=model,
+                    extend_service=service, extend_model=model,
+                    md=md,
+                ) for i, md in enumerate(mds)
+            ]
+
+        summary = AsyncMock(side_effect=lambda messages, **kwargs: [
+            (f"summary of {m[-1]['content']}", const.CodeEnum.OK) for m in messages
+        ])
+        extend = AsyncMock(side_effect=lambda messages, **kwargs: [
+            ({"title": "t", "content": m[-1]["content"], "searchTerms": ["a"]}, const.CodeEnum.OK) for m in messages
+        ])
+        with patch.object(svr, "batch_complete", summary), patch.object(svr, "batch_complete_json_detect", extend):
+            cases = await llm.knowledge.batch_summary(cases=new_cases(["a", "b", "a"]))
+            # the same content is sent once
+            self.assertEqual(2, len(summary.call_args.kwargs["messages"]))
+            self.assertEqual(["summary of a", "summary of b", "summary of a"], [c.summary for c in cases])
+            await llm.knowledge.batch_extend(cases=cases)
+
+            stats = await llm.knowledge.cache.stats()
+            self.assertEqual(4, stats["size"])
+            self.assertEqual(0, stats["hits"])
+
+            cases = await llm.knowledge.batch_summary(cases=new_cases(["b", "c"]))
+            self.assertEqual(["c"], [m[-1]["content"] for m in summary.call_args.kwargs["messages"]])
+            self.assertEqual(["summary of b", "summary of c"], [c.summary for c in cases])
+            await llm.knowledge.batch_extend(cases=cases)
+            self.assertEqual("t\n\nsummary of b", cases[0].extend_md)
+            self.assertEqual(["a"], cases[0].extend_search_terms)
+            self.assertEqual(2, extend.call_count)
+
+            stats = await llm.knowledge.cache.stats()
+            self.assertEqual(6, stats["size"])
+            self.assertEqual(2, stats["hits"])
+            self.assertGreater(stats["tokensSaved"], 0)
+
+            # the expired are evicted first, then the least recently hit
+            await client.coll.llm_response_cache.update_many(
+                {"service": service},
+                {"$set": {"createdAt": datetime.datetime.now(tz=utc) - datetime.timedelta(days=31)}},
+            )
+            # an expired response is replaced, a cached one is kept
+            stored = (await llm.knowledge.cache.stats())["stored"]
+            key = (await client.coll.llm_response_cache.find({}).to_list(length=None))[0]["key"]
+            for response in ["new", "newer"]:
+                await llm.knowledge.cache.put_many([
+                    {"key": key, "service": service, "model": model, "response": response, "tokens": 1},
+                ])
+            docs = await client.coll.llm_response_cache.find({"key": key}).to_list(length=None)
+            self.assertEqual(["new"], [d["response"] for d in docs])
+            self.assertEqual(stored + 1, (await llm.knowledge.cache.stats())["stored"])
+
+            with patch.object(const.settings, "LLM_CACHE_MAX_SIZE", 1):
+                await llm.knowledge.batch_summary(cases=new_cases(["d", "e"]))
+                self.assertEqual(8, await client.coll.llm_response_cache.count_documents({}))
+                self.assertEqual(7, await llm.knowledge.cache.evict())
+            self.assertEqual(1, await client.coll.llm_response_cache.count_documents({}))
+
+    async def test_summary_extend_pipeline(self):
+        slow = llm.api.MoonshotService.name
+        fast = llm.api.AliyunService.name
+        events = []
+
+        def mock_summary(service: str, delay: float):
+            async def batch_complete(messages, **kwargs):
+                await asyncio.sleep(delay)
+                events.append(f"summary {','.join(m[-1]['content'] for m in messages)}")
+                return [(f"summary of {m[-1]['content']}", const.CodeEnum.OK) for m in messages]
+
+            return patch.object(llm.api.LLM_DEFAULT_SERVICES[service], "batch_complete", batch_complete)
+
+        async def extend(messages, **kwargs):
+            events.append(f"extend {','.join(m[-1]['content'] for m in messages)}")
+            return [({"title": "t", "content": "c", "searchTerms": []}, const.CodeEnum.OK) for _ in messages]
+
+        cases = [
+            ExtendCase(
+                _id=ObjectId(), uid="testuid", nid=md,
+                summary_service=service, summary_model=model,
+                extend_service=fast, extend_model=llm.api.AliyunModelEnum.QWEN_PLUS.value.key,
+                md=md,
+            ) for md, service, model in [
+                ("slow0", slow, llm.api.MoonshotModelEnum.V1_8K.value.key),
+                ("fast0", fast, llm.api.AliyunModelEnum.QWEN_PLUS.value.key),
+                ("slow1", slow, llm.api.MoonshotModelEnum.V1_8K.value.key),
+                ("fast1", fast, llm.api.AliyunModelEnum.QWEN_PLUS.value.key),
+                ("unknown", "unknown", "unknown"),
+            ]
+        ]
+        with mock_summary(slow, 0.2), mock_summary(fast, 0), patch.object(
+                llm.api.LLM_DEFAULT_SERVICES[fast], "batch_complete_json_detect", extend,
+        ):
+            done = [c async for c in llm.knowledge.summary_extend_pipeline(cases=cases)]
+
+        self.assertEqual(5, len(done))
+        self.assertEqual("unknown", done[0].nid)
+        self.assertEqual(const.CodeEnum.LLM_SERVICE_ERROR, done[0].summary_code)
+        # the fast service is not held by the slow one, its cases are extended at once
+        self.assertEqual(["fast0", "fast1", "slow0", "slow1"], [c.nid for c in done[1:]])
+        self.assertLess(events.index("extend summary of fast0,summary of fast1"), events.index("summary slow0,slow1"))
+        # the waiting cases of a model are sent as one batch
+        self.assertEqual(
+            ["summary fast0,fast1", "extend summary of fast0,summary of fast1",
+             "summary slow0,slow1", "extend summary of slow0,summary of slow1"],
+            events,
+        )
+        for c in done[1:]:
+            self.assertEqual(const.CodeEnum.OK, c.summary_code)
+            self.assertEqual(const.CodeEnum.OK, c.extend_code)
+            self.assertEqual("t\n\nc", c.extend_md)
+            self.assertGreaterEqual(c.latency, c.summary_latency + c.extend_latency)
+        self.assertGreaterEqual(done[-1].latency, 0.2)
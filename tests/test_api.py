@@ -18,7 +18,10 @@ from httpx import Response
 from retk import const, config, PluginAPICallReturn
 from retk.application import app
 from retk.core import account, scheduler
+from retk.models import db_ops
 from retk.models.client import client
+from retk.models.search_engine.engine import encode_cursor
+from retk.models.search_engine.engine_es import ReindexProgress
 from retk.models.tps import convert_user_dict_to_authed_user
 from retk.models.tps.llm import ExtendedNode
 from retk.plugins.register import register_official_plugins, unregister_official_plugins
@@ -474,6 +477,125 @@ class TokenApiTest(unittest.IsolatedAsyncioTestCase):
         rj = self.check_ok_response(resp, 200)
         self.assertEqual(["aaa"], rj["queries"])
 
+    def test_search_nodes_cursor(self):
+        params = {
+            "q": "",
+            "sort": "createdAt",
+            "ord": "desc",
+            "limit": 1,
+        }
+        resp = self.client.get(
+            "/api/nodes",
+            params=params,
+            headers=self.default_headers,
+        )
+        rj = self.check_ok_response(resp, 200)
+        self.assertEqual(1, len(rj["data"]["nodes"]))
+        self.assertNotEqual("", rj["data"]["nextCursor"])
+        first = rj["data"]["nodes"][0]
+
+        resp = self.client.get(
+            "/api/nodes",
+            params={**params, "cursor": rj["data"]["nextCursor"]},
+            headers=self.default_headers,
+        )
+        rj = self.check_ok_response(resp, 200)
+        self.assertEqual(1, len(rj["data"]["nodes"]))
+        self.assertNotEqual(first["id"], rj["data"]["nodes"][0]["id"])
+        self.assertLessEqual(rj["data"]["nodes"][0]["createdAt"], first["createdAt"])
+
+        resp = self.client.get(
+            "/api/nodes",
+            params={**params, "cursor": "xxx"},
+            headers=self.default_headers,
+        )
+        self.error_check(resp, 400, const.CodeEnum.INVALID_PARAMS)
+
+        # a cursor of another sort
+        resp = self.client.get(
+            "/api/nodes",
+            params={**params, "sort": "title"},
+            headers=self.default_headers,
+        )
+        title_cursor = self.check_ok_response(resp, 200)["data"]["nextCursor"]
+        self.assertNotEqual("", title_cursor)
+        for cursor in [title_cursor, encode_cursor([1.5, "nid"])]:
+            resp = self.client.get(
+                "/api/nodes",
+                params={**params, "cursor": cursor},
+                headers=self.default_headers,
+            )
+            self.error_check(resp, 400, const.CodeEnum.INVALID_PARAMS)
+
+    def test_export_account(self):
+        resp = self.client.get("/api/files/export", headers=self.default_headers)
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual("application/zip", resp.headers["Content-Type"])
+        z = ZipFile(io.BytesIO(resp.content))
+        self.assertGreater(len(z.namelist()), 0)
+
+    def test_node_etag(self):
+        resp = self.client.post(
+            "/api/nodes",
+            json={"md": "target\ntext", "type": const.NodeTypeEnum.MARKDOWN.value},
+            headers=self.default_headers,
+        )
+        target = self.check_ok_response(resp, 201)["node"]
+        resp = self.client.post(
+            "/api/nodes",
+            json={"md": f"hub\n[@target](/n/{target['id']})", "type": const.NodeTypeEnum.MARKDOWN.value},
+            headers=self.default_headers,
+        )
+        hub = self.check_ok_response(resp, 201)["node"]
+
+        resp = self.client.get(f"/api/nodes/{target['id']}", headers=self.default_headers)
+        self.check_ok_response(resp, 200)
+        etag = resp.headers["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        resp = self.client.get(
+            f"/api/nodes/{target['id']}", headers={**self.default_headers, "If-None-Match": etag},
+        )
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(b"", resp.content)
+
+        # a linked node is changed
+        resp = self.client.put(
+            f"/api/nodes/{hub['id']}/md",
+            json={"md": f"hub2\n[@target](/n/{target['id']})"},
+            headers=self.default_headers,
+        )
+        self.check_ok_response(resp, 200)
+        resp = self.client.get(
+            f"/api/nodes/{target['id']}", headers={**self.default_headers, "If-None-Match": etag},
+        )
+        rj = self.check_ok_response(resp, 200)
+        self.assertEqual("hub2", rj["node"]["fromNodes"][0]["title"])
+        self.assertNotEqual(etag, resp.headers["ETag"])
+        etag = resp.headers["ETag"]
+
+        resp = self.client.put(f"/api/nodes/{target['id']}/favorite", headers=self.default_headers)
+        self.check_ok_response(resp, 200)
+        resp = self.client.get(
+            f"/api/nodes/{target['id']}", headers={**self.default_headers, "If-None-Match": etag},
+        )
+        self.assertTrue(self.check_ok_response(resp, 200)["node"]["favorite"])
+
+        params = {"q": "", "sort": "createdAt", "ord": "desc", "p": 0, "limit": 5}
+        resp = self.client.get("/api/nodes", params=params, headers=self.default_headers)
+        self.check_ok_response(resp, 200)
+        etag = resp.headers["ETag"]
+        self.assertTrue(etag.startswith("W/"))
+        resp = self.client.get(
+            "/api/nodes", params=params, headers={**self.default_headers, "If-None-Match": etag},
+        )
+        self.assertEqual(304, resp.status_code)
+        resp = self.client.put(f"/api/nodes/{hub['id']}/favorite", headers=self.default_headers)
+        self.check_ok_response(resp, 200)
+        resp = self.client.get(
+            "/api/nodes", params=params, headers={**self.default_headers, "If-None-Match": etag},
+        )
+        self.check_ok_response(resp, 200)
+
     def test_node(self):
         resp = self.client.get(
             "/api/nodes",
@@ -645,6 +767,49 @@ class TokenApiTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(2, rj["data"]["total"])
         self.assertEqual(2, len(rj["data"]["nodes"]))
 
+        resp = self.client.get(
+            "/api/nodes/core",
+            params={
+                "limit": 1,
+            },
+            headers=self.default_headers,
+        )
+        rj = self.check_ok_response(resp, 200)
+        self.assertEqual(1, len(rj["data"]["nodes"]))
+        first = rj["data"]["nodes"][0]["id"]
+        resp = self.client.get(
+            "/api/nodes/core",
+            params={
+                "limit": 1,
+                "cursor": rj["data"]["nextCursor"],
+                "total": False,
+            },
+            headers=self.default_headers,
+        )
+        rj = self.check_ok_response(resp, 200)
+        self.assertEqual(-1, rj["data"]["total"])
+        self.assertEqual(1, len(rj["data"]["nodes"]))
+        self.assertNotEqual(first, rj["data"]["nodes"][0]["id"])
+
+        resp = self.client.get(
+            "/api/nodes/core",
+            params={
+                "cursor": "xxx",
+            },
+            headers=self.default_headers,
+        )
+        self.error_check(resp, 400, const.CodeEnum.INVALID_PARAMS)
+
+        # a cursor of another sort, e.g. from the notices
+        resp = self.client.get(
+            "/api/nodes/core",
+            params={
+                "cursor": db_ops.encode_page_cursor({"_id": ObjectId()}, sort=[("_id", -1)]),
+            },
+            headers=self.default_headers,
+        )
+        self.error_check(resp, 400, const.CodeEnum.INVALID_PARAMS)
+
     def test_captcha(self):
         resp = self.client.get(
             "/api/captcha/img",
@@ -653,6 +818,35 @@ class TokenApiTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual("image/png", resp.headers["content-type"])
         self.assertGreater(len(resp.headers["x-captcha-token"]), 0)
 
+    def test_post_batch(self):
+        resp = self.client.post(
+            "/api/nodes/batch",
+            json={
+                "mds": [f"node{i}\ntext" for i in range(3)],
+                "type": const.NodeTypeEnum.MARKDOWN.value,
+            },
+            headers=self.default_headers,
+        )
+        rj = self.check_ok_response(resp, 201)
+        self.assertEqual(["node0", "node1", "node2"], [n["title"] for n in rj["nodes"]])
+
+        resp = self.client.get(
+            f"/api/nodes/{rj['nodes'][1]['id']}",
+            headers=self.default_headers,
+        )
+        rj = self.check_ok_response(resp, 200)
+        self.assertEqual("node1\ntext", rj["node"]["md"])
+
+        resp = self.client.post(
+            "/api/nodes/batch",
+            json={
+                "mds": [],
+                "type": const.NodeTypeEnum.MARKDOWN.value,
+            },
+            headers=self.default_headers,
+        )
+        self.assertEqual(422, resp.status_code)
+
     def test_batch(self):
         base_count = 2
         for i in range(10):
@@ -958,9 +1152,9 @@ class TokenApiTest(unittest.IsolatedAsyncioTestCase):
         self.assertIn("百度", node["md"])
 
     @patch("retk.core.node.backup.__remove_md_all_versions_from_cos")
-    @patch("retk.core.node.backup.__remove_md_from_cos")
-    @patch("retk.core.node.backup.__get_md_from_cos")
-    @patch("retk.core.node.backup.__save_md_to_cos")
+    @patch("retk.core.node.backup.__remove_hist_from_cos")
+    @patch("retk.core.node.backup.__get_hist_from_cos")
+    @patch("retk.core.node.backup.__save_hist_to_cos")
     def test_md_history(
             self,
             mock_save_md_to_cos,
@@ -969,7 +1163,7 @@ class TokenApiTest(unittest.IsolatedAsyncioTestCase):
             mock_remove_md_all_versions_from_cos,
     ):
         mock_save_md_to_cos.return_value = const.CodeEnum.OK
-        mock_get_md_from_cos.return_value = ("title2\ntext", const.CodeEnum.OK)
+        mock_get_md_from_cos.return_value = (b"title2\ntext", const.CodeEnum.OK)
         mock_remove_md_from_cos.return_value = const.CodeEnum.OK
         mock_remove_md_all_versions_from_cos.return_value = const.CodeEnum.OK
 
@@ -1025,6 +1219,47 @@ class TokenApiTest(unittest.IsolatedAsyncioTestCase):
 
         config.get_settings().MD_BACKUP_INTERVAL = bi
 
+    def test_link_title_progress(self):
+        resp = self.client.post(
+            "/api/nodes",
+            json={"md": "title1\ntext", "type": const.NodeTypeEnum.MARKDOWN.value},
+            headers=self.default_headers,
+        )
+        n1 = self.check_ok_response(resp, 201)["node"]
+        resp = self.client.post(
+            "/api/nodes",
+            json={"md": f"from\n[@title1](/n/{n1['id']})", "type": const.NodeTypeEnum.MARKDOWN.value},
+            headers=self.default_headers,
+        )
+        self.check_ok_response(resp, 201)
+
+        resp = self.client.get(
+            f"/api/nodes/{n1['id']}/link-title",
+            headers=self.default_headers,
+        )
+        rj = self.check_ok_response(resp, 200)
+        self.assertIsNone(rj["progress"])
+
+        resp = self.client.put(
+            f"/api/nodes/{n1['id']}/md",
+            json={"md": "title2\ntext"},
+            headers=self.default_headers,
+        )
+        self.check_ok_response(resp, 200)
+        resp = self.client.get(
+            f"/api/nodes/{n1['id']}/link-title",
+            headers=self.default_headers,
+        )
+        rj = self.check_ok_response(resp, 200)
+        self.assertEqual("title2", rj["progress"]["title"])
+        self.assertEqual(1, rj["progress"]["total"])
+
+        resp = self.client.get(
+            "/api/nodes/ssa/link-title",
+            headers=self.default_headers,
+        )
+        self.error_check(resp, 404, const.CodeEnum.NODE_NOT_EXIST)
+
     @patch("retk.plugins.base.Plugin.handle_api_call")
     def test_plugin(self, mock_handle_api_call):
         def check_one_plugin(ps):
@@ -1138,6 +1373,42 @@ class TokenApiTest(unittest.IsolatedAsyncioTestCase):
         )
         self.error_check(resp, 404, const.CodeEnum.USER_NOT_EXIST)
 
+        resp = self.client.get(
+            "/api/managers/outbox",
+            headers=self.default_headers,
+        )
+        rj = self.check_ok_response(resp, 200)
+        self.assertEqual(0, rj["data"]["pending"])
+        self.assertEqual(0, rj["data"]["failed"])
+
+        resp = self.client.get(
+            "/api/managers/search-reindex",
+            headers=self.default_headers,
+        )
+        rj = self.check_ok_response(resp, 200)
+        self.assertIsNone(rj["data"])
+        with patch.object(
+                client.search, "reindex_progress",
+                ReindexProgress(index="rethink-2", total=3, created=1, conflicts=1),
+                create=True,
+        ):
+            resp = self.client.get(
+                "/api/managers/search-reindex",
+                headers=self.default_headers,
+            )
+        rj = self.check_ok_response(resp, 200)
+        self.assertEqual("rethink-2", rj["data"]["index"])
+        self.assertEqual(2, rj["data"]["copied"])
+        self.assertFalse(rj["data"]["done"])
+
+        resp = self.client.get(
+            "/api/managers/llm-cache",
+            headers=self.default_headers,
+        )
+        rj = self.check_ok_response(resp, 200)
+        self.assertEqual(0, rj["data"]["size"])
+        self.assertIn("hitRate", rj["data"])
+
         email = "a@b.cd"
         resp = await self.create_new_temp_user(email)
 
@@ -1,7 +1,9 @@
+import asyncio
 import datetime
 import shutil
 import time
 import unittest
+import zipfile
 from copy import deepcopy
 from io import BytesIO
 from pathlib import Path
@@ -145,7 +147,7 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(const.CodeEnum.OK, code)
         self.assertTrue(n["favorite"])
 
-        favorites, total = await core.node.get_favorite(au=self.au, page=0, limit=10)
+        favorites, total, _ = await core.node.get_favorite(au=self.au, page=0, limit=10)
         self.assertEqual(1, len(favorites))
         self.assertEqual(1, total)
 
@@ -155,7 +157,7 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(const.CodeEnum.OK, code)
         self.assertFalse(n["favorite"])
 
-        favorites, total = await core.node.get_favorite(au=self.au, page=0, limit=10)
+        favorites, total, _ = await core.node.get_favorite(au=self.au, page=0, limit=10)
         self.assertEqual(0, len(favorites))
         self.assertEqual(0, total)
 
@@ -210,7 +212,7 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(const.CodeEnum.OK, code)
         self.assertEqual(used_space - len(node["md"].encode("utf-8")), u["usedSpace"])
 
-        nodes, total = await core.node.core_nodes(au=self.au, page=0, limit=10)
+        nodes, total, _ = await core.node.core_nodes(au=self.au, page=0, limit=10)
         self.assertEqual(2, len(nodes))
         self.assertEqual(2, total)
 
@@ -255,6 +257,11 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(1, len(q))
         self.assertGreater(q_[0]["modifiedAt"], q_time)
 
+        # service "a" does not exist, the case fails and leaves the queue
+        res = await tasks.extend_node.async_deliver_unscheduled_extend_nodes()
+        self.assertTrue(res.startswith("successfully extent 0 node, failed 1"), msg=res)
+        self.assertEqual(0, await client.coll.llm_extend_node_queue.count_documents({}))
+
         settings.LLM_KNOWLEDGE_SUMMARY_SERVICE = ""
         settings.LLM_KNOWLEDGE_SUMMARY_MODEL = ""
         settings.LLM_KNOWLEDGE_EXTEND_SERVICE = ""
@@ -295,6 +302,14 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
         n, code = await core.node.get(au=self.au, nid=node["id"])
         self.assertEqual(const.CodeEnum.OK, code)
         self.assertEqual(2, len(n["toNodeIds"]))
+        self.assertEqual(set(n["toNodeIds"]), {_n["id"] for _n in n["toNodes"]})
+
+        nodes, code = await core.node.get_batch(au=self.au, nids=[nid1["id"], nid2["id"]])
+        self.assertEqual(const.CodeEnum.OK, code)
+        for _n in nodes:
+            self.assertEqual([node["id"]], [fn["id"] for fn in _n["fromNodes"]])
+            self.assertEqual(node["title"], _n["fromNodes"][0]["title"])
+            self.assertEqual([], _n["toNodes"])
 
         cache = n["md"]
         n, _, code = await core.node.update_md(au=self.au, nid=node["id"], md=f'{cache}xxxx')
@@ -313,6 +328,21 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(const.CodeEnum.OK, code)
         self.assertEqual(0, len(n["fromNodeIds"]))
 
+    async def test_set_nodes_list_len(self, mock_batch_send):
+        n, _ = await core.node.post(au=self.au, md="title\ntext", type_=const.NodeTypeEnum.MARKDOWN.value)
+        # a node saved before the lengths are kept
+        doc = await client.coll.nodes.find_one({"id": n["id"]})
+        doc.pop("toNodeIdsLen")
+        doc.pop("fromNodeIdsLen")
+        doc.update({"_id": ObjectId(), "id": short_uuid(), "toNodeIds": [n["id"]], "fromNodeIds": []})
+        await client.coll.nodes.insert_one(doc)
+
+        await client.try_set_nodes_list_len()
+        old = await client.coll.nodes.find_one({"id": doc["id"]})
+        self.assertEqual(1, old["toNodeIdsLen"])
+        self.assertEqual(0, old["fromNodeIdsLen"])
+        self.assertEqual(0, len(await client.coll.nodes.find({"toNodeIdsLen": None}).to_list(length=None)))
+
     async def test_add_set(self, mock_batch_send):
         node, code = await core.node.post(
             au=self.au, md="title\ntext", type_=const.NodeTypeEnum.MARKDOWN.value
@@ -326,6 +356,333 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(const.CodeEnum.OK, code)
         self.assertEqual(1, len(node["toNodeIds"]))
 
+        node2, code = await core.node.post(
+            au=self.au, md="title2\ntext", type_=const.NodeTypeEnum.MARKDOWN.value
+        )
+        self.assertEqual(const.CodeEnum.OK, code)
+        ids = [node["id"], node2["id"]]
+        self.assertEqual(1, node["toNodeIdsLen"])
+        res = await db_ops.nodes_add_to_set(ids, "fromNodeIds", "nid1")
+        self.assertEqual(2, res.matched_count)
+        # already in the set
+        res = await db_ops.nodes_add_to_set(ids, "fromNodeIds", "nid1")
+        self.assertEqual(0, res.matched_count)
+        res = await db_ops.nodes_add_to_set(ids, "fromNodeIds", "nid2")
+        self.assertEqual(2, res.matched_count)
+        nodes, code = await core.node.get_batch(au=self.au, nids=ids)
+        self.assertEqual(const.CodeEnum.OK, code)
+        for n in nodes:
+            self.assertEqual(["nid1", "nid2"], n["fromNodeIds"])
+            self.assertEqual(2, n["fromNodeIdsLen"])
+
+        for _ in range(2):
+            await db_ops.nodes_pull(ids, "fromNodeIds", "nid1")
+        nodes, code = await core.node.get_batch(au=self.au, nids=ids)
+        self.assertEqual(const.CodeEnum.OK, code)
+        for n in nodes:
+            self.assertEqual(["nid2"], n["fromNodeIds"])
+            self.assertEqual(1, n["fromNodeIdsLen"])
+
+    async def test_many_links(self, mock_batch_send):
+        targets = []
+        for i in range(30):
+            n, code = await core.node.post(au=self.au, md=f"target{i}", type_=const.NodeTypeEnum.MARKDOWN.value)
+            self.assertEqual(const.CodeEnum.OK, code)
+            targets.append(n)
+        links = "\n".join(f"[@{n['title']}](/n/{n['id']})" for n in targets)
+        node, code = await core.node.post(au=self.au, md=f"hub\n{links}", type_=const.NodeTypeEnum.MARKDOWN.value)
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(30, len(node["toNodeIds"]))
+        nodes, code = await core.node.get_batch(au=self.au, nids=[n["id"] for n in targets])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertTrue(all(n["fromNodeIds"] == [node["id"]] for n in nodes))
+
+        links = "\n".join(f"[@{n['title']}](/n/{n['id']})" for n in targets[10:])
+        node, _, code = await core.node.update_md(au=self.au, nid=node["id"], md=f"hub\n{links}")
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(20, len(node["toNodeIds"]))
+        nodes, code = await core.node.get_batch(au=self.au, nids=[n["id"] for n in targets])
+        self.assertEqual(const.CodeEnum.OK, code)
+        linked = {n["id"]: n["fromNodeIds"] for n in nodes}
+        for n in targets[:10]:
+            self.assertEqual([], linked[n["id"]])
+        for n in targets[10:]:
+            self.assertEqual([node["id"]], linked[n["id"]])
+
+    async def test_post_batch(self, mock_batch_send):
+        target, code = await core.node.post(au=self.au, md="target", type_=const.NodeTypeEnum.MARKDOWN.value)
+        self.assertEqual(const.CodeEnum.OK, code)
+        u, _ = await core.user.get(uid=self.au.u.id)
+        used_space = u["usedSpace"]
+        mds = [f"title{i}\nbody{i}" for i in range(5)] + [f"linked\n[@target](/n/{target['id']})"]
+        nodes, code = await core.node.post_batch(au=self.au, mds=mds)
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(6, len(nodes))
+        self.assertEqual(["title0", "title1", "title2", "title3", "title4", "linked"], [n["title"] for n in nodes])
+        self.assertEqual([target["id"]], nodes[-1]["toNodeIds"])
+
+        target, code = await core.node.get(au=self.au, nid=target["id"])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual([nodes[-1]["id"]], target["fromNodeIds"])
+        self.assertEqual(1, target["fromNodeIdsLen"])
+        u, _ = await core.user.get(uid=self.au.u.id)
+        self.assertEqual(used_space + sum(len(md.encode("utf-8")) for md in mds), u["usedSpace"])
+        for n in nodes:
+            md_path = Path(__file__).parent / "temp" / const.settings.DOT_DATA / "md" / (n["id"] + ".md")
+            self.assertEqual(n["md"], md_path.read_text(encoding="utf-8"))
+        res = await client.search.search(au=self.au, query="body3")
+        self.assertIn(nodes[3]["id"], [d.nid for d in res[0]])
+
+        _, code = await core.node.post_batch(au=self.au, mds=["a" * (const.settings.MD_MAX_LENGTH + 1)])
+        self.assertEqual(const.CodeEnum.NOTE_EXCEED_MAX_LENGTH, code)
+
+    async def test_auto_clean_trash(self, mock_batch_send):
+        nodes = []
+        for i in range(3):
+            n, _ = await core.node.post(au=self.au, md=f"cleaned{i}\ntrash body{i}")
+            await core.node.to_trash(au=self.au, nid=n["id"])
+            nodes.append(n)
+        for n in nodes[:2]:
+            await client.coll.nodes.update_one(
+                {"id": n["id"]},
+                {"$set": {"inTrashAt": datetime.datetime.now(tz=utc) - datetime.timedelta(days=31)}},
+            )
+        # the datetimes are loaded from the disk as naive ones
+        await client.close()
+        await client.init()
+        doc = await client.coll.nodes.find_one({"id": nodes[0]["id"]})
+        self.assertIsNone(doc["inTrashAt"].tzinfo)
+        u, _ = await core.user.get(uid=self.au.u.id)
+        used_space = u["usedSpace"]
+
+        with patch.object(const.settings, "TRASH_CLEAN_BATCH_SIZE", 1):
+            res = await tasks.auto_clean_trash.async_auto_clean_trash(delta_days=30)
+        self.assertTrue(res.startswith("deleted 2 nodes, failed 0, in 2 batches"), msg=res)
+        for n in nodes[:2]:
+            self.assertIsNone(await client.coll.nodes.find_one({"id": n["id"]}))
+            md_path = Path(__file__).parent / "temp" / const.settings.DOT_DATA / "md" / (n["id"] + ".md")
+            self.assertFalse(md_path.exists())
+        self.assertIsNotNone(await client.coll.nodes.find_one({"id": nodes[2]["id"]}))
+        u, _ = await core.user.get(uid=self.au.u.id)
+        self.assertEqual(used_space - sum(len(n["md"].encode("utf-8")) for n in nodes[:2]), u["usedSpace"])
+        await client.search.restore_batch_from_trash(au=self.au, nids=[nodes[2]["id"]])
+        res = await client.search.search(au=self.au, query="trash")
+        self.assertEqual([nodes[2]["id"]], [d.nid for d in res[0]])
+
+    async def test_stream_account_zip(self, mock_batch_send):
+        bi = config.get_settings().MD_BACKUP_INTERVAL
+        config.get_settings().MD_BACKUP_INTERVAL = 0.0001
+        files_dir = Path(__file__).parent / "temp" / const.settings.DOT_DATA / const.settings.LOCAL_FILE_URL_PRE_DIR
+        files_dir.mkdir(parents=True, exist_ok=True)
+        img = bytes(range(256)) * 1000
+        (files_dir / "a.png").write_bytes(img)
+        n1, _ = await core.node.post(
+            au=self.au, md=f"exported\n![img](/{const.settings.LOCAL_FILE_URL_PRE_DIR}/a.png)",
+        )
+        time.sleep(0.001)
+        _, _, code = await core.node.update_md(au=self.au, nid=n1["id"], md="exported\nv2 ![img](/files/a.png)")
+        self.assertEqual(const.CodeEnum.OK, code)
+        n2, _ = await core.node.post(au=self.au, md="exported\nsame title")
+        n3, _ = await core.node.post(au=self.au, md="trashed\nx ![missing](/files/missing.png)")
+        await core.node.to_trash(au=self.au, nid=n3["id"])
+
+        chunks = [c async for c in core.files.stream_account_zip(au=self.au, with_history=True)]
+        z = zipfile.ZipFile(BytesIO(b"".join(chunks)))
+        names = z.namelist()
+        self.assertEqual("exported\nv2 ![img](/files/a.png)", z.read("exported.md").decode("utf-8"))
+        self.assertEqual("exported\nsame title", z.read(f"exported ({n2['id']}).md").decode("utf-8"))
+        self.assertIn("trash/trashed.md", names)
+        self.assertEqual(img, z.read("files/a.png"))
+        self.assertNotIn("files/missing.png", names)
+        self.assertTrue(any(name.startswith("history/exported/") for name in names))
+        self.assertIsNone(z.testzip())
+        config.get_settings().MD_BACKUP_INTERVAL = bi
+
+    async def test_get_node_fields(self, mock_batch_send):
+        target, _ = await core.node.post(au=self.au, md="target", type_=const.NodeTypeEnum.MARKDOWN.value)
+        n, _ = await core.node.post(
+            au=self.au, md=f"hub\n[@target](/n/{target['id']})", type_=const.NodeTypeEnum.MARKDOWN.value
+        )
+        doc, code = await core.node.get(au=self.au, nid=n["id"])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual([target["id"]], [d["id"] for d in doc["toNodes"]])
+
+        doc, code = await core.node.get(au=self.au, nid=n["id"], with_links=False)
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertNotIn("toNodes", doc)
+        self.assertEqual([target["id"]], doc["toNodeIds"])
+
+        docs, code = await core.node.get_batch(
+            au=self.au, nids=[n["id"], target["id"]], fields=["title"], with_links=False,
+        )
+        self.assertEqual(const.CodeEnum.OK, code)
+        for doc in docs:
+            self.assertEqual({"_id", "id", "title"}, set(doc.keys()))
+
+    async def test_node_outbox(self, mock_batch_send):
+        core.node.outbox.start()
+        try:
+            n, code = await core.node.post(au=self.au, md="outbox\nfirst", type_=const.NodeTypeEnum.MARKDOWN.value)
+            self.assertEqual(const.CodeEnum.OK, code)
+            # several updates before the job runs are one job
+            for i in range(3):
+                _, _, code = await core.node.update_md(au=self.au, nid=n["id"], md=f"outbox\nedited{i}")
+                self.assertEqual(const.CodeEnum.OK, code)
+            self.assertLessEqual(await client.coll.node_outbox.count_documents({}), 1)
+            await core.node.outbox.join()
+
+            res = await client.search.search(au=self.au, query="edited2")
+            self.assertIn(n["id"], [d.nid for d in res[0]])
+            md_path = Path(__file__).parent / "temp" / const.settings.DOT_DATA / "md" / (n["id"] + ".md")
+            self.assertEqual("outbox\nedited2", md_path.read_text(encoding="utf-8"))
+            stats = await core.node.outbox.stats()
+            self.assertEqual(0, stats["pending"])
+            self.assertEqual(0, stats["failed"])
+
+            # a failed side effect is retried
+            with patch.object(const.settings, "NODE_OUTBOX_RETRY_DELAY", 0.01), patch.object(
+                client.search, "update", new_callable=AsyncMock,
+                side_effect=[const.CodeEnum.OPERATION_FAILED, const.CodeEnum.OK],
+            ) as mock_update:
+                _, _, code = await core.node.update_md(au=self.au, nid=n["id"], md="outbox\nretry")
+                self.assertEqual(const.CodeEnum.OK, code)
+                await core.node.outbox.join()
+                self.assertEqual(2, mock_update.call_count)
+            stats = await core.node.outbox.stats()
+            self.assertEqual(0, stats["pending"])
+            self.assertLessEqual(1, stats["retried"])
+
+            # trashed while the add is waiting for a retry, it is not searchable after the add
+            add = client.search.add
+            with patch.object(const.settings, "NODE_OUTBOX_RETRY_DELAY", 0.2), patch.object(
+                client.search, "add", new_callable=AsyncMock, side_effect=[const.CodeEnum.OPERATION_FAILED],
+            ):
+                trashed, _ = await core.node.post(
+                    au=self.au, md="outbox\ntrashedbody", type_=const.NodeTypeEnum.MARKDOWN.value,
+                )
+                while client.search.add.call_count == 0:
+                    await asyncio.sleep(0.01)
+                client.search.add.side_effect = add
+                await core.node.to_trash(au=self.au, nid=trashed["id"])
+                await core.node.outbox.join()
+            res = await client.search.search(au=self.au, query="trashedbody")
+            self.assertNotIn(trashed["id"], [d.nid for d in res[0]])
+
+            # stopped while a job is running, the job keeps its flags and runs again after the lease
+            async def hang(**kwargs):
+                await asyncio.Event().wait()
+
+            with patch.object(client.search, "update", new_callable=AsyncMock, side_effect=hang) as mock_update:
+                _, _, code = await core.node.update_md(au=self.au, nid=n["id"], md="outbox\nstopped")
+                self.assertEqual(const.CodeEnum.OK, code)
+                while mock_update.call_count == 0:
+                    await asyncio.sleep(0.01)
+                await core.node.outbox.stop()
+            job = await client.coll.node_outbox.find_one({"nid": n["id"]})
+            self.assertTrue(job["searchUpdate"])
+            await client.coll.node_outbox.update_one({"_id": job["_id"]}, {"$set": {"lockedUntil": 0.}})
+            core.node.outbox.start()
+            await core.node.outbox.join()
+            res = await client.search.search(au=self.au, query="stopped")
+            self.assertIn(n["id"], [d.nid for d in res[0]])
+        finally:
+            await core.node.outbox.stop()
+
+    async def test_core_nodes(self, mock_batch_send):
+        targets = []
+        for i in range(3):
+            n, _ = await core.node.post(au=self.au, md=f"target{i}", type_=const.NodeTypeEnum.MARKDOWN.value)
+            targets.append(n)
+        hubs = []
+        for i in range(3):
+            links = " ".join(f"[@{n['title']}](/n/{n['id']})" for n in targets[:i + 1])
+            n, _ = await core.node.post(au=self.au, md=f"hub{i}\n{links}", type_=const.NodeTypeEnum.MARKDOWN.value)
+            self.assertEqual(i + 1, n["toNodeIdsLen"])
+            hubs.append(n)
+        n, _, code = await core.node.update_md(au=self.au, nid=hubs[0]["id"], md="hub0")
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(0, n["toNodeIdsLen"])
+        nodes, code = await core.node.get_batch(au=self.au, nids=[n["id"] for n in targets])
+        self.assertEqual([2, 2, 1], [n["fromNodeIdsLen"] for n in nodes])
+
+        nodes, total, cursor = await core.node.core_nodes(au=self.au, page=0, limit=2)
+        self.assertEqual([hubs[2]["id"], hubs[1]["id"]], [n["id"] for n in nodes])
+        # the default nodes and the default link
+        self.assertEqual(8, total)
+        nodes, total, cursor = await core.node.core_nodes(
+            au=self.au, page=0, limit=3, cursor=cursor, with_total=False,
+        )
+        self.assertEqual(-1, total)
+        self.assertEqual(3, len(nodes))
+        self.assertEqual(1, nodes[0]["toNodeIdsLen"])
+        for n in nodes[1:]:
+            self.assertEqual(0, n["toNodeIdsLen"])
+        self.assertGreater(nodes[1]["_id"], nodes[2]["_id"])
+
+        # the same as skipping the pages
+        paged, _, _ = await core.node.core_nodes(au=self.au, page=0, limit=0)
+        ids = []
+        cursor = ""
+        while True:
+            nodes, _, cursor = await core.node.core_nodes(au=self.au, page=0, limit=3, cursor=cursor)
+            ids.extend(n["id"] for n in nodes)
+            if cursor == "":
+                break
+        self.assertEqual([n["id"] for n in paged], ids)
+
+    async def test_link_graph(self, mock_batch_send):
+        core.node.graph.invalidate(self.au.u.id)
+        n1, _ = await core.node.post(au=self.au, md="n1", type_=const.NodeTypeEnum.MARKDOWN.value)
+        n2, _ = await core.node.post(au=self.au, md="n2", type_=const.NodeTypeEnum.MARKDOWN.value)
+        # built from the db
+        orphans = await core.node.graph.orphans(au=self.au)
+        self.assertIn(n1["id"], orphans)
+        self.assertIn(n2["id"], orphans)
+
+        # n3 -> n1, n3 -> n2, n4 -> n3, updated in place
+        n3, _ = await core.node.post(
+            au=self.au, md=f"n3\n[@n1](/n/{n1['id']}) [@n2](/n/{n2['id']})", type_=const.NodeTypeEnum.MARKDOWN.value,
+        )
+        n4, _ = await core.node.post(au=self.au, md="n4", type_=const.NodeTypeEnum.MARKDOWN.value)
+        n4, _, code = await core.node.update_md(au=self.au, nid=n4["id"], md=f"n4\n[@n3](/n/{n3['id']})")
+        self.assertEqual(const.CodeEnum.OK, code)
+
+        ranking = await core.node.graph.degree_ranking(au=self.au, limit=2, direction="out")
+        self.assertEqual([(n3["id"], 2), (n4["id"], 1)], ranking)
+        ranking = await core.node.graph.degree_ranking(au=self.au, limit=1, direction="both")
+        self.assertEqual([(n3["id"], 3)], ranking)
+        self.assertEqual(
+            {n3["id"]: 1, n1["id"]: 2, n2["id"]: 2},
+            await core.node.graph.neighbourhood(au=self.au, nid=n4["id"], hops=2),
+        )
+        self.assertEqual(
+            {n3["id"]: 1, n4["id"]: 2},
+            await core.node.graph.neighbourhood(au=self.au, nid=n1["id"], hops=2, direction="in"),
+        )
+        orphans = await core.node.graph.orphans(au=self.au)
+        self.assertNotIn(n1["id"], orphans)
+
+        # the node in trash is hidden, then deleted
+        code = await core.node.to_trash(au=self.au, nid=n3["id"])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual({}, await core.node.graph.neighbourhood(au=self.au, nid=n4["id"], hops=2))
+        orphans = await core.node.graph.orphans(au=self.au)
+        for n in [n1, n2, n4]:
+            self.assertIn(n["id"], orphans)
+        code = await core.node.restore_from_trash(au=self.au, nid=n3["id"])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(3, len(await core.node.graph.neighbourhood(au=self.au, nid=n4["id"], hops=2)))
+        await core.node.to_trash(au=self.au, nid=n3["id"])
+        code = await core.node.delete(au=self.au, nid=n3["id"])
+        self.assertEqual(const.CodeEnum.OK, code)
+        g = await core.node.graph.get(self.au.u.id)
+        self.assertEqual(0, g.degree(n1["id"], direction="in"))
+        orphans = await core.node.graph.orphans(au=self.au)
+
+        # the same as a graph built from the db
+        core.node.graph.invalidate(self.au.u.id)
+        self.assertEqual(sorted(orphans), sorted(await core.node.graph.orphans(au=self.au)))
+
     async def test_cursor_text(self, mock_batch_send):
         n1, code = await core.node.post(
             au=self.au, md="title\ntext", type_=const.NodeTypeEnum.MARKDOWN.value
@@ -383,7 +740,7 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
         code = await core.node.to_trash(au=self.au, nid=n1["id"])
         self.assertEqual(const.CodeEnum.OK, code)
 
-        ns, total = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=10)
+        ns, total, _ = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=10)
         self.assertEqual(1, len(ns))
         self.assertEqual(1, total)
         self.assertEqual(n1["id"], ns[0]["id"])
@@ -425,9 +782,14 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(6 + base_count, len(nodes))
         self.assertEqual(6 + base_count, total)
 
-        tns, total = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=10)
+        tns, total, _ = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=10)
         self.assertEqual(4, total)
         self.assertEqual(4, len(tns))
+        # the same inTrashAt, continued by _id
+        page1, _, cursor = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=3)
+        page2, _, next_cursor = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=3, cursor=cursor)
+        self.assertEqual([n["id"] for n in tns], [n["id"] for n in page1 + page2])
+        self.assertEqual("", next_cursor)
 
         code = await core.node.restore_batch_from_trash(au=self.au, nids=[n["id"] for n in tns[:2]])
         self.assertEqual(const.CodeEnum.OK, code)
@@ -437,7 +799,7 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
 
         code = await core.node.batch_delete(au=self.au, nids=[n["id"] for n in tns[2:4]])
         self.assertEqual(const.CodeEnum.OK, code)
-        tns, total = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=10)
+        tns, total, _ = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=10)
         self.assertEqual(0, total)
         self.assertEqual(0, len(tns))
 
@@ -483,10 +845,60 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
 
         n1, _, code = await core.node.update_md(au=self.au, nid=n1["id"], md="title1Changed\ntext")
         self.assertEqual(const.CodeEnum.OK, code)
+        await core.node.link_title.wait(n1["id"])
         n2, code = await core.node.get(au=self.au, nid=n2["id"])
         self.assertEqual(const.CodeEnum.OK, code)
         self.assertEqual(f"title2\n[@title1Changed](/n/{n1['id']})", n2["md"])
 
+    async def test_update_title_propagates_in_batches(self, mock_batch_send):
+        n1, code = await core.node.post(
+            au=self.au, md="title1\ntext", type_=const.NodeTypeEnum.MARKDOWN.value
+        )
+        self.assertEqual(const.CodeEnum.OK, code)
+        from_nids = []
+        for i in range(5):
+            n, code = await core.node.post(
+                au=self.au,
+                md=f"from{i}\n[@title1](/n/{n1['id']}) and [@title1](/n/{n1['id']})",
+                type_=const.NodeTypeEnum.MARKDOWN.value,
+            )
+            self.assertEqual(const.CodeEnum.OK, code)
+            from_nids.append(n["id"])
+        # the link is in the title line, its own title changes
+        n_title, code = await core.node.post(
+            au=self.au, md=f"[@title1](/n/{n1['id']}) notes\nbody", type_=const.NodeTypeEnum.MARKDOWN.value
+        )
+        self.assertEqual(const.CodeEnum.OK, code)
+        n_2hop, code = await core.node.post(
+            au=self.au, md=f"hop\n[@{n_title['title']}](/n/{n_title['id']})", type_=const.NodeTypeEnum.MARKDOWN.value
+        )
+        self.assertEqual(const.CodeEnum.OK, code)
+
+        with patch.object(const.settings, "LINK_TITLE_BATCH_SIZE", 2):
+            _, _, code = await core.node.update_md(au=self.au, nid=n1["id"], md="new\\title\ntext")
+            self.assertEqual(const.CodeEnum.OK, code)
+            progress = core.node.link_title.get_progress(n1["id"])
+            self.assertEqual(6, progress.total)
+            await core.node.link_title.wait(n1["id"])
+        self.assertFalse(progress.running)
+        self.assertEqual(6, progress.done)
+        self.assertEqual(const.CodeEnum.OK, progress.code)
+
+        nodes, code = await core.node.get_batch(au=self.au, nids=from_nids)
+        self.assertEqual(const.CodeEnum.OK, code)
+        for n in nodes:
+            self.assertEqual(2, n["md"].count(f"[@new\\title](/n/{n1['id']})"), msg=n["md"])
+        found, _ = await client.search.search(au=self.au, query="notes")
+        self.assertIn("new", {f.nid: f for f in found}[n_title["id"]].titleHighlight)
+        n_title, code = await core.node.get(au=self.au, nid=n_title["id"])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual("@new\\title notes", n_title["title"])
+
+        await core.node.link_title.wait(n_title["id"])
+        n, code = await core.node.get(au=self.au, nid=n_2hop["id"])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(f"hop\n[@@new\\title notes](/n/{n_title['id']})", n["md"])
+
     async def test_upload_image_vditor(self, mock_batch_send):
         u, code = await core.user.get(self.au.u.id)
         self.assertEqual(const.CodeEnum.OK, code)
@@ -572,13 +984,13 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
         _, _, code = await core.node.update_md(au=self.au, nid=node["id"], md="title2\nbody2")
         self.assertEqual(const.CodeEnum.OK, code)
         hist_dir = Path(__file__).parent / "temp" / const.settings.DOT_DATA / "md" / "hist" / node["id"]
-        self.assertEqual(1, len(list(hist_dir.glob("*.md"))))
+        self.assertEqual(1, len(list(hist_dir.glob("*.mdz"))))
 
         time.sleep(1)
 
         _, _, code = await core.node.update_md(au=self.au, nid=node["id"], md="title2\nbody3")
         self.assertEqual(const.CodeEnum.OK, code)
-        self.assertEqual(2, len(list(hist_dir.glob("*.md"))))
+        self.assertEqual(2, len(list(hist_dir.glob("*.mdz"))))
 
     async def test_md_history(self, mock_batch_send):
         bi = config.get_settings().MD_BACKUP_INTERVAL
@@ -617,6 +1029,100 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
 
         config.get_settings().MD_BACKUP_INTERVAL = bi
 
+    async def test_md_history_delta(self, mock_batch_send):
+        bi = config.get_settings().MD_BACKUP_INTERVAL
+        config.get_settings().MD_BACKUP_INTERVAL = 0.0001
+        body = "\n".join(f"line {i}" for i in range(200))
+        n1, code = await core.node.post(
+            au=self.au, md=f"title\n{body}", type_=const.NodeTypeEnum.MARKDOWN.value
+        )
+        self.assertEqual(const.CodeEnum.OK, code)
+        mds = []
+        for i in range(const.settings.MAX_MD_BACKUP_VERSIONS + 3):
+            time.sleep(0.001)
+            md = f"title{i}\n{body}\nedit {i}"
+            _, _, code = await core.node.update_md(au=self.au, nid=n1["id"], md=md)
+            self.assertEqual(const.CodeEnum.OK, code)
+            mds.insert(0, md)
+
+        n, code = await core.node.get(au=self.au, nid=n1["id"])
+        self.assertEqual(const.CodeEnum.OK, code)
+        hist = n["history"]
+        self.assertEqual(const.settings.MAX_MD_BACKUP_VERSIONS, len(hist))
+        self.assertLess(0, len(n["historyKeyframes"]))
+        # the keyframe of the oldest kept delta is kept
+        self.assertLessEqual(n["historyKeyframes"][-1], hist[-1])
+        for version, md in zip(hist, mds):
+            hist_md, code = await core.node.get_hist_edition_md(au=self.au, nid=n1["id"], version=version)
+            self.assertEqual(const.CodeEnum.OK, code)
+            self.assertEqual(md, hist_md)
+
+        hist_dir = Path(__file__).parent / "temp" / const.settings.DOT_DATA / "md" / "hist" / n1["id"]
+        files = list(hist_dir.glob("*.mdz"))
+        self.assertLessEqual(len(files), const.settings.MAX_MD_BACKUP_VERSIONS + 1)
+        self.assertLess(sum(f.stat().st_size for f in files), len(mds[0]) * 3)
+
+        config.get_settings().MD_BACKUP_INTERVAL = bi
+
+    async def test_migrate_md_hist(self, mock_batch_send):
+        n1, code = await core.node.post(
+            au=self.au, md="title\ntext", type_=const.NodeTypeEnum.MARKDOWN.value
+        )
+        self.assertEqual(const.CodeEnum.OK, code)
+        # full md copies of the old history
+        hist_dir = Path(__file__).parent / "temp" / const.settings.DOT_DATA / "md" / "hist" / n1["id"]
+        hist_dir.mkdir(parents=True, exist_ok=True)
+        versions = [f"2024-01-0{i} 10:00:00.000000Z" for i in range(1, 4)]
+        for i, v in enumerate(versions):
+            (hist_dir / f"{v.replace(':', '_')}.md").write_text(f"title{i}\ntext", encoding="utf-8")
+        mds = [f"title{i}\ntext" for i in range(len(versions))]
+        # the history list before the migration
+        await client.coll.nodes.update_one(
+            {"id": n1["id"]}, {"$set": {"history": versions[::-1], "historyKeyframes": []}},
+        )
+        # the history list is lost as after a local restore
+        n2, code = await core.node.post(
+            au=self.au, md="title\ntext", type_=const.NodeTypeEnum.MARKDOWN.value
+        )
+        self.assertEqual(const.CodeEnum.OK, code)
+        hist_dir2 = hist_dir.parent / n2["id"]
+        hist_dir2.mkdir(parents=True, exist_ok=True)
+        for v in versions:
+            (hist_dir2 / f"{v.replace(':', '_')}.md").write_text("lost", encoding="utf-8")
+
+        # the legacy versions are read before the migration reaches them
+        hist_md, code = await core.node.get_hist_edition_md(au=self.au, nid=n1["id"], version=versions[0])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(mds[0], hist_md)
+        # a version saved before the migration is kept
+        node = await client.coll.nodes.find_one({"id": n1["id"]})
+        node["md"] = "title\nnew"
+        node["modifiedAt"] = datetime.datetime.now(tz=utc)
+        code = await core.node.backup.storage_md(node=node, keep_hist=True)
+        self.assertEqual(const.CodeEnum.OK, code)
+        node = await client.coll.nodes.find_one({"id": n1["id"]})
+        versions.append(node["history"][0])
+        mds.append("title\nnew")
+
+        await core.node.backup.start_migrate_md_hist()
+        self.assertEqual(0, len(list(hist_dir.glob("*.md"))))
+        # not scanned again
+        self.assertTrue((hist_dir.parent / ".migrated").exists())
+        (hist_dir / "2024-01-04 10_00_00.000000Z.md").write_text("left", encoding="utf-8")
+        await core.node.backup.migrate_md_hist()
+        self.assertEqual(1, len(list(hist_dir.glob("*.md"))))
+        self.assertEqual(4, len(list(hist_dir.glob("*.mdz"))))
+        hist, code = await core.node.get_hist_editions(au=self.au, nid=n1["id"])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(versions[::-1], hist)
+        for md, v in zip(mds, versions):
+            hist_md, code = await core.node.get_hist_edition_md(au=self.au, nid=n1["id"], version=v)
+            self.assertEqual(const.CodeEnum.OK, code)
+            self.assertEqual(md, hist_md)
+        hist, code = await core.node.get_hist_editions(au=self.au, nid=n2["id"])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(versions[:3][::-1], hist)
+
     async def test_get_version(self, mock_batch_send):
         v, code = await core.self_hosted.get_latest_pkg_version()
         if code != const.CodeEnum.OK:
@@ -639,7 +1145,7 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
         )
         self.assertEqual(const.CodeEnum.OK, code)
 
-        docs, total = await core.notice.get_system_notices(0, 10)
+        docs, total, _ = await core.notice.get_system_notices(0, 10)
         self.assertEqual(1, len(docs))
         self.assertEqual(1, total)
         self.assertEqual(doc["_id"], docs[0]["_id"])
@@ -650,7 +1156,7 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
 
         await tasks.notice.async_deliver_unscheduled_system_notices()
         time.sleep(0.01)
-        docs, total = await core.notice.get_system_notices(0, 10)
+        docs, total, _ = await core.notice.get_system_notices(0, 10)
         self.assertTrue(docs[0]["scheduled"])
 
     async def test_notice(self, mock_batch_send):
@@ -734,6 +1240,15 @@ class LocalModelsTest(unittest.IsolatedAsyncioTestCase):
             self.assertFalse(s["read"])
             self.assertIsNone(s["readTime"])
 
+        n, code = await core.notice.get_user_notices(au, limit=2)
+        self.assertEqual([s["id"] for s in sn[:2]], [s["id"] for s in n["system"]["notices"]])
+        n, code = await core.notice.get_user_notices(au, limit=2, cursor=n["system"]["nextCursor"], with_total=False)
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual([sn[2]["id"]], [s["id"] for s in n["system"]["notices"]])
+        self.assertEqual(-1, n["system"]["total"])
+        self.assertTrue(n["hasUnread"])
+        self.assertEqual("", n["system"]["nextCursor"])
+
         code = await core.notice.mark_system_notice_read(au.u.id, sn[0]["id"])
         self.assertEqual(const.CodeEnum.OK, code)
 
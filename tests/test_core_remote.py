@@ -188,9 +188,9 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
 
     @utils.skip_no_connect
     @patch("retk.core.node.backup.__remove_md_all_versions_from_cos")
-    @patch("retk.core.node.backup.__remove_md_from_cos")
-    @patch("retk.core.node.backup.__get_md_from_cos")
-    @patch("retk.core.node.backup.__save_md_to_cos")
+    @patch("retk.core.node.backup.__remove_hist_from_cos")
+    @patch("retk.core.node.backup.__get_hist_from_cos")
+    @patch("retk.core.node.backup.__save_hist_to_cos")
     async def test_node(
             self,
             mock_batch_send,
@@ -225,7 +225,7 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(const.CodeEnum.OK, code)
         self.assertTrue(n["favorite"])
 
-        favorites, total = await core.node.get_favorite(au=self.au, page=0, limit=10)
+        favorites, total, _ = await core.node.get_favorite(au=self.au, page=0, limit=10)
         self.assertEqual(1, len(favorites))
         self.assertEqual(1, total)
 
@@ -235,7 +235,7 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(const.CodeEnum.OK, code)
         self.assertFalse(n["favorite"])
 
-        favorites, total = await core.node.get_favorite(au=self.au, page=0, limit=10)
+        favorites, total, _ = await core.node.get_favorite(au=self.au, page=0, limit=10)
         self.assertEqual(0, len(favorites))
         self.assertEqual(0, total)
 
@@ -278,15 +278,15 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(const.CodeEnum.OK, code)
         self.assertEqual(used_space - len(node["md"].encode("utf-8")), u["usedSpace"])
 
-        nodes, total = await core.node.core_nodes(au=self.au, page=0, limit=10)
+        nodes, total, _ = await core.node.core_nodes(au=self.au, page=0, limit=10)
         self.assertEqual(2, len(nodes))
         self.assertEqual(2, total)
 
     @utils.skip_no_connect
     @patch("retk.core.node.backup.__remove_md_all_versions_from_cos")
-    @patch("retk.core.node.backup.__remove_md_from_cos")
-    @patch("retk.core.node.backup.__get_md_from_cos")
-    @patch("retk.core.node.backup.__save_md_to_cos")
+    @patch("retk.core.node.backup.__remove_hist_from_cos")
+    @patch("retk.core.node.backup.__get_hist_from_cos")
+    @patch("retk.core.node.backup.__save_hist_to_cos")
     async def test_node_in_ai_extend_queue(
             self,
             mock_batch_send,
@@ -347,9 +347,9 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
 
     @utils.skip_no_connect
     @patch("retk.core.node.backup.__remove_md_all_versions_from_cos")
-    @patch("retk.core.node.backup.__remove_md_from_cos")
-    @patch("retk.core.node.backup.__get_md_from_cos")
-    @patch("retk.core.node.backup.__save_md_to_cos")
+    @patch("retk.core.node.backup.__remove_hist_from_cos")
+    @patch("retk.core.node.backup.__get_hist_from_cos")
+    @patch("retk.core.node.backup.__save_hist_to_cos")
     async def test_parse_at(
             self,
             mock_batch_send,
@@ -445,7 +445,7 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
         code = await core.node.to_trash(self.au, n1["id"])
         self.assertEqual(const.CodeEnum.OK, code)
 
-        ns, total = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=10)
+        ns, total, _ = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=10)
         self.assertEqual(1, len(ns))
         self.assertEqual(1, total)
         self.assertEqual(n1["id"], ns[0]["id"])
@@ -465,9 +465,9 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
 
     @utils.skip_no_connect
     @patch("retk.core.node.backup.__remove_md_all_versions_from_cos")
-    @patch("retk.core.node.backup.__remove_md_from_cos")
-    @patch("retk.core.node.backup.__get_md_from_cos")
-    @patch("retk.core.node.backup.__save_md_to_cos")
+    @patch("retk.core.node.backup.__remove_hist_from_cos")
+    @patch("retk.core.node.backup.__get_hist_from_cos")
+    @patch("retk.core.node.backup.__save_hist_to_cos")
     async def test_batch(
             self,
             mock_batch_send,
@@ -499,7 +499,7 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(6 + base_count, len(nodes))
         self.assertEqual(6 + base_count, total)
 
-        tns, total = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=10)
+        tns, total, _ = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=10)
         self.assertEqual(4, total)
         self.assertEqual(4, len(tns))
 
@@ -514,7 +514,7 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
         code = await core.node.batch_delete(self.au, [n["id"] for n in tns[2:4]])
         self.assertEqual(const.CodeEnum.OK, code)
 
-        tns, total = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=10)
+        tns, total, _ = await core.node.get_nodes_in_trash(au=self.au, page=0, limit=10)
         self.assertEqual(0, total)
         self.assertEqual(0, len(tns))
 
@@ -541,9 +541,9 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
 
     @utils.skip_no_connect
     @patch("retk.core.node.backup.__remove_md_all_versions_from_cos")
-    @patch("retk.core.node.backup.__remove_md_from_cos")
-    @patch("retk.core.node.backup.__get_md_from_cos")
-    @patch("retk.core.node.backup.__save_md_to_cos")
+    @patch("retk.core.node.backup.__remove_hist_from_cos")
+    @patch("retk.core.node.backup.__get_hist_from_cos")
+    @patch("retk.core.node.backup.__save_hist_to_cos")
     async def test_md_history(
             self,
             mock_batch_send,
@@ -553,7 +553,7 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
             mock_remove_md_all_versions_from_cos,
     ):
         mock_save_md_to_cos.return_value = const.CodeEnum.OK
-        mock_get_md_from_cos.return_value = ("title2\ntext", const.CodeEnum.OK)
+        mock_get_md_from_cos.return_value = (b"title2\ntext", const.CodeEnum.OK)
         mock_remove_md_from_cos.return_value = const.CodeEnum.OK
         mock_remove_md_all_versions_from_cos.return_value = const.CodeEnum.OK
 
@@ -608,7 +608,7 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
         )
         self.assertEqual(const.CodeEnum.OK, code)
 
-        docs, total = await core.notice.get_system_notices(0, 10)
+        docs, total, _ = await core.notice.get_system_notices(0, 10)
         self.assertEqual(1, len(docs))
         self.assertEqual(1, total)
         self.assertEqual(doc["_id"], docs[0]["_id"])
@@ -619,7 +619,7 @@ class RemoteModelsTest(unittest.IsolatedAsyncioTestCase):
 
         await tasks.notice.async_deliver_unscheduled_system_notices()
         time.sleep(0.01)
-        docs, total = await core.notice.get_system_notices(0, 10)
+        docs, total, _ = await core.notice.get_system_notices(0, 10)
         self.assertTrue(docs[0]["scheduled"])
 
     @utils.skip_no_connect
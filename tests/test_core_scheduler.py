@@ -166,3 +166,27 @@ class TestCoreAsyncTask(unittest.TestCase):
                 break
             self.assertFalse(fail)
             count += 1
+
+
+def hang_in_app_loop():
+    return scheduler.tasks.utils.run_in_app_loop(asyncio.sleep(60))
+
+
+class TestAppLoopTask(unittest.IsolatedAsyncioTestCase):
+    async def test_stop_with_running_app_loop_job(self):
+        scheduler.start()
+        scheduler.clear_jobs()
+        ji, _ = scheduler.run_once_now(job_id="hang_in_app_loop", func=hang_in_app_loop)
+        while ji.executed_at is None:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+
+        # the job thread waits for this loop, stop does not wait for it
+        t0 = time.perf_counter()
+        scheduler.stop()
+        self.assertLess(time.perf_counter() - t0, 1)
+        for _ in range(100):
+            if ji.finished_at is not None:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual("cancelled", ji.finished_return)
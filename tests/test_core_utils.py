@@ -6,13 +6,17 @@ import unittest
 import zipfile
 from datetime import timedelta
 from io import BytesIO
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 
 import httpx
 
+from retk import const
+from retk.core.node import backup
 from retk.core.utils import md_tools
 from retk.core.utils import ratelimiter
-from retk.core.utils.cos import cos_client
+from retk.core.utils.cos import cos_client, COSClient
+from retk.utils import http_pool
+from tests.utils import FakeS3
 
 
 def skip_no_cos(fn):
@@ -24,6 +28,20 @@ def skip_no_cos(fn):
     return wrapper
 
 
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
 class UtilsTest(unittest.IsolatedAsyncioTestCase):
 
     @patch("httpx.AsyncClient.get")
@@ -68,7 +86,8 @@ class UtilsTest(unittest.IsolatedAsyncioTestCase):
         tasks = [fetch("https://xxx") for _ in range(16)]
         await asyncio.gather(*tasks)
         total_time = time.time() - st
-        self.assertGreaterEqual(total_time, 1)
+        # 5 at once, the other 11 are refilled at 50/s
+        self.assertGreaterEqual(total_time, 0.2)
         # self.assertLess(total_time, 2.5)
         self.assertEqual(16, count)
 
@@ -108,10 +127,81 @@ class UtilsTest(unittest.IsolatedAsyncioTestCase):
         tasks = [fetch() for _ in range(4)]
         await asyncio.gather(*tasks)
         total_time = time.time() - st
-        self.assertGreaterEqual(total_time, 0.29)
+        self.assertGreaterEqual(total_time, 0.19)
         # self.assertLess(total_time, 0.5)
         self.assertEqual(4, count)
 
+    async def test_token_bucket_virtual_clock(self):
+        clock = VirtualClock()
+        limiter = ratelimiter.RateLimiter(requests=2, period=1, clock=clock.time, sleep=clock.sleep)
+        times = []
+
+        async def fetch():
+            await limiter.acquire(1)
+            times.append(clock.now)
+
+        await asyncio.gather(*[fetch() for _ in range(6)])
+        # a burst of 2, then refilled continuously at 2/s
+        self.assertEqual([0, 0, 0.5, 1, 1.5, 2], times)
+        # only the first waiter sleeps, once for each token
+        self.assertEqual([0.5] * 4, clock.sleeps)
+
+        clock.now += 10
+        self.assertEqual(0, limiter.wait_time(2))
+        # a request larger than the bucket waits for a full bucket and leaves it in debt
+        await limiter.acquire(4)
+        self.assertEqual(1.5, limiter.wait_time(1))
+
+    async def test_token_bucket_cancel_waiter(self):
+        clock = VirtualClock()
+        limiter = ratelimiter.RateLimiter(requests=1, period=1, clock=clock.time, sleep=clock.sleep)
+        await limiter.acquire(1)
+        blocked = asyncio.Event()
+
+        async def block(_):
+            blocked.set()
+            await asyncio.Event().wait()
+
+        limiter.sleep = block
+        first = asyncio.create_task(limiter.acquire(1))
+        second = asyncio.create_task(limiter.acquire(1))
+        await blocked.wait()
+        limiter.sleep = clock.sleep
+        first.cancel()
+        await second
+        self.assertEqual(1, clock.now)
+        self.assertEqual(0, len(limiter._waiters))
+
+    async def test_model_limiter_virtual_clock(self):
+        clock = VirtualClock()
+        limiter = ratelimiter.ModelLimiter(rpm=60, tpm=600, rpd=3, clock=clock.time, sleep=clock.sleep)
+
+        self.assertTrue(await limiter.acquire(tokens=500))
+        # the service reports fewer tokens than estimated, they are given back
+        limiter.settle(reserved=500, used=100)
+        self.assertTrue(await limiter.acquire(tokens=400))
+        self.assertEqual(0, clock.now)
+        # 300 more tokens are refilled at 10/s
+        self.assertTrue(await limiter.acquire(tokens=400))
+        self.assertAlmostEqual(30, clock.now)
+        # the daily quota is refused without waiting
+        self.assertFalse(await limiter.acquire(tokens=1))
+        self.assertAlmostEqual(30, clock.now)
+        clock.now += 24 * 60 * 60 / 3
+        self.assertTrue(await limiter.acquire(tokens=1))
+
+    async def test_model_limiter_registry(self):
+        a = ratelimiter.get_model_limiter(service="s", model="m", rpm=1, tpm=10, rpd=100)
+        self.assertIs(a, ratelimiter.get_model_limiter(service="s", model="m", rpm=1, tpm=10, rpd=100))
+        self.assertIsNot(a, ratelimiter.get_model_limiter(service="s", model="m2", rpm=1, tpm=10, rpd=100))
+        self.assertIsNot(a, ratelimiter.get_model_limiter(service="s", model="m", rpm=2, tpm=10, rpd=100))
+
+        with ratelimiter.track_usage() as usage:
+            ratelimiter.report_usage(42)
+        self.assertEqual({"total": 42}, usage)
+        # not tracked
+        ratelimiter.report_usage(1)
+
     @skip_no_cos
     @patch("retk.config.is_local_db")
     def test_replace_app_files_in_md(self, mock_is_local_db):
@@ -317,3 +407,49 @@ class UtilsTest(unittest.IsolatedAsyncioTestCase):
             self.assertTrue(v)
 
         self.assertTrue(await cos_client.async_batch_has_file(uid=uid, filenames=list(files.keys())))
+
+    @patch("retk.core.utils.cos.get_settings")
+    async def test_cos_pooled_client(self, mock_get_settings):
+        mock_get_settings.return_value = MagicMock(
+            COS_REGION="ap-test",
+            COS_SECRET_ID="id",
+            COS_SECRET_KEY="key",
+            COS_BUCKET_NAME="bucket",
+            COS_DOMAIN="cos.test",
+        )
+        s3 = FakeS3()
+        c = COSClient()
+        c.init(transport=s3.transport)
+        http = c.http
+
+        self.assertTrue(await c.async_put(file=BytesIO(b"test"), uid="u1", filename="a.txt"))
+        self.assertTrue(await c.async_has_file(uid="u1", filename="a.txt"))
+        self.assertEqual(b"test", await c.async_get(uid="u1", filename="a.txt"))
+        self.assertIsNone(await c.async_get_object(key="userData/u1/b.txt"))
+        self.assertTrue(await c.async_delete_object(key="userData/u1/a.txt"))
+        self.assertFalse(await c.async_has_file(uid="u1", filename="a.txt"))
+        # all requests are sent by the same pooled client
+        self.assertIs(http, c.http)
+
+        # a history version is put without a HEAD first, and rebuilt from the keyframe and the delta
+        with patch("retk.core.node.backup.cos_client", c), patch("retk.config.is_local_db", return_value=False):
+            md = "title\n" + "\n".join(f"line {i}" for i in range(100))
+            new_md = md.replace("line 50", "edited")
+            v1, v2 = "2024-01-01 10:00:00.000000Z", "2024-01-02 10:00:00.000000Z"
+            save = getattr(backup, "__save_hist_to_cos")
+            s3.methods.clear()
+            code = await save("u1", "n1", f"{v1}.mdz", backup._encode_keyframe(md))
+            self.assertEqual(const.CodeEnum.OK, code)
+            code = await save("u1", "n1", f"{v2}.mdz", backup._encode_delta(v1, md, new_md))
+            self.assertEqual(const.CodeEnum.OK, code)
+            self.assertEqual(["PUT", "PUT"], s3.methods)
+            hist_md, code = await backup.get_md(uid="u1", nid="n1", version=v2)
+            self.assertEqual(const.CodeEnum.OK, code)
+            self.assertEqual(new_md, hist_md)
+            _, code = await backup.get_md(uid="u1", nid="n1", version="2024-01-03 10:00:00.000000Z")
+            self.assertEqual(const.CodeEnum.COS_ERROR, code)
+
+        await http_pool.close()
+        self.assertIsNot(http, c.http)
+        http_pool.set_transport("cos", None)
+        await http_pool.close()
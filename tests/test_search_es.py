@@ -1,5 +1,7 @@
+import asyncio
 import datetime
 import unittest
+from unittest.mock import patch
 
 import elastic_transport
 from bson import ObjectId
@@ -106,6 +108,43 @@ class ESTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(20, await self.searcher.count_all())
         self.assertIn(config.get_settings().ES_INDEX_ALIAS, self.searcher.index)
         self.assertEqual("2", self.searcher.index.split("-")[-1])
+        self.assertTrue(self.searcher.reindex_progress.done)
+        self.assertEqual(20, self.searcher.reindex_progress.total)
+
+    @utils.skip_no_connect
+    async def test_online_reindex(self):
+        code = await self.searcher.add_batch(au=self.au, docs=[SearchDoc(
+            nid=f"nid{i}",
+            title=f"title{i}",
+            body=f"this is {i} doc, 这是第 {i} 个文档",
+        ) for i in range(20)])
+        self.assertEqual(const.CodeEnum.OK, code)
+        await self.searcher.refresh()
+
+        task = asyncio.create_task(self.searcher.reindex())
+        await utils.wait_until(lambda: self.searcher._reindex_target is not None or task.done())
+        # written while reindexing, searched from the old index
+        self.assertIsNotNone(self.searcher._reindex_target)
+        code = await self.searcher.add(au=self.au, doc=SearchDoc(nid="nid20", title="title20", body="new doc"))
+        self.assertEqual(const.CodeEnum.OK, code)
+        code = await self.searcher.update(au=self.au, doc=SearchDoc(nid="nid0", title="updated", body="updated"))
+        self.assertEqual(const.CodeEnum.OK, code)
+        code = await self.searcher.to_trash(au=self.au, nid="nid1")
+        self.assertEqual(const.CodeEnum.OK, code)
+        code = await self.searcher.delete(au=self.au, nid="nid1")
+        self.assertEqual(const.CodeEnum.OK, code)
+        _, total = await self.searcher.search(au=self.au, query="", limit=1)
+        self.assertEqual(20, total)
+
+        await task
+        await self.searcher.refresh()
+        self.assertEqual("2", self.searcher.index.split("-")[-1])
+        self.assertEqual(20, await self.searcher.count_all())
+        docs, total = await self.searcher.search(au=self.au, query="updated", limit=10)
+        self.assertEqual(1, total)
+        self.assertEqual("nid0", docs[0].nid)
+        docs, _ = await self.searcher.search(au=self.au, query="new doc", limit=1)
+        self.assertEqual("nid20", docs[0].nid)
 
     @utils.skip_no_connect
     async def test_add(self):
@@ -300,3 +339,116 @@ class ESTest(unittest.IsolatedAsyncioTestCase):
             self.assertEqual(10, len(docs))
             self.assertEqual(20, total)
             self.assertEqual(f"{uid}nid19", docs[0].nid)
+
+            # each user's documents are routed by uid
+            doc = await self.searcher.es.get(index=self.searcher.index, id=f"{uid}nid0", routing=uid)
+            self.assertEqual(uid, doc["_routing"])
+
+    @utils.skip_no_connect
+    async def test_bulk_buffer(self):
+        # the writers wait for the bulk request which sends their actions
+        writes = [asyncio.create_task(self.searcher.add(au=self.au, doc=SearchDoc(
+            nid=f"nid{i}",
+            title=f"title{i}",
+            body=f"this is {i} doc, 这是第 {i} 个文档",
+        ))) for i in range(5)]
+        writes += [asyncio.create_task(self.searcher.update(au=self.au, doc=SearchDoc(
+            nid="nid0",
+            title=f"title0 update{j}",
+            body="this is 0 doc",
+        ))) for j in range(3)]
+        # add and its following updates are coalesced into one action per nid
+        await utils.wait_until(
+            lambda: self.searcher._pending.get("nid0", {}).get("_source", {}).get("title") == "title0 update2"
+        )
+        self.assertEqual(5, len(self.searcher._pending))
+        self.assertEqual("index", self.searcher._pending["nid0"]["_op_type"])
+
+        # read-your-writes, visible without an explicit refresh
+        code = await self.searcher.disable(au=self.au, nid="nid1")
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(0, len(self.searcher._pending))
+        self.assertEqual([const.CodeEnum.OK] * 8, await asyncio.gather(*writes))
+        docs, total = await self.searcher.search(
+            au=self.au,
+            query="doc",
+            sort_key="createdAt",
+            reverse=True,
+            page=0,
+            limit=10,
+        )
+        self.assertEqual(4, total)
+        self.assertEqual("nid0", docs[-1].nid)
+        self.assertEqual("title0 update2", docs[-1].titleHighlight)
+
+        write = asyncio.create_task(
+            self.searcher.update(au=self.au, doc=SearchDoc(nid="nid2", title="title2", body="new"))
+        )
+        await utils.wait_until(lambda: len(self.searcher._pending) == 1)
+        code = await self.searcher.flush()
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(0, len(self.searcher._pending))
+        self.assertEqual(const.CodeEnum.OK, await write)
+
+        # another flush takes the action to trash with its refresh, the trashed node is not searchable at once
+        async with self.searcher._flush_lock:
+            write = asyncio.create_task(
+                self.searcher.update(au=self.au, doc=SearchDoc(nid="nid3", title="title3", body="new"))
+            )
+            await utils.wait_until(lambda: len(self.searcher._pending) == 1)
+            other = asyncio.create_task(self.searcher.flush())
+            await utils.wait_until(lambda: len(self.searcher._flush_lock._waiters or []) == 1)
+            trash = asyncio.create_task(self.searcher.to_trash(au=self.au, nid="nid2"))
+            await utils.wait_until(lambda: len(self.searcher._pending) == 2)
+        self.assertEqual([const.CodeEnum.OK] * 3, await asyncio.gather(write, other, trash))
+        docs, total = await self.searcher.search(au=self.au, query="title2")
+        self.assertEqual(0, total)
+
+        # the actions are kept for the retry when elasticsearch is not reachable
+        with patch(
+                "retk.models.search_engine.engine_es.helpers.async_bulk",
+                side_effect=elastic_transport.ConnectionError("down"),
+        ):
+            code = await self.searcher.update(au=self.au, doc=SearchDoc(nid="nid3", title="title3", body="old"))
+        self.assertEqual(const.CodeEnum.OPERATION_FAILED, code)
+        self.assertIsNotNone(self.searcher._flush_task)
+        self.assertEqual(1, len(self.searcher._pending))
+        write = asyncio.create_task(
+            self.searcher.update(au=self.au, doc=SearchDoc(nid="nid3", title="title3", body="new"))
+        )
+        await utils.wait_until(lambda: self.searcher._pending["nid3"]["doc"]["body"] == "new")
+        self.assertEqual(1, len(self.searcher._pending))
+        code = await self.searcher.flush()
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(const.CodeEnum.OK, await write)
+        self.assertIsNone(self.searcher._flush_task)
+        self.assertEqual(0, self.searcher._flush_retries)
+
+    @utils.skip_no_connect
+    async def test_cursor_pagination(self):
+        code = await self.searcher.add_batch(au=self.au, docs=[
+            SearchDoc(
+                nid=f"nid{i:02d}",
+                title=f"title{i:02d}",
+                body=f"this is {i} doc, 这是第 {i} 个文档",
+            ) for i in range(25)
+        ])
+        self.assertEqual(const.CodeEnum.OK, code)
+        await self.searcher.refresh()
+
+        for sort_key, reverse in [("createdAt", True), ("title", False), ("similarity", False)]:
+            all_docs, _ = await self.searcher.search(
+                au=self.au, query="doc", sort_key=sort_key, reverse=reverse, page=0, limit=25,
+            )
+            nids = []
+            cursor = ""
+            while True:
+                docs, total = await self.searcher.search(
+                    au=self.au, query="doc", sort_key=sort_key, reverse=reverse, limit=10, cursor=cursor,
+                )
+                self.assertEqual(25, total)
+                if len(docs) == 0:
+                    break
+                nids.extend([d.nid for d in docs])
+                cursor = docs[-1].cursor
+            self.assertEqual([d.nid for d in all_docs], nids, msg=f"{sort_key} {reverse}")
@@ -5,6 +5,7 @@ import unittest
 from bson import ObjectId
 
 from retk import const
+from retk.models.search_engine.engine import encode_cursor
 from retk.models.search_engine.engine_local import LocalSearcher, SearchDoc
 from retk.models.tps import AuthedUser
 from tests import utils
@@ -109,6 +110,47 @@ class LocalSearchTest(unittest.IsolatedAsyncioTestCase):
         count = await self.searcher.count_all()
         self.assertEqual(20, count)
 
+    async def test_cursor_pagination(self):
+        code = await self.searcher.add_batch(au=self.au, docs=[
+            SearchDoc(
+                nid=f"nid{i:02d}",
+                title=f"title{i:02d}",
+                body=f"this is {i} doc, 这是第 {i} 个文档",
+            ) for i in range(25)
+        ])
+        self.assertEqual(const.CodeEnum.OK, code)
+
+        for sort_key, reverse in [("createdAt", True), ("createdAt", False), ("title", False), ("similarity", True)]:
+            all_docs, _ = await self.searcher.search(
+                au=self.au, query="doc", sort_key=sort_key, reverse=reverse, page=0, limit=25,
+            )
+            nids = []
+            cursor = ""
+            while True:
+                docs, total = await self.searcher.search(
+                    au=self.au, query="doc", sort_key=sort_key, reverse=reverse, limit=10, cursor=cursor,
+                )
+                self.assertEqual(25, total)
+                if len(docs) == 0:
+                    break
+                nids.extend([d.nid for d in docs])
+                cursor = docs[-1].cursor
+            self.assertEqual([d.nid for d in all_docs], nids, msg=f"{sort_key} {reverse}")
+
+        docs, total = await self.searcher.search(
+            au=self.au, query="", sort_key="createdAt", reverse=True, limit=3,
+            cursor=encode_cursor([datetime.datetime(2000, 1, 1).isoformat(), "nid00"]),
+        )
+        self.assertEqual(0, len(docs))
+        # the cursor node is gone, don't restart from the first page
+        docs, total = await self.searcher.search(
+            au=self.au, query="doc", sort_key="title", limit=3, cursor=encode_cursor(["title99", "nid99"]),
+        )
+        self.assertEqual(0, len(docs))
+        self.assertEqual(25, total)
+        with self.assertRaises(ValueError):
+            await self.searcher.search(au=self.au, query="", sort_key="createdAt", cursor="not a cursor")
+
     async def test_batch_add_update_delete(self):
         code = await self.searcher.add_batch(au=self.au, docs=[
             SearchDoc(
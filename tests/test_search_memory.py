@@ -0,0 +1,315 @@
+import dataclasses
+import datetime
+import unittest
+
+from bson import ObjectId
+
+from retk import const
+from retk.models.search_engine.engine import RestoreSearchDoc, encode_cursor
+from retk.models.search_engine.engine_memory import MemorySearcher, SearchDoc
+from retk.models.tps import AuthedUser
+
+
+class MemorySearchTest(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.searcher = MemorySearcher()
+
+    async def asyncSetUp(self) -> None:
+        await self.searcher.drop()
+        await self.searcher.init()
+        self.au = AuthedUser(
+            u=AuthedUser.User(
+                _id=ObjectId(),
+                id="uid",
+                source=0,
+                account="rethink",
+                nickname="rethink",
+                email="rethink@rethink.run",
+                avatar="",
+                hashed="",
+                disabled=False,
+                modified_at=datetime.datetime.now(),
+                used_space=0,
+                type=0,
+
+                last_state=AuthedUser.User.LastState(
+                    node_display_method=0,
+                    node_display_sort_key="",
+                    recent_search=[],
+                    recent_cursor_search_selected_nids=[],
+                ),
+                settings=AuthedUser.User.Settings(
+                    language="en",
+                    theme="light",
+                    editor_mode="markdown",
+                    editor_font_size=14,
+                    editor_code_theme="github",
+                    editor_sep_right_width=0,
+                    editor_side_current_tool_id="",
+                ),
+            ),
+            language="en",
+            request_id="request_id",
+        )
+
+    async def asyncTearDown(self) -> None:
+        await self.searcher.drop()
+
+    async def test_add(self):
+        for i in range(20):
+            code = await self.searcher.add(au=self.au, doc=SearchDoc(
+                nid=f"nid{i}",
+                title=f"title {i}",
+                body=f"this is {i} doc, 这是第 {i} 个文档",
+            ))
+            self.assertEqual(const.CodeEnum.OK, code)
+
+        docs, total = await self.searcher.search(
+            au=self.au,
+            query="title doc",
+            sort_key="createdAt",
+            reverse=True,
+            page=0,
+            limit=10,
+        )
+
+        self.assertEqual(10, len(docs))
+        self.assertEqual(20, total)
+        self.assertEqual("nid19", docs[0].nid)
+        self.assertEqual("nid10", docs[-1].nid)
+        self.assertEqual(['this is 19 <em class="match term1">doc</em>, 这是第 19 个文档'], docs[0].bodyHighlights)
+        self.assertEqual("<em class=\"match term0\">title</em> 19", docs[0].titleHighlight)
+
+        docs, total = await self.searcher.search(
+            au=self.au,
+            query="doc",
+            page=200,
+            limit=10,
+        )
+        self.assertEqual(0, len(docs))
+        self.assertEqual(20, total)
+
+        docs, total = await self.searcher.search(
+            au=self.au,
+            query="",
+            page=0,
+            limit=50,
+        )
+        self.assertEqual(20, len(docs))
+        self.assertEqual(20, total)
+
+        count = await self.searcher.count_all()
+        self.assertEqual(20, count)
+
+    async def test_cursor_pagination(self):
+        code = await self.searcher.add_batch(au=self.au, docs=[
+            SearchDoc(
+                nid=f"nid{i:02d}",
+                title=f"title{i:02d}",
+                body=f"this is {i} doc, 这是第 {i} 个文档",
+            ) for i in range(25)
+        ])
+        self.assertEqual(const.CodeEnum.OK, code)
+
+        for sort_key, reverse in [("createdAt", True), ("createdAt", False), ("title", False), ("similarity", True)]:
+            all_docs, _ = await self.searcher.search(
+                au=self.au, query="doc", sort_key=sort_key, reverse=reverse, page=0, limit=25,
+            )
+            nids = []
+            cursor = ""
+            while True:
+                docs, total = await self.searcher.search(
+                    au=self.au, query="doc", sort_key=sort_key, reverse=reverse, limit=10, cursor=cursor,
+                )
+                self.assertEqual(25, total)
+                if len(docs) == 0:
+                    break
+                nids.extend([d.nid for d in docs])
+                cursor = docs[-1].cursor
+            self.assertEqual([d.nid for d in all_docs], nids, msg=f"{sort_key} {reverse}")
+
+        docs, total = await self.searcher.search(
+            au=self.au, query="", sort_key="createdAt", reverse=True, limit=3,
+            cursor=encode_cursor([datetime.datetime(2000, 1, 1).isoformat(), "nid00"]),
+        )
+        self.assertEqual(0, len(docs))
+        with self.assertRaises(ValueError):
+            await self.searcher.search(au=self.au, query="", sort_key="createdAt", cursor="not a cursor")
+
+    async def test_batch_add_update_delete(self):
+        code = await self.searcher.add_batch(au=self.au, docs=[
+            SearchDoc(
+                nid=f"nid{i}",
+                title=f"title{i}",
+                body=f"this is {i} doc, 这是第 {i} 个文档",
+            ) for i in range(20)
+        ])
+        self.assertEqual(const.CodeEnum.OK, code)
+
+        docs, total = await self.searcher.search(
+            au=self.au,
+            query="doc",
+            sort_key="createdAt",
+            reverse=True,
+            page=0,
+            limit=10,
+        )
+        self.assertEqual(10, len(docs))
+        self.assertEqual(20, total)
+
+        code = await self.searcher.update_batch(au=self.au, docs=[
+            SearchDoc(
+                nid=f"nid{i}",
+                title=f"title_update{i}",
+                body=f"this is {i} doc, 这是第 {i} 个文档",
+            ) for i in range(20)
+        ])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(20, await self.searcher.count_all())
+
+        docs, total = await self.searcher.search(
+            au=self.au,
+            query="doc",
+            sort_key="createdAt",
+            reverse=True,
+            page=0,
+            limit=10,
+        )
+        self.assertEqual(10, len(docs))
+        self.assertEqual(20, total)
+        self.assertEqual("nid19", docs[0].nid)
+
+        code = await self.searcher.disable(au=self.au, nid="nid18")
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(20, await self.searcher.count_all())
+
+        docs, total = await self.searcher.search(
+            au=self.au,
+            query="doc",
+            sort_key="createdAt",
+            reverse=True,
+            page=0,
+            limit=10,
+        )
+        self.assertEqual(10, len(docs))
+        self.assertEqual(19, total)
+        self.assertEqual("nid17", docs[1].nid)
+        self.assertEqual(20, await self.searcher.count_all())
+
+        code = await self.searcher.enable(au=self.au, nid="nid18")
+        self.assertEqual(const.CodeEnum.OK, code)
+
+        code = await self.searcher.batch_to_trash(au=self.au, nids=[f"nid{i}" for i in range(10)])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(20, await self.searcher.count_all())
+        code = await self.searcher.delete_batch(au=self.au, nids=[f"nid{i}" for i in range(10)])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(10, await self.searcher.count_all())
+
+        docs, total = await self.searcher.search(
+            au=self.au,
+            query="doc",
+            sort_key="createdAt",
+            reverse=True,
+            page=0,
+            limit=10,
+        )
+        self.assertEqual(10, len(docs))
+        self.assertEqual(10, total)
+        self.assertEqual("nid19", docs[0].nid)
+        self.assertEqual("nid18", docs[1].nid)
+        self.assertEqual("nid17", docs[2].nid)
+
+        docs, total = await self.searcher.search(
+            au=self.au,
+            query="doc",
+            sort_key="createdAt",
+            reverse=True,
+            page=0,
+            limit=10,
+            exclude_nids=["nid19"]
+        )
+        self.assertEqual(9, len(docs))
+        self.assertEqual(9, total)
+        self.assertEqual("nid18", docs[0].nid)
+
+        docs, total = await self.searcher.search(
+            au=self.au,
+            query="doc",
+            sort_key="title",
+            reverse=False,
+            page=0,
+            limit=10,
+            exclude_nids=["nid19"]
+        )
+        self.assertEqual(9, len(docs))
+        self.assertEqual(9, total)
+        self.assertEqual("nid10", docs[0].nid)
+
+    async def test_ranking_and_recommend(self):
+        code = await self.searcher.add_batch(au=self.au, docs=[
+            SearchDoc(nid="nid0", title="python", body="a note about snakes"),
+            SearchDoc(nid="nid1", title="notes", body="python python, learn python the hard way"),
+            SearchDoc(nid="nid2", title="cooking", body="how to cook rice"),
+        ])
+        self.assertEqual(const.CodeEnum.OK, code)
+
+        docs, total = await self.searcher.search(au=self.au, query="python", limit=10)
+        self.assertEqual(2, total)
+        # the title is boosted
+        self.assertEqual(["nid0", "nid1"], [d.nid for d in docs])
+        self.assertGreater(docs[0].score, docs[1].score)
+        self.assertEqual("<em class=\"match term0\">python</em>", docs[0].titleHighlight)
+        self.assertEqual(["a note about snakes"[:60] + "..."], docs[0].bodyHighlights)
+
+        docs = await self.searcher.recommend(au=self.au, content="cook some rice", exclude_nids=["nid0"])
+        self.assertEqual(["nid2"], [d.nid for d in docs])
+
+    async def test_trash_delete_and_users(self):
+        code = await self.searcher.add_batch(au=self.au, docs=[
+            SearchDoc(nid=f"nid{i}", title=f"title{i}", body="doc") for i in range(3)
+        ])
+        self.assertEqual(const.CodeEnum.OK, code)
+        self.assertEqual(const.CodeEnum.OPERATION_FAILED, await self.searcher.delete(au=self.au, nid="nid0"))
+        self.assertEqual(const.CodeEnum.NODE_NOT_EXIST, await self.searcher.to_trash(au=self.au, nid="nid9"))
+        self.assertEqual(const.CodeEnum.OK, await self.searcher.to_trash(au=self.au, nid="nid0"))
+        _, total = await self.searcher.search(au=self.au, query="doc")
+        self.assertEqual(2, total)
+        self.assertEqual(const.CodeEnum.OK, await self.searcher.delete(au=self.au, nid="nid0"))
+        self.assertEqual(2, await self.searcher.count_all())
+
+        other = AuthedUser(
+            u=dataclasses.replace(self.au.u, id="uid2"),
+            language="en",
+            request_id="request_id",
+        )
+        _, total = await self.searcher.search(au=other, query="doc")
+        self.assertEqual(0, total)
+        self.assertEqual(const.CodeEnum.NODE_NOT_EXIST, await self.searcher.to_trash(au=other, nid="nid1"))
+
+        code = await self.searcher.update(au=self.au, doc=SearchDoc(nid="nid1", title="updated", body="new body"))
+        self.assertEqual(const.CodeEnum.OK, code)
+        _, total = await self.searcher.search(au=self.au, query="doc")
+        self.assertEqual(1, total)
+        docs, _ = await self.searcher.search(au=self.au, query="", sort_key="modifiedAt", reverse=True)
+        self.assertEqual("nid1", docs[0].nid)
+        # the same as elasticsearch, the head of the body without a query
+        self.assertEqual(["new body..."], docs[0].bodyHighlights)
+
+        restore = RestoreSearchDoc(
+            nid="nid3",
+            title="restored",
+            body="restored doc",
+            createdAt=datetime.datetime(2020, 1, 1),
+            modifiedAt=datetime.datetime(2020, 1, 1),
+            disabled=False,
+            inTrash=False,
+        )
+        code = await self.searcher.batch_restore_docs(au=self.au, docs=[restore])
+        self.assertEqual(const.CodeEnum.OK, code)
+        # the caller's doc is not changed
+        self.assertIsNone(restore.createdAt.tzinfo)
+
+        self.assertEqual(const.CodeEnum.OK, await self.searcher.force_delete_all(uid=self.au.u.id))
+        self.assertEqual(0, await self.searcher.count_all())
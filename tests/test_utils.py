@@ -1,3 +1,4 @@
+import asyncio
 import unittest
 from textwrap import dedent
 from unittest.mock import patch
@@ -23,6 +24,24 @@ class UtilsTest(unittest.TestCase):
         text = utils.md2txt(md="# 123\n## 456\n### 789\n")
         self.assertEqual("123\n456\n789", text)
 
+    def test_fast_md2txt(self):
+        for md, res in [
+            ("# 123\n## 456\n### 789\n", "123\n456\n789"),
+            ("**bold** and *it* `code` ~~del~~", "bold and it code del"),
+            ("[link](http://a.com) ![img](x.png) [@title](/n/abc)", "link  @title"),
+            ("- a\n- [x] b\n\n1. c\n> d", "a\nb\nc\nd"),
+            ("```python\nprint(1 * 2 * 3)\n```\n***", "print(1 * 2 * 3)"),
+            ("<div>html <b>x</b></div>\n\na &amp; b < c", "html x\na & b < c"),
+            ("| a | b |\n|---|---|\n| 1 | 2 |", "a   b\n1   2"),
+            ("snake_case_name \\*esc\\*", "snake_case_name *esc*"),
+        ]:
+            self.assertEqual(res, utils.fast_md2txt(md))
+
+        title, body, snippet = utils.preprocess_md("[@t](/n/x) **title**\nbody\n\n" + "a" * 300)
+        self.assertEqual("@t title", title)
+        self.assertEqual("body\n" + "a" * 300, body)
+        self.assertEqual(body[:200], snippet)
+
     def test_change_link_title(self):
         md = dedent("""\
             # 123
@@ -102,10 +121,21 @@ class UtilsTest(unittest.TestCase):
              "123456789000111222333444555666"),
             ("<a>123</a>456<b>789</b><c>000</c><d>111</d><e>222</e><f>333</f><g>444</g><h>555</h><i>666</i><j>777</j>",
              "123456789000111222333444555666777"),
-            ("d" * 1000000, "d" * 1000)
+            ("d" * 1000000, "d" * 1000),
+            ("a &amp; b &lt;c&gt;", "a & b <c>"),
+            ('<a href="x">1</a><br/>2<!-- c -->', "12"),
+            ("a < b <i>c</i>", "a < b c"),
+            ("a<b", "a"),
         ]:
             self.assertEqual(res, utils.strip_html_tags(html))
 
+    def test_strip_html_tags_batch(self):
+        htmls = ["<b>1</b>", '<a href="x">2</a>', "3 &amp; 4", "d" * 2000]
+        expected = [utils.strip_html_tags(h) for h in htmls]
+        self.assertEqual(expected, asyncio.run(utils.strip_html_tags_batch(htmls)))
+        with patch("retk.const.settings.STRIP_HTML_BATCH_CHUNK_SIZE", 3):
+            self.assertEqual(expected, asyncio.run(utils.strip_html_tags_batch(htmls)))
+
 
 class TestAsync(unittest.IsolatedAsyncioTestCase):
     @classmethod
@@ -207,6 +237,40 @@ class TestAsync(unittest.IsolatedAsyncioTestCase):
                 self.assertEqual("No title found", title, msg=f"{url} {title}")
                 self.assertEqual("No description found", desc, msg=f"{url} {desc}")
 
+    async def test_http_pool(self):
+        hosts = []
+
+        def handle(request: httpx.Request) -> httpx.Response:
+            hosts.append(request.url.host)
+            return httpx.Response(200, text="ok")
+
+        utils.http_pool.set_transport("web", httpx.MockTransport(handle))
+        try:
+            c = utils.http_pool.get("web")
+            self.assertIs(c, utils.http_pool.get("web"))
+            self.assertIsNot(c, utils.http_pool.get("llm"))
+            for _ in range(3):
+                resp = await utils.http_pool.get("web").get("https://a.test/")
+                self.assertEqual("ok", resp.text)
+            self.assertEqual(["a.test"] * 3, hosts)
+
+            # a job in another event loop has its own client
+            other = await asyncio.to_thread(lambda: asyncio.run(self.__get_and_close("web")))
+            self.assertIsNot(c, other)
+
+            await utils.http_pool.close()
+            self.assertTrue(c.is_closed)
+            self.assertIsNot(c, utils.http_pool.get("web"))
+        finally:
+            utils.http_pool.set_transport("web", None)
+            await utils.http_pool.close()
+
+    @staticmethod
+    async def __get_and_close(name):
+        c = utils.http_pool.get(name)
+        await utils.http_pool.close()
+        return c
+
     def test_mask_email(self):
         for email, res in [
             ("", ""),
@@ -1,7 +1,11 @@
+import asyncio
 import os
 import shutil
+import time
 from pathlib import Path
 
+import httpx
+
 from retk import config
 
 
@@ -45,6 +49,15 @@ def drop_env(file=".env.test.local"):
     shutil.rmtree(Path(__file__) / "analytics", ignore_errors=True)
 
 
+async def wait_until(cond, timeout: float = 5.):
+    """Poll the condition of a background task, fail the test if it is not met in time"""
+    end = time.time() + timeout
+    while not cond():
+        if time.time() > end:
+            raise TimeoutError(f"condition not met in {timeout}s")
+        await asyncio.sleep(0.01)
+
+
 def skip_no_connect(f):
     skip_no_connect.skip = False
 
@@ -54,3 +67,27 @@ def skip_no_connect(f):
         return await f(*args, **kwargs)
 
     return wrapper
+
+
+class FakeS3:
+    """A local S3-compatible stand-in of the COS bucket, as the transport of an httpx client"""
+
+    def __init__(self):
+        self.objects = {}
+        self.methods = []
+        self.transport = httpx.MockTransport(self.handle)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        key = request.url.path.lstrip("/")
+        self.methods.append(request.method)
+        if request.method == "PUT":
+            self.objects[key] = request.content
+            return httpx.Response(200)
+        if request.method == "DELETE":
+            self.objects.pop(key, None)
+            return httpx.Response(204)
+        if key not in self.objects:
+            return httpx.Response(404, text="NoSuchKey")
+        if request.method == "HEAD":
+            return httpx.Response(200)
+        return httpx.Response(200, content=self.objects[key])